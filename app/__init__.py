@@ -73,6 +73,7 @@ def create_app():
     from app.controllers.transferencias import transferencias_bp
     from app.cobros import cobros_bp
     from app.controllers.respaldos import respaldos_bp
+    from app.controllers.eventos import eventos_bp
 
     app.register_blueprint(auth_bp)
     app.register_blueprint(dashboard_bp)
@@ -89,6 +90,44 @@ def create_app():
     app.register_blueprint(transferencias_bp)
     app.register_blueprint(cobros_bp)
     app.register_blueprint(respaldos_bp)
+    app.register_blueprint(eventos_bp)
+
+    # Comandos de consola (flask reconstruir-resumen)
+    from app.resumen import reconstruir_resumen_command
+    from app.clasificacion_cobros import benchmark_cobros_command
+    from app.cronograma import generar_cronogramas_command
+    from app.esquema import verificar_esquema_command
+    from app.utils import benchmark_moneda_command
+    from app.saldos_comision import reconstruir_saldos_comision_command
+
+    app.cli.add_command(reconstruir_resumen_command)
+    app.cli.add_command(benchmark_cobros_command)
+    app.cli.add_command(generar_cronogramas_command)
+    app.cli.add_command(verificar_esquema_command)
+    app.cli.add_command(benchmark_moneda_command)
+    app.cli.add_command(reconstruir_saldos_comision_command)
+
+    # Filtro de moneda para plantillas: {{ monto|moneda }}
+    from app.utils import format_currency
+
+    app.add_template_filter(format_currency, "moneda")
+
+    # Invalidación de los cachés (dashboard, cobros, catálogo, configuración) tras cada commit
+    from app.metricas import registrar_eventos_dashboard
+    from app.clasificacion_cobros import registrar_eventos_cobros
+    from app.catalogo import registrar_eventos_catalogo
+    from app.ajustes import registrar_eventos_ajustes
+    from app.versiones import registrar_eventos_versiones
+    from app.eventos import registrar_eventos_tiempo_real
+
+    registrar_eventos_dashboard()
+    registrar_eventos_cobros()
+    registrar_eventos_catalogo()
+    registrar_eventos_ajustes()
+    # Contadores compartidos: invalidan los cachés de los demás workers
+    registrar_eventos_versiones()
+    # Después de los cachés: los avisos en tiempo real leen valores ya invalidados
+    registrar_eventos_tiempo_real()
 
     # Configurar manejador de errores global
     @app.errorhandler(Exception)
@@ -101,6 +140,14 @@ def create_app():
     # Crear todas las tablas y datos iniciales
     with app.app_context():
         db.create_all()
+
+        # Índices agregados a tablas que ya existían (create_all no los crea)
+        from app.esquema import esquema, crear_indices_faltantes
+
+        crear_indices_faltantes()
+
+        # Columnas existentes, leídas una vez para no inspeccionar en cada escritura
+        esquema.refrescar()
         try:
             from app.models import Usuario, Configuracion
 
@@ -133,6 +180,38 @@ def create_app():
                 db.session.add(config)
                 db.session.commit()
 
+            # Poblar el resumen diario la primera vez que existe la tabla
+            from app.models import ResumenDiario, Venta
+            from app.resumen import reconstruir_resumen
+
+            if not ResumenDiario.query.first() and Venta.query.first():
+                reconstruir_resumen()
+                db.session.commit()
+
+            # Saldos de comisiones por período la primera vez que existe la tabla
+            from app.models import Comision, SaldoComisionPeriodo
+            from app.saldos_comision import reconstruir_saldos_comision
+
+            if not SaldoComisionPeriodo.query.first() and Comision.query.first():
+                reconstruir_saldos_comision()
+                db.session.commit()
+
+            # Cronograma de cuotas para los créditos creados antes de la tabla
+            from app.models import CuotaVenta
+            from app.cronograma import generar_cronogramas_faltantes
+
+            if (
+                not CuotaVenta.query.first()
+                and Venta.query.filter_by(tipo="credito").first()
+            ):
+                generar_cronogramas_faltantes()
+                db.session.commit()
+
+            # Índice de búsqueda de clientes (pg_trgm o FTS5 según la base)
+            from app.busqueda_clientes import inicializar_busqueda_clientes
+
+            inicializar_busqueda_clientes()
+
         except SQLAlchemyError as e:
             db.session.rollback()
             print(f"⚠️ Error al inicializar la base de datos: {e}")
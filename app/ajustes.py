@@ -0,0 +1,135 @@
+from dataclasses import dataclass, fields
+import logging
+import threading
+import time
+
+from flask import current_app, has_app_context
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from app.models import Configuracion
+from app.versiones import incrementar_version, leer_version
+
+logger = logging.getLogger("app.ajustes")
+
+CLAVE_VERSION = "configuracion"
+CLAVE_CAMBIOS_AJUSTES = "cambios_ajustes"
+
+
+@dataclass(frozen=True)
+class Ajustes:
+    """
+    Copia inmutable de la configuración de la empresa. Los valores por defecto
+    son los del modelo Configuracion (se usan si aún no existe la fila).
+    """
+
+    id: int = None
+    nombre_empresa: str = "CreditApp"
+    direccion: str = None
+    telefono: str = None
+    logo: str = None
+    iva: int = 0
+    moneda: str = "$"
+    porcentaje_comision_vendedor: int = 5
+    porcentaje_comision_cobrador: int = 3
+    periodo_comision: str = "mensual"
+    min_password: int = 6
+
+    @classmethod
+    def desde_modelo(cls, config):
+        if config is None:
+            return cls()
+        valores = {campo.name: getattr(config, campo.name) for campo in fields(cls)}
+        valores["moneda"] = valores["moneda"] or "$"
+        valores["periodo_comision"] = valores["periodo_comision"] or "mensual"
+        return cls(**valores)
+
+    def porcentaje_comision(self, rol):
+        """Porcentaje de comisión del rol (0 si el rol no genera comisión)"""
+        if rol == "vendedor":
+            return self.porcentaje_comision_vendedor or 0
+        if rol == "cobrador":
+            return self.porcentaje_comision_cobrador or 0
+        return 0
+
+
+class CacheAjustes:
+    """
+    Ajustes cargados una vez por proceso. Cada CONFIG_VERIFICAR_CADA segundos se
+    lee el contador de versión compartido (una consulta de una fila); solo si
+    cambió, porque otro worker guardó la configuración, se recargan.
+    El worker que guarda se actualiza de inmediato tras el commit.
+    """
+
+    def __init__(self):
+        self._ajustes = None
+        self._version = None
+        self._vence = 0.0  # time.monotonic() hasta el que no se vuelve a verificar
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _intervalo():
+        if has_app_context():
+            return current_app.config.get("CONFIG_VERIFICAR_CADA", 5)
+        return 5
+
+    def obtener(self):
+        # Ruta rápida (una lectura de reloj): se usa en cada monto formateado
+        ajustes = self._ajustes
+        if ajustes is not None and time.monotonic() < self._vence:
+            return ajustes
+
+        with self._lock:
+            if self._ajustes is not None and time.monotonic() < self._vence:
+                return self._ajustes
+            try:
+                version = leer_version(CLAVE_VERSION)
+                if self._ajustes is None or version != self._version:
+                    self._ajustes = Ajustes.desde_modelo(Configuracion.query.first())
+                    self._version = version
+            except Exception as e:
+                logger.warning(f"No se pudo leer la configuración: {e}")
+                if self._ajustes is None:
+                    return Ajustes()
+            self._vence = time.monotonic() + self._intervalo()
+            return self._ajustes
+
+    def invalidar(self):
+        with self._lock:
+            self._ajustes = None
+
+
+cache_ajustes = CacheAjustes()
+
+
+def obtener_ajustes():
+    """Configuración vigente (moneda, comisiones, periodo...) sin consultar la base"""
+    return cache_ajustes.obtener()
+
+
+def _registrar_cambios_flush(session, flush_context):
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        if isinstance(obj, Configuracion):
+            # En la misma transacción que el cambio: los demás workers lo verán
+            # junto con la nueva configuración
+            incrementar_version(session.connection(), CLAVE_VERSION)
+            session.info[CLAVE_CAMBIOS_AJUSTES] = True
+            return
+
+
+def _invalidar_tras_commit(session):
+    if session.info.pop(CLAVE_CAMBIOS_AJUSTES, False):
+        cache_ajustes.invalidar()
+
+
+def _descartar_tras_rollback(session):
+    session.info.pop(CLAVE_CAMBIOS_AJUSTES, None)
+
+
+def registrar_eventos_ajustes():
+    """Conecta el contador de versión de la configuración a los eventos de sesión"""
+    if event.contains(Session, "after_flush", _registrar_cambios_flush):
+        return
+    event.listen(Session, "after_flush", _registrar_cambios_flush)
+    event.listen(Session, "after_commit", _invalidar_tras_commit)
+    event.listen(Session, "after_rollback", _descartar_tras_rollback)
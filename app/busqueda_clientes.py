@@ -0,0 +1,287 @@
+import logging
+
+from sqlalchemy import event, text
+
+from app import db
+from app.models import Cliente, Venta
+
+logger = logging.getLogger("app.busqueda")
+
+# Texto indexado: nombre, cédula y teléfono. En PostgreSQL la expresión debe ser
+# idéntica a la del índice GIN para que el planificador lo use.
+EXPRESION_BUSQUEDA = (
+    "(coalesce(clientes.nombre, '') || ' ' || coalesce(clientes.cedula, '') "
+    "|| ' ' || coalesce(clientes.telefono, ''))"
+)
+LONGITUD_MINIMA_TRIGRAMA = 3
+
+# Selectores de cliente de los formularios: qué clientes ofrece cada uno
+CONTEXTOS_SELECCION = ("venta", "abono")
+LIMITE_SUGERENCIAS = 10
+MAXIMO_SUGERENCIAS = 20
+
+# Motor activo en este proceso: 'pg_trgm', 'fts5' o 'like' (sin índice)
+_motor = "like"
+
+
+def motor_busqueda():
+    return _motor
+
+
+def _expresion_pg():
+    return db.literal_column(EXPRESION_BUSQUEDA)
+
+
+def _consulta_fts(busqueda):
+    """
+    Convierte la búsqueda en una consulta FTS5 (trigramas): cada término de 3 o
+    más caracteres como frase entre comillas, todos obligatorios.
+    Retorna None si ningún término es indexable.
+    """
+    terminos = [
+        '"' + termino.replace('"', '""') + '"'
+        for termino in busqueda.split()
+        if len(termino) >= LONGITUD_MINIMA_TRIGRAMA
+    ]
+    return " AND ".join(terminos) if terminos else None
+
+
+def _filtro_like(busqueda):
+    patron = f"%{busqueda}%"
+    return db.or_(
+        Cliente.nombre.ilike(patron),
+        Cliente.cedula.ilike(patron),
+        Cliente.telefono.ilike(patron),
+    )
+
+
+def _coincidencias_fts(consulta_fts):
+    """Subconsulta (id, rango) de clientes que coinciden en la tabla FTS5"""
+    return (
+        db.select(
+            db.literal_column("rowid").label("id"),
+            db.literal_column("rank").label("rango"),
+        )
+        .select_from(text("clientes_fts"))
+        .where(text("clientes_fts MATCH :consulta_fts"))
+        .params(consulta_fts=consulta_fts)
+        .subquery()
+    )
+
+
+def filtro_clientes(busqueda):
+    """
+    Condición SQL sobre Cliente para el texto buscado. Se usa en los listados
+    (con el join a Cliente que ya hacen) en lugar de Cliente.nombre.ilike.
+    """
+    busqueda = (busqueda or "").strip()
+    if _motor == "pg_trgm":
+        expresion = _expresion_pg()
+        # ILIKE y <% (similitud con alguna palabra del texto) usan el índice GIN de
+        # trigramas; similarity() sobre el texto completo castigaría las búsquedas cortas
+        return db.or_(
+            expresion.ilike(f"%{busqueda}%"), db.literal(busqueda).op("<%")(expresion)
+        )
+    if _motor == "fts5":
+        consulta_fts = _consulta_fts(busqueda)
+        if consulta_fts:
+            return Cliente.id.in_(db.select(_coincidencias_fts(consulta_fts).c.id))
+    return _filtro_like(busqueda)
+
+
+def consulta_por_relevancia(query, busqueda):
+    """
+    Filtra la consulta (sobre Cliente) por la búsqueda y agrega la columna
+    'relevancia', menor cuanto más relevante: distancia de palabra de pg_trgm
+    (<<->), rank bm25 de FTS5 o, sin índice, 0 para las coincidencias por prefijo.
+    Retorna (query, relevancia) para paginar por [relevancia, Cliente.id] ascendente.
+    """
+    busqueda = (busqueda or "").strip()
+    if _motor == "pg_trgm":
+        query = query.filter(filtro_clientes(busqueda))
+        # <<-> devuelve real: en double precision el cursor la devuelve exacta
+        relevancia = db.cast(db.literal(busqueda).op("<<->")(_expresion_pg()), db.Float)
+    elif _motor == "fts5" and _consulta_fts(busqueda):
+        coincidencias = _coincidencias_fts(_consulta_fts(busqueda))
+        query = query.join(coincidencias, coincidencias.c.id == Cliente.id)
+        relevancia = coincidencias.c.rango
+    else:
+        query = query.filter(_filtro_like(busqueda))
+        relevancia = db.case((Cliente.nombre.ilike(f"{busqueda}%"), 0), else_=1)
+
+    relevancia = relevancia.label("relevancia")
+    return query.add_columns(relevancia), relevancia
+
+
+def buscar_clientes(busqueda, query=None, limite=20):
+    """
+    Clientes que coinciden con la búsqueda ordenados por relevancia.
+    query permite acotar el universo (p. ej. clientes de un vendedor).
+    """
+    busqueda = (busqueda or "").strip()
+    query = query if query is not None else Cliente.query
+    if not busqueda:
+        return query.order_by(Cliente.nombre).limit(limite).all()
+
+    if _motor == "pg_trgm":
+        orden = db.func.word_similarity(busqueda, _expresion_pg()).desc()
+        query = query.filter(filtro_clientes(busqueda))
+    elif _motor == "fts5" and _consulta_fts(busqueda):
+        coincidencias = _coincidencias_fts(_consulta_fts(busqueda))
+        query = query.join(coincidencias, coincidencias.c.id == Cliente.id)
+        # rank de FTS5 (bm25) es menor cuanto más relevante
+        orden = coincidencias.c.rango.asc()
+    else:
+        # Sin índice: primero los que empiezan por el texto buscado
+        query = query.filter(_filtro_like(busqueda))
+        orden = db.case((Cliente.nombre.ilike(f"{busqueda}%"), 0), else_=1)
+
+    # Coincidencias por prefijo (nombre o cédula) antes que las parciales
+    prefijo = db.case(
+        (
+            db.or_(
+                Cliente.nombre.ilike(f"{busqueda}%"), Cliente.cedula.like(f"{busqueda}%")
+            ),
+            0,
+        ),
+        else_=1,
+    )
+    return (
+        query.order_by(prefijo, orden, Cliente.nombre, Cliente.id).limit(limite).all()
+    )
+
+
+# SELECTORES DE CLIENTE (ventas.crear y abonos.crear)
+def clientes_seleccionables(contexto, usuario):
+    """
+    Clientes que el usuario puede elegir en el formulario indicado:
+    - venta: todos los clientes
+    - abono: clientes con ventas a crédito pendientes (del vendedor, si lo es)
+    """
+    query = Cliente.query
+    if contexto == "abono":
+        creditos = db.session.query(Venta.id).filter(
+            Venta.cliente_id == Cliente.id,
+            Venta.tipo == "credito",
+            Venta.saldo_pendiente > 0,
+        )
+        if usuario.is_vendedor() and not usuario.is_admin():
+            creditos = creditos.filter(Venta.vendedor_id == usuario.id)
+        query = query.filter(creditos.exists())
+    return query
+
+
+def cliente_seleccionable(cliente_id, contexto, usuario):
+    """Valida el id enviado por el selector. Retorna el Cliente o None"""
+    try:
+        cliente_id = int(cliente_id)
+    except (TypeError, ValueError):
+        return None
+    return (
+        clientes_seleccionables(contexto, usuario)
+        .filter(Cliente.id == cliente_id)
+        .first()
+    )
+
+
+def opcion_cliente(cliente):
+    """(valor, texto) del cliente para un SelectField"""
+    return (cliente.id, f"{cliente.nombre} - {cliente.cedula}")
+
+
+# SINCRONIZACIÓN DE LA TABLA FTS5 (SQLite)
+def _borrar_fts(connection, cliente_id):
+    connection.execute(
+        text("DELETE FROM clientes_fts WHERE rowid = :id"), {"id": cliente_id}
+    )
+
+
+def _insertar_fts(connection, cliente):
+    connection.execute(
+        text(
+            "INSERT INTO clientes_fts (rowid, nombre, cedula, telefono) "
+            "VALUES (:id, :nombre, :cedula, :telefono)"
+        ),
+        {
+            "id": cliente.id,
+            "nombre": cliente.nombre or "",
+            "cedula": cliente.cedula or "",
+            "telefono": cliente.telefono or "",
+        },
+    )
+
+
+def _cliente_insertado(mapper, connection, cliente):
+    if _motor == "fts5":
+        _insertar_fts(connection, cliente)
+
+
+def _cliente_actualizado(mapper, connection, cliente):
+    if _motor == "fts5":
+        _borrar_fts(connection, cliente.id)
+        _insertar_fts(connection, cliente)
+
+
+def _cliente_eliminado(mapper, connection, cliente):
+    if _motor == "fts5":
+        _borrar_fts(connection, cliente.id)
+
+
+def _inicializar_pg_trgm():
+    with db.engine.begin() as connection:
+        connection.execute(text("CREATE EXTENSION IF NOT EXISTS pg_trgm"))
+        connection.execute(
+            text(
+                "CREATE INDEX IF NOT EXISTS ix_clientes_busqueda_trgm ON clientes "
+                f"USING gin ({EXPRESION_BUSQUEDA} gin_trgm_ops)"
+            )
+        )
+
+
+def _inicializar_fts5():
+    with db.engine.begin() as connection:
+        connection.execute(
+            text(
+                "CREATE VIRTUAL TABLE IF NOT EXISTS clientes_fts "
+                "USING fts5(nombre, cedula, telefono, tokenize='trigram')"
+            )
+        )
+        indexados = connection.execute(text("SELECT count(*) FROM clientes_fts")).scalar()
+        clientes = connection.execute(text("SELECT count(*) FROM clientes")).scalar()
+        if indexados != clientes:
+            # Reconstruir (primera vez o cambios hechos fuera de la aplicación)
+            connection.execute(text("DELETE FROM clientes_fts"))
+            connection.execute(
+                text(
+                    "INSERT INTO clientes_fts (rowid, nombre, cedula, telefono) "
+                    "SELECT id, coalesce(nombre, ''), coalesce(cedula, ''), "
+                    "coalesce(telefono, '') FROM clientes"
+                )
+            )
+
+
+def inicializar_busqueda_clientes():
+    """
+    Prepara el índice de búsqueda según la base de datos (requiere contexto de
+    aplicación): pg_trgm en PostgreSQL, FTS5 con trigramas en SQLite.
+    Si no es posible, la búsqueda sigue funcionando con ILIKE.
+    """
+    global _motor
+    dialecto = db.engine.dialect.name
+    try:
+        if dialecto == "postgresql":
+            _inicializar_pg_trgm()
+            _motor = "pg_trgm"
+        elif dialecto == "sqlite":
+            _inicializar_fts5()
+            _motor = "fts5"
+    except Exception as e:
+        logger.warning(f"Búsqueda de clientes sin índice ({dialecto}): {e}")
+        _motor = "like"
+
+    if _motor == "fts5" and not event.contains(Cliente, "after_insert", _cliente_insertado):
+        event.listen(Cliente, "after_insert", _cliente_insertado)
+        event.listen(Cliente, "after_update", _cliente_actualizado)
+        event.listen(Cliente, "after_delete", _cliente_eliminado)
+    logger.info(f"Búsqueda de clientes con motor: {_motor}")
+    return _motor
@@ -0,0 +1,87 @@
+import threading
+import time
+
+
+class CacheTTL:
+    """
+    Caché en memoria del proceso con expiración por entrada.
+    Pensada para valores pequeños y calculados (contextos de dashboard, contadores).
+    """
+
+    def __init__(self, ttl=60, max_items=1000):
+        self.ttl = ttl
+        self.max_items = max_items
+        self._datos = {}
+        self._lock = threading.RLock()
+        self._calculando = {}
+
+    def get(self, clave):
+        """Retorna el valor guardado o None si no existe o ya expiró"""
+        with self._lock:
+            entrada = self._datos.get(clave)
+            if entrada is None:
+                return None
+            expira, valor = entrada
+            if expira < time.monotonic():
+                del self._datos[clave]
+                return None
+            return valor
+
+    def set(self, clave, valor, ttl=None):
+        """Guarda un valor con el TTL indicado (o el TTL por defecto)"""
+        with self._lock:
+            if len(self._datos) >= self.max_items and clave not in self._datos:
+                self._purgar()
+            self._datos[clave] = (time.monotonic() + (ttl or self.ttl), valor)
+
+    def obtener_o_calcular(self, clave, calcular, ttl=None):
+        """
+        Retorna el valor guardado o lo calcula y lo guarda.
+        Las peticiones simultáneas por la misma clave esperan un único cálculo.
+        """
+        valor = self.get(clave)
+        if valor is not None:
+            return valor
+
+        with self._lock:
+            lock_clave = self._calculando.setdefault(clave, threading.Lock())
+
+        with lock_clave:
+            # Otra petición pudo calcularlo mientras se esperaba el lock
+            valor = self.get(clave)
+            if valor is None:
+                try:
+                    valor = calcular()
+                    self.set(clave, valor, ttl)
+                finally:
+                    # Quien calcula retira el lock (aunque falle): las claves
+                    # llevan la fecha y el diccionario no debe crecer. Los que
+                    # ya esperan en este lock leen el valor recién guardado.
+                    with self._lock:
+                        if self._calculando.get(clave) is lock_clave:
+                            del self._calculando[clave]
+        return valor
+
+    def invalidar(self, predicado):
+        """Elimina todas las entradas cuya clave cumpla el predicado"""
+        with self._lock:
+            for clave in [c for c in self._datos if predicado(c)]:
+                del self._datos[clave]
+
+    def eliminar(self, clave):
+        with self._lock:
+            self._datos.pop(clave, None)
+
+    def limpiar(self):
+        with self._lock:
+            self._datos.clear()
+
+    def _purgar(self):
+        """Elimina entradas expiradas y, si sigue lleno, las más próximas a expirar"""
+        ahora = time.monotonic()
+        for clave in [c for c, (expira, _) in self._datos.items() if expira < ahora]:
+            del self._datos[clave]
+        if len(self._datos) >= self.max_items:
+            ordenadas = sorted(self._datos.items(), key=lambda item: item[1][0])
+            for clave, _ in ordenadas[: len(ordenadas) // 4 or 1]:
+                del self._datos[clave]
@@ -0,0 +1,90 @@
+import hashlib
+import json
+import logging
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from app.cache import CacheTTL
+from app.models import Producto
+from app.versiones import leer_version, marcar_versiones
+
+logger = logging.getLogger("app.catalogo")
+
+# CATÁLOGO DE PRODUCTOS PARA EL FORMULARIO DE VENTA
+# Una sola copia serializada por proceso. La versión es el hash del contenido, así
+# que es la misma en todos los workers y sirve de ETag. Se vacía tras cada commit
+# que toca productos (ediciones y cambios de stock). Ese commit incrementa además
+# el contador compartido "catalogo", que forma parte de la clave: los demás workers
+# reconstruyen su copia en la siguiente petición en vez de seguir publicando el
+# stock anterior bajo una URL que el navegador guarda un día.
+cache_catalogo = CacheTTL(ttl=300, max_items=1)
+
+CLAVE_CATALOGO = "catalogo"
+CLAVE_CAMBIOS_CATALOGO = "cambios_catalogo"
+CLAVE_VERSION_CATALOGO = "catalogo"
+
+
+def _producto_catalogo(producto):
+    return {
+        "id": producto.id,
+        "codigo": producto.codigo,
+        "nombre": producto.nombre,
+        "unidad": producto.unidad,
+        "stock": producto.stock,
+        "stock_bajo": producto.stock_bajo(),
+        "precios": producto.obtener_info_precios(),
+    }
+
+
+def construir_catalogo():
+    """
+    Productos con stock, ordenados por nombre, con sus precios por cantidad.
+    Retorna: (version, contenido JSON en bytes)
+    """
+    productos = Producto.query.filter(Producto.stock > 0).order_by(Producto.nombre).all()
+    datos = [_producto_catalogo(producto) for producto in productos]
+    cuerpo = json.dumps(datos, sort_keys=True, separators=(",", ":"), ensure_ascii=False)
+    version = hashlib.md5(cuerpo.encode("utf-8")).hexdigest()
+    contenido = f'{{"version":"{version}","productos":{cuerpo}}}'.encode("utf-8")
+    return version, contenido
+
+
+def catalogo_productos(ttl=None):
+    """Catálogo desde el caché (un único cálculo para peticiones simultáneas)"""
+    clave = (CLAVE_CATALOGO, leer_version(CLAVE_VERSION_CATALOGO))
+    return cache_catalogo.obtener_o_calcular(clave, construir_catalogo, ttl)
+
+
+def marcar_catalogo_modificado(session):
+    """
+    Invalida el catálogo en el próximo commit.
+    Útil para UPDATE directos de stock que no pasan por la sesión.
+    """
+    session.info[CLAVE_CAMBIOS_CATALOGO] = True
+    marcar_versiones(session, CLAVE_VERSION_CATALOGO)
+
+
+def _registrar_cambios_flush(session, flush_context):
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        if isinstance(obj, Producto):
+            marcar_catalogo_modificado(session)
+            return
+
+
+def _invalidar_tras_commit(session):
+    if session.info.pop(CLAVE_CAMBIOS_CATALOGO, False):
+        cache_catalogo.limpiar()
+
+
+def _descartar_tras_rollback(session):
+    session.info.pop(CLAVE_CAMBIOS_CATALOGO, None)
+
+
+def registrar_eventos_catalogo():
+    """Conecta la invalidación del catálogo a los eventos de sesión"""
+    if event.contains(Session, "after_flush", _registrar_cambios_flush):
+        return
+    event.listen(Session, "after_flush", _registrar_cambios_flush)
+    event.listen(Session, "after_commit", _invalidar_tras_commit)
+    event.listen(Session, "after_rollback", _descartar_tras_rollback)
@@ -0,0 +1,528 @@
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+import hashlib
+import json
+import logging
+import time
+
+import click
+import numpy as np
+import pandas as pd
+from flask.cli import with_appcontext
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from app import db
+from app.cache import CacheTTL
+from app.models import Venta, Cliente, Abono, CuotaVenta
+from app.versiones import leer_version, marcar_versiones
+
+logger = logging.getLogger("app.cobros")
+
+COLUMNAS_CARTERA = [
+    "venta_id",
+    "fecha",
+    "total",
+    "saldo_pendiente",
+    "cliente_id",
+    "cliente_nombre",
+    "cliente_cedula",
+    "cliente_telefono",
+    "numero_cuota",
+    "total_cuotas",
+    "monto_cuota",
+    "fecha_vencimiento",
+    "total_abonado",
+]
+
+# Ventas sin cuota pendiente en el cronograma (sin cronograma, o con todas las
+# cuotas pagadas y saldo pendiente): regla anterior al cronograma, con cuotas
+# cada 30 días desde la venta (obtener_informacion_cuotas_segura)
+DIAS_SIN_CRONOGRAMA = 30
+
+
+def _proximas_cuotas():
+    """
+    Subconsulta con la primera cuota pendiente de cada venta.
+    Los abonos se aplican en orden, así que la primera pendiente es la de menor
+    número y vencimiento, y la última cuota (total de cuotas) sigue pendiente.
+    """
+    return (
+        db.session.query(
+            CuotaVenta.venta_id.label("venta_id"),
+            db.func.min(CuotaVenta.numero).label("numero"),
+            db.func.max(CuotaVenta.numero).label("total_cuotas"),
+            db.func.min(CuotaVenta.fecha_vencimiento).label("fecha_vencimiento"),
+        )
+        .filter(CuotaVenta.pagada.is_(False))
+        .group_by(CuotaVenta.venta_id)
+        .subquery()
+    )
+
+
+def _filtrar_cartera(query, vendedor_id=None):
+    query = query.filter(
+        Venta.tipo == "credito",
+        Venta.saldo_pendiente > 0,
+        Venta.estado == "pendiente",
+    )
+    if vendedor_id is not None:
+        query = query.filter(Venta.vendedor_id == vendedor_id)
+    return query
+
+
+def _unir_proxima_cuota(query, proxima):
+    """
+    LEFT JOIN con la próxima cuota pendiente: las ventas sin ella no se pierden,
+    quedan con las columnas de la cuota en NULL.
+    """
+    return query.outerjoin(proxima, proxima.c.venta_id == Venta.id).outerjoin(
+        CuotaVenta,
+        db.and_(
+            CuotaVenta.venta_id == proxima.c.venta_id,
+            CuotaVenta.numero == proxima.c.numero,
+        ),
+    )
+
+
+def consultar_cartera(vendedor_id=None, solo_sin_cronograma=False):
+    """
+    Obtiene en una sola consulta las ventas a crédito pendientes con su próxima
+    cuota del cronograma (NULL si no tienen cuota pendiente) y los datos del
+    cliente. total_abonado solo se calcula para las ventas sin cuota pendiente.
+    Retorna un DataFrame con COLUMNAS_CARTERA.
+    """
+    proxima = _proximas_cuotas()
+    total_abonado = (
+        db.session.query(db.func.coalesce(db.func.sum(Abono.monto), 0))
+        .filter(Abono.venta_id == Venta.id)
+        .correlate(Venta)
+        .scalar_subquery()
+    )
+    query = (
+        db.session.query(
+            Venta.id,
+            Venta.fecha,
+            Venta.total,
+            Venta.saldo_pendiente,
+            Cliente.id,
+            Cliente.nombre,
+            Cliente.cedula,
+            Cliente.telefono,
+            proxima.c.numero,
+            proxima.c.total_cuotas,
+            CuotaVenta.monto - CuotaVenta.monto_pagado,
+            proxima.c.fecha_vencimiento,
+            db.case((proxima.c.numero.is_(None), total_abonado), else_=0),
+        )
+        .join(Cliente, Venta.cliente_id == Cliente.id)
+    )
+    query = _filtrar_cartera(_unir_proxima_cuota(query, proxima), vendedor_id)
+    if solo_sin_cronograma:
+        query = query.filter(proxima.c.numero.is_(None))
+
+    return pd.DataFrame(query.order_by(Venta.id).all(), columns=COLUMNAS_CARTERA)
+
+
+def _cuota_sin_cronograma(df, fecha_hoy):
+    """
+    Próxima cuota de las ventas sin cuota pendiente en el cronograma, con la regla
+    anterior: con abonos, 2 cuotas de total // 2; sin abonos, 1 cuota del saldo.
+    Retorna solo las filas que aún tienen cuota pendiente.
+    """
+    total = df["total"].to_numpy()
+    saldo = df["saldo_pendiente"].to_numpy()
+    abonado = df["total_abonado"].fillna(0).astype("int64").to_numpy()
+
+    # Si total // 2 es 0 la regla original cae en su valor por defecto (1 cuota)
+    monto_por_cuota = total // 2
+    dos_cuotas = (abonado > 0) & (monto_por_cuota > 0)
+    total_cuotas = np.where(dos_cuotas, 2, 1)
+    numero_cuota = 1 + np.where(
+        dos_cuotas, np.minimum(abonado // np.maximum(monto_por_cuota, 1), 2), 0
+    )
+
+    fechas = pd.to_datetime(df["fecha"]).dt.normalize()
+    vencimiento = (
+        fechas + pd.to_timedelta(numero_cuota * DIAS_SIN_CRONOGRAMA, unit="D")
+    ).dt.date
+    df = df.assign(
+        numero_cuota=numero_cuota,
+        total_cuotas=total_cuotas,
+        monto_cuota=np.where(dos_cuotas, monto_por_cuota, saldo),
+        # Sin fecha de venta la regla original vence hoy
+        fecha_vencimiento=vencimiento.where(fechas.notna(), fecha_hoy),
+    )
+    return df[numero_cuota <= total_cuotas]
+
+
+def clasificar_cartera(cartera, fecha_hoy):
+    """
+    Calcula los días de diferencia contra el vencimiento de la próxima cuota y el
+    estado ('hoy', 'vencido', 'proximo') con operaciones de columna. Las ventas
+    sin cuota pendiente en el cronograma usan _cuota_sin_cronograma.
+    """
+    df = cartera.copy()
+    for columna in ("total", "saldo_pendiente"):
+        df[columna] = pd.to_numeric(df[columna]).fillna(0).astype("int64")
+
+    sin_cronograma = df["numero_cuota"].isna()
+    if sin_cronograma.any():
+        df = pd.concat(
+            [df[~sin_cronograma], _cuota_sin_cronograma(df[sin_cronograma], fecha_hoy)]
+        ).sort_values("venta_id", kind="stable")
+
+    if df.empty:
+        df["dias_diferencia"] = pd.Series(dtype="int64")
+        df["estado"] = pd.Series(dtype="object")
+        return df
+
+    for columna in ("numero_cuota", "total_cuotas", "monto_cuota"):
+        df[columna] = pd.to_numeric(df[columna]).fillna(0).astype("int64")
+
+    vencimiento = pd.to_datetime(df["fecha_vencimiento"]).to_numpy().astype("datetime64[D]")
+    hoy = np.datetime64(fecha_hoy, "D")
+    dias_diferencia = (hoy - vencimiento).astype("int64")
+
+    df["fecha_vencimiento"] = pd.to_datetime(df["fecha_vencimiento"]).dt.date
+    df["dias_diferencia"] = dias_diferencia
+    df["estado"] = np.select(
+        [dias_diferencia == 0, dias_diferencia > 0], ["hoy", "vencido"], "proximo"
+    )
+    return df
+
+
+def construir_cobros(clasificados):
+    """Convierte el DataFrame clasificado en las listas (para_hoy, vencidos, proximos)"""
+    grupos = {"hoy": [], "vencido": [], "proximo": []}
+    columnas = [
+        clasificados[columna].tolist()
+        for columna in (
+            "estado",
+            "venta_id",
+            "fecha",
+            "total",
+            "saldo_pendiente",
+            "cliente_id",
+            "cliente_nombre",
+            "cliente_cedula",
+            "cliente_telefono",
+            "numero_cuota",
+            "total_cuotas",
+            "monto_cuota",
+            "fecha_vencimiento",
+            "dias_diferencia",
+        )
+    ]
+    for (
+        estado,
+        venta_id,
+        fecha,
+        total,
+        saldo,
+        cliente_id,
+        nombre,
+        cedula,
+        telefono,
+        numero_cuota,
+        total_cuotas,
+        monto_cuota,
+        fecha_vencimiento,
+        dias_diferencia,
+    ) in zip(*columnas):
+        grupos[estado].append(
+            {
+                "venta": SimpleNamespace(
+                    id=venta_id, fecha=fecha, total=total, saldo_pendiente=saldo
+                ),
+                "cliente": SimpleNamespace(
+                    id=cliente_id, nombre=nombre, cedula=cedula, telefono=telefono
+                ),
+                "numero_cuota": numero_cuota,
+                "total_cuotas": total_cuotas,
+                "monto_cuota": monto_cuota,
+                "fecha_vencimiento": fecha_vencimiento,
+                "dias_diferencia": dias_diferencia,
+            }
+        )
+    return grupos["hoy"], grupos["vencido"], grupos["proximo"]
+
+
+def estadisticas_cobros(vendedor_id=None, fecha_hoy=None):
+    """
+    Estadísticas de cobros (para el badge de navegación) agrupadas en SQL por
+    el vencimiento de la próxima cuota, sin construir los objetos de cobro.
+    Las ventas sin cuota pendiente en el cronograma (normalmente ninguna) se
+    cargan aparte y se clasifican con la regla anterior.
+    """
+    fecha_hoy = fecha_hoy or datetime.now().date()
+    proxima = _proximas_cuotas()
+    estado = db.case(
+        (proxima.c.numero.is_(None), "sin_cronograma"),
+        (proxima.c.fecha_vencimiento == fecha_hoy, "hoy"),
+        (proxima.c.fecha_vencimiento < fecha_hoy, "vencido"),
+        else_="proximo",
+    )
+    query = db.session.query(
+        estado,
+        db.func.count(Venta.id),
+        db.func.coalesce(db.func.sum(CuotaVenta.monto - CuotaVenta.monto_pagado), 0),
+    )
+    query = _filtrar_cartera(_unir_proxima_cuota(query, proxima), vendedor_id)
+    agrupado = {
+        fila[0]: [int(fila[1] or 0), int(fila[2] or 0)]
+        for fila in query.group_by(estado).all()
+    }
+
+    if agrupado.pop("sin_cronograma", None):
+        clasificados = clasificar_cartera(
+            consultar_cartera(vendedor_id, solo_sin_cronograma=True), fecha_hoy
+        )
+        for clave, grupo in clasificados.groupby("estado"):
+            cantidad, monto = agrupado.setdefault(clave, [0, 0])
+            agrupado[clave] = [cantidad + len(grupo), monto + int(grupo["monto_cuota"].sum())]
+
+    estadisticas = {}
+    for clave, prefijo in (("hoy", "para_hoy"), ("vencido", "vencidos"), ("proximo", "proximos")):
+        cantidad, monto = agrupado.get(clave, (0, 0))
+        estadisticas[prefijo] = cantidad
+        estadisticas[f"monto_{prefijo}"] = monto
+    return estadisticas
+
+
+def clasificar_cobros_lote(vendedor_id=None, fecha_hoy=None):
+    """Clasifica toda la cartera pendiente con una consulta y cálculo vectorizado"""
+    fecha_hoy = fecha_hoy or datetime.now().date()
+    cartera = consultar_cartera(vendedor_id)
+    return construir_cobros(clasificar_cartera(cartera, fecha_hoy))
+
+
+# CACHÉ DE ESTADÍSTICAS
+# Claves: (alcance, vendedor_id, fecha, versión). El alcance es "todos" para
+# administradores y cobradores, o "vendedor" para un vendedor. Se vacía tras cada
+# commit que toca ventas, abonos o cuotas; ese commit también incrementa el
+# contador compartido "cobros", así los demás workers dejan de usar sus entradas
+# y todos responden el mismo ETag.
+cache_estadisticas = CacheTTL(ttl=30)
+
+CLAVE_CAMBIOS_COBROS = "cambios_cobros"
+CLAVE_VERSION_COBROS = "cobros"
+
+
+def estadisticas_cobros_cacheadas(vendedor_id=None, ttl=None):
+    """
+    Estadísticas de cobros desde el caché; las peticiones simultáneas del mismo
+    alcance comparten un único cálculo.
+    Retorna: (estadisticas, etag)
+    """
+    fecha_hoy = datetime.now().date()
+    alcance = "vendedor" if vendedor_id is not None else "todos"
+    version = leer_version(CLAVE_VERSION_COBROS)
+
+    def calcular():
+        estadisticas = estadisticas_cobros(vendedor_id, fecha_hoy)
+        etag = hashlib.md5(
+            json.dumps(estadisticas, sort_keys=True).encode("utf-8")
+        ).hexdigest()
+        return estadisticas, etag
+
+    return cache_estadisticas.obtener_o_calcular(
+        (alcance, vendedor_id, fecha_hoy, version), calcular, ttl
+    )
+
+
+def _registrar_cambios_flush(session, flush_context):
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        if isinstance(obj, (Venta, Abono, CuotaVenta)):
+            session.info[CLAVE_CAMBIOS_COBROS] = True
+            marcar_versiones(session, CLAVE_VERSION_COBROS)
+            return
+
+
+def _invalidar_tras_commit(session):
+    if session.info.pop(CLAVE_CAMBIOS_COBROS, False):
+        cache_estadisticas.limpiar()
+
+
+def _descartar_tras_rollback(session):
+    session.info.pop(CLAVE_CAMBIOS_COBROS, None)
+
+
+def registrar_eventos_cobros():
+    """Conecta la invalidación del caché de estadísticas a los eventos de sesión"""
+    if event.contains(Session, "after_flush", _registrar_cambios_flush):
+        return
+    event.listen(Session, "after_flush", _registrar_cambios_flush)
+    event.listen(Session, "after_commit", _invalidar_tras_commit)
+    event.listen(Session, "after_rollback", _descartar_tras_rollback)
+
+
+# BENCHMARK
+def _medir(funcion, repeticiones):
+    """Ejecuta la función varias veces. Retorna (resultado, milisegundos promedio)"""
+    inicio = time.perf_counter()
+    for _ in range(repeticiones):
+        resultado = funcion()
+    return resultado, (time.perf_counter() - inicio) * 1000 / repeticiones
+
+
+def _cartera_sintetica(cantidad, fecha_hoy, semilla=42):
+    """
+    Genera en memoria ventas a crédito con cronograma (objetos con la interfaz
+    de Venta que usa el ciclo por venta) y su cartera con la forma de
+    consultar_cartera. Retorna (ventas, cartera).
+    """
+    from app.cronograma import FRECUENCIAS_PAGO, calcular_cuotas, distribuir_pagos
+
+    rng = np.random.default_rng(semilla)
+    frecuencias = list(FRECUENCIAS_PAGO)
+    totales = rng.integers(50_000, 2_000_000, cantidad)
+    dias_atras = rng.integers(0, 120, cantidad)
+    numeros_cuotas = rng.integers(1, 13, cantidad)
+    indices_frecuencia = rng.integers(0, len(frecuencias), cantidad)
+    pagados = np.where(
+        rng.random(cantidad) < 0.6, (totales * rng.random(cantidad) * 0.9).astype("int64"), 0
+    )
+
+    ventas = []
+    filas = []
+    for i in range(cantidad):
+        total, pagado = int(totales[i]), int(pagados[i])
+        fecha = datetime.combine(
+            fecha_hoy - timedelta(days=int(dias_atras[i])), datetime.min.time()
+        )
+        plan = calcular_cuotas(
+            total, fecha, int(numeros_cuotas[i]), frecuencias[indices_frecuencia[i]]
+        )
+        cuotas = [
+            SimpleNamespace(
+                numero=numero,
+                fecha_vencimiento=fecha_vencimiento,
+                monto=monto,
+                monto_pagado=monto_pagado,
+                pagada=monto_pagado >= monto,
+                saldo=max(monto - monto_pagado, 0),
+            )
+            for (numero, fecha_vencimiento, monto), monto_pagado in zip(
+                plan, distribuir_pagos([monto for _, _, monto in plan], pagado)
+            )
+        ]
+        cliente = SimpleNamespace(
+            id=i + 1,
+            nombre=f"Cliente {i}",
+            cedula=str(10_000_000 + i),
+            telefono="3000000000",
+        )
+        ventas.append(
+            SimpleNamespace(
+                id=i + 1,
+                tipo="credito",
+                fecha=fecha,
+                total=total,
+                saldo_pendiente=total - pagado,
+                cuotas=cuotas,
+                abonos=[],
+                cliente=cliente,
+            )
+        )
+
+        proxima = next(c for c in cuotas if not c.pagada)
+        filas.append(
+            (
+                i + 1,
+                fecha,
+                total,
+                total - pagado,
+                cliente.id,
+                cliente.nombre,
+                cliente.cedula,
+                cliente.telefono,
+                proxima.numero,
+                len(cuotas),
+                proxima.saldo,
+                proxima.fecha_vencimiento,
+                0,
+            )
+        )
+    return ventas, pd.DataFrame(filas, columns=COLUMNAS_CARTERA)
+
+
+def _benchmark_real(repeticiones, fecha_hoy):
+    """Ciclo por venta contra la consulta sobre el cronograma, con la cartera real"""
+    from app.cobros import clasificar_ventas_iterativo
+
+    def ciclo():
+        db.session.expire_all()
+        ventas = _filtrar_cartera(Venta.query).all()
+        return clasificar_ventas_iterativo(ventas, fecha_hoy)
+
+    iterativo, tiempo_iterativo = _medir(ciclo, repeticiones)
+    lote, tiempo_lote = _medir(lambda: clasificar_cobros_lote(None, fecha_hoy), repeticiones)
+    estadisticas, tiempo_estadisticas = _medir(
+        lambda: estadisticas_cobros(None, fecha_hoy), repeticiones
+    )
+
+    conteos = [len(x) for x in iterativo]
+    iguales = conteos == [len(x) for x in lote] == [
+        estadisticas["para_hoy"],
+        estadisticas["vencidos"],
+        estadisticas["proximos"],
+    ]
+    click.echo(
+        f"cartera real {sum(conteos):>7} créditos | ciclo: {tiempo_iterativo:9.1f} ms | "
+        f"cronograma con listas: {tiempo_lote:8.1f} ms | "
+        f"estadísticas: {tiempo_estadisticas:8.1f} ms | "
+        f"resultados iguales: {'sí' if iguales else 'NO'}"
+    )
+
+
+def _benchmark_sintetico(cantidad, repeticiones, fecha_hoy):
+    """
+    Ciclo por venta contra la clasificación vectorizada sobre una cartera
+    generada en memoria. No incluye el tiempo de las consultas.
+    """
+    from app.cobros import clasificar_ventas_iterativo
+
+    ventas, cartera = _cartera_sintetica(cantidad, fecha_hoy)
+
+    iterativo, tiempo_iterativo = _medir(
+        lambda: clasificar_ventas_iterativo(ventas, fecha_hoy), repeticiones
+    )
+    clasificados, tiempo_clasificacion = _medir(
+        lambda: clasificar_cartera(cartera, fecha_hoy), repeticiones
+    )
+    vectorizado, tiempo_vectorizado = _medir(
+        lambda: construir_cobros(clasificar_cartera(cartera, fecha_hoy)), repeticiones
+    )
+
+    iguales = [len(x) for x in iterativo] == [len(x) for x in vectorizado]
+    click.echo(
+        f"sintética    {cantidad:>7} créditos | ciclo: {tiempo_iterativo:9.1f} ms | "
+        f"clasificación: {tiempo_clasificacion:8.1f} ms | "
+        f"con listas: {tiempo_vectorizado:9.1f} ms | "
+        f"resultados iguales: {'sí' if iguales else 'NO'}"
+    )
+
+
+@click.command("benchmark-cobros")
+@click.option("--repeticiones", default=5, help="Veces que se ejecuta cada variante")
+@click.option(
+    "--tamanos",
+    default="1000,10000,100000",
+    help="Tamaños de las carteras sintéticas separados por coma (vacío para omitirlas)",
+)
+@click.option("--sin-cartera-real", is_flag=True, help="Omite la medición sobre la cartera real")
+@with_appcontext
+def benchmark_cobros_command(repeticiones, tamanos, sin_cartera_real):
+    """
+    Compara el ciclo por venta con la clasificación sobre el cronograma: con la
+    cartera real (incluye las consultas) y con carteras sintéticas generadas
+    en memoria de los tamaños indicados.
+    """
+    fecha_hoy = datetime.now().date()
+    repeticiones = max(repeticiones, 1)
+
+    if not sin_cartera_real:
+        _benchmark_real(repeticiones, fecha_hoy)
+    for cantidad in [int(t) for t in tamanos.split(",") if t.strip()]:
+        _benchmark_sintetico(cantidad, repeticiones, fecha_hoy)
@@ -4,12 +4,15 @@ from flask import (
     redirect,
     url_for,
     flash,
+    request,
     current_app,
     jsonify,
 )
 from flask_login import login_required, current_user
 from app.models import Venta, Cliente, Abono
 from app.decorators import vendedor_cobrador_required
+from app.clasificacion_cobros import clasificar_cobros_lote, estadisticas_cobros_cacheadas
+from app.cronograma import FRECUENCIAS_PAGO, frecuencia_de
 from datetime import datetime, timedelta
 import logging
 import re
@@ -32,6 +35,19 @@ def obtener_informacion_cuotas_segura(venta):
             "dias_entre_cuotas": 30,  # 30 días por defecto
         }
 
+        # Ventas con cronograma persistido y cuota pendiente: leer las cuotas
+        # guardadas. Sin cronograma (o con todas las cuotas pagadas y saldo
+        # pendiente) se usa la regla anterior, con los datos de la venta.
+        pendiente = next((c for c in venta.cuotas if not c.pagada), None)
+        if pendiente is not None:
+            cuotas = venta.cuotas
+            info["total_cuotas"] = len(cuotas)
+            info["cuotas_pagadas"] = sum(1 for c in cuotas if c.pagada)
+            info["monto_cuota"] = pendiente.saldo
+            info["dias_entre_cuotas"] = FRECUENCIAS_PAGO[frecuencia_de(venta)]
+            info["cronograma"] = True
+            return info
+
         if (
             venta.tipo == "credito"
             and venta.saldo_pendiente
@@ -72,7 +88,9 @@ def obtener_informacion_cuotas_segura(venta):
 def calcular_fecha_vencimiento_cuota(venta, numero_cuota, info_cuotas):
     """Calcula la fecha de vencimiento de una cuota específica"""
     try:
-        dias_transcurridos = (datetime.now().date() - venta.fecha.date()).days
+        if info_cuotas.get("cronograma") and 1 <= numero_cuota <= len(venta.cuotas):
+            return venta.cuotas[numero_cuota - 1].fecha_vencimiento
+
         dias_para_cuota = numero_cuota * info_cuotas["dias_entre_cuotas"]
         fecha_vencimiento = venta.fecha.date() + timedelta(days=dias_para_cuota)
         return fecha_vencimiento
@@ -151,140 +169,72 @@ def formatear_numero_whatsapp(telefono_original):
         return None, False, f"Error procesando número: {str(e)}"
 
 
-def clasificar_cobros():
+def clasificar_ventas_iterativo(ventas, fecha_hoy):
     """
-    Función principal para clasificar cobros por estado
+    Clasificación original, venta por venta (usa venta.cuotas y venta.cliente).
+    Se conserva como referencia para comparar con clasificar_cobros_lote.
     Retorna: (para_hoy, vencidos, proximos)
     """
-    try:
-        logger.info(
-            f"Iniciando clasificación de cobros para usuario: {current_user.id} - {current_user.nombre} - Rol: {current_user.rol}"
-        )
+    para_hoy = []
+    vencidos = []
+    proximos = []
 
-        # Base query para ventas a crédito con saldo pendiente
-        query = Venta.query.filter(
-            Venta.tipo == "credito",
-            Venta.saldo_pendiente > 0,
-            Venta.estado == "pendiente",
-        )
+    for venta in ventas:
+        try:
+            info_cuotas = obtener_informacion_cuotas_segura(venta)
 
-        # Filtrar por permisos de usuario
-        if current_user.is_vendedor() and not current_user.is_admin():
-            query = query.filter(Venta.vendedor_id == current_user.id)
-            logger.info(f"Usuario es vendedor, filtrando solo sus ventas")
-        else:
-            logger.info(f"Usuario es cobrador/admin, viendo todas las ventas")
+            # Calcular cuota actual
+            cuota_actual = info_cuotas["cuotas_pagadas"] + 1
+            if cuota_actual > info_cuotas["total_cuotas"]:
+                continue  # Venta completamente pagada
 
-        ventas = query.all()
-        logger.info(f"Ventas a crédito encontradas: {len(ventas)}")
-
-        para_hoy = []
-        vencidos = []
-        proximos = []
-
-        fecha_hoy = datetime.now().date()
-        logger.info(f"Fecha de hoy para comparaciones: {fecha_hoy}")
-
-        ventas_procesadas = 0
-        ventas_con_error = 0
-
-        for i, venta in enumerate(ventas, 1):
-            try:
-                logger.debug(f"Procesando venta {i}/{len(ventas)}: ID {venta.id}")
-
-                info_cuotas = obtener_informacion_cuotas_segura(venta)
-
-                # Calcular cuota actual
-                cuota_actual = info_cuotas["cuotas_pagadas"] + 1
-                if cuota_actual > info_cuotas["total_cuotas"]:
-                    continue  # Venta completamente pagada
-
-                # Calcular días transcurridos y cuotas esperadas
-                dias_transcurridos = (fecha_hoy - venta.fecha.date()).days
-                cuotas_esperadas = min(
-                    max(
-                        1, (dias_transcurridos // info_cuotas["dias_entre_cuotas"]) + 1
-                    ),
-                    info_cuotas["total_cuotas"],
-                )
-
-                logger.debug(
-                    f"Venta {venta.id}: Días transcurridos: {dias_transcurridos}, Cuotas esperadas: {cuotas_esperadas}, Cuotas pagadas: {info_cuotas['cuotas_pagadas']}, Cuota actual: {cuota_actual}, Monto cuota: {info_cuotas['monto_cuota']}"
-                )
+            fecha_vencimiento = calcular_fecha_vencimiento_cuota(
+                venta, cuota_actual, info_cuotas
+            )
+            diferencia_dias = (fecha_hoy - fecha_vencimiento).days
+
+            cobro = {
+                "venta": venta,
+                "cliente": venta.cliente,
+                "numero_cuota": cuota_actual,
+                "total_cuotas": info_cuotas["total_cuotas"],
+                "monto_cuota": info_cuotas["monto_cuota"],
+                "fecha_vencimiento": fecha_vencimiento,
+                "dias_diferencia": diferencia_dias,
+            }
 
-                # Usar función corregida para calcular fecha de vencimiento
-                logger.info(
-                    f"*** FUNCIÓN CORREGIDA EJECUTÁNDOSE *** - Venta {venta.id}, Cuota {cuota_actual}, Días transcurridos: {dias_transcurridos}"
-                )
-                fecha_vencimiento = calcular_fecha_vencimiento_cuota(
-                    venta, cuota_actual, info_cuotas
-                )
+            if diferencia_dias == 0:
+                para_hoy.append(cobro)
+            elif diferencia_dias > 0:
+                vencidos.append(cobro)
+            else:
+                proximos.append(cobro)
 
-                # Calcular diferencia de días
-                diferencia_dias = (fecha_hoy - fecha_vencimiento).days
-                logger.info(
-                    f"Venta {venta.id}: Fecha calculada: {fecha_vencimiento}, Diferencia con hoy: {diferencia_dias} días"
-                )
-                logger.debug(
-                    f"Venta {venta.id}: Fecha venc={fecha_vencimiento}, Hoy={fecha_hoy}, Días diff={diferencia_dias}, Días hasta venc={-diferencia_dias}"
-                )
+        except Exception as e:
+            logger.error(f"Error procesando venta {venta.id}: {e}")
+            continue
 
-                # Crear objeto de cobro
-                cobro = {
-                    "venta": venta,
-                    "cliente": venta.cliente,
-                    "numero_cuota": cuota_actual,
-                    "total_cuotas": info_cuotas["total_cuotas"],
-                    "monto_cuota": info_cuotas["monto_cuota"],
-                    "fecha_vencimiento": fecha_vencimiento,
-                    "dias_diferencia": diferencia_dias,
-                }
+    return para_hoy, vencidos, proximos
 
-                # Clasificar por estado
-                if diferencia_dias == 0:
-                    para_hoy.append(cobro)
-                    logger.info(
-                        f"Venta {venta.id} clasificada como 'PARA HOY' - Cliente: {venta.cliente.nombre}, Monto: ${info_cuotas['monto_cuota']:,}"
-                    )
-                elif diferencia_dias > 0:
-                    vencidos.append(cobro)
-                    logger.info(
-                        f"Venta {venta.id} clasificada como 'VENCIDA' ({diferencia_dias} días) - Cliente: {venta.cliente.nombre}, Monto: ${info_cuotas['monto_cuota']:,}"
-                    )
-                else:
-                    proximos.append(cobro)
-                    logger.info(
-                        f"Venta {venta.id} clasificada como 'PRÓXIMA' (vence en {abs(diferencia_dias)} días) - Cliente: {venta.cliente.nombre}, Monto: ${info_cuotas['monto_cuota']:,}"
-                    )
 
-                ventas_procesadas += 1
+def clasificar_cobros():
+    """
+    Función principal para clasificar cobros por estado
+    Retorna: (para_hoy, vencidos, proximos)
+    """
+    try:
+        # Filtrar por permisos de usuario
+        vendedor_id = None
+        if current_user.is_vendedor() and not current_user.is_admin():
+            vendedor_id = current_user.id
 
-            except Exception as e:
-                ventas_con_error += 1
-                logger.error(f"Error procesando venta {venta.id}: {e}")
-                continue
+        # Una consulta sobre la próxima cuota pendiente del cronograma de cada venta
+        para_hoy, vencidos, proximos = clasificar_cobros_lote(vendedor_id)
 
-        logger.info(
-            f"Clasificación completada - Procesadas exitosamente: {ventas_procesadas}, Con errores: {ventas_con_error}"
-        )
-        logger.info(
-            f"RESULTADO FINAL - Para hoy: {len(para_hoy)}, Vencidos: {len(vencidos)}, Próximos: {len(proximos)}"
+        logger.debug(
+            f"Clasificación de cobros usuario {current_user.id} - Para hoy: {len(para_hoy)}, Vencidos: {len(vencidos)}, Próximos: {len(proximos)}"
         )
 
-        # Log detallado de cada categoría
-        if para_hoy:
-            logger.info(
-                f"PARA HOY - Ejemplo: Venta {para_hoy[0]['venta'].id}, Cliente: {para_hoy[0]['cliente'].nombre}"
-            )
-        if vencidos:
-            logger.info(
-                f"VENCIDOS - Ejemplo: Venta {vencidos[0]['venta'].id}, Cliente: {vencidos[0]['cliente'].nombre}, {vencidos[0]['dias_diferencia']} días atrasado"
-            )
-        if proximos:
-            logger.info(
-                f"PRÓXIMOS - Ejemplo: Venta {proximos[0]['venta'].id}, Cliente: {proximos[0]['cliente'].nombre}"
-            )
-
         return para_hoy, vencidos, proximos
 
     except Exception as e:
@@ -346,19 +296,20 @@ def gestion():
 def api_estadisticas():
     """API endpoint para obtener estadísticas de cobros (para AJAX)"""
     try:
-        para_hoy, vencidos, proximos = clasificar_cobros()
+        vendedor_id = None
+        if current_user.is_vendedor() and not current_user.is_admin():
+            vendedor_id = current_user.id
 
-        estadisticas = {
-            "para_hoy": len(para_hoy),
-            "vencidos": len(vencidos),
-            "proximos": len(proximos),
-            "monto_para_hoy": sum(int(c["monto_cuota"]) for c in para_hoy),
-            "monto_vencidos": sum(int(c["monto_cuota"]) for c in vencidos),
-            "monto_proximos": sum(int(c["monto_cuota"]) for c in proximos),
-        }
+        # Caché por alcance (todos / vendedor) con ETag para responder 304
+        estadisticas, etag = estadisticas_cobros_cacheadas(
+            vendedor_id, ttl=current_app.config.get("COBROS_CACHE_TTL")
+        )
 
-        logger.debug(f"API estadísticas devuelve: {estadisticas}")
-        return jsonify(estadisticas)
+        response = jsonify(estadisticas)
+        response.set_etag(etag)
+        response.cache_control.private = True
+        response.cache_control.no_cache = True
+        return response.make_conditional(request)
 
     except Exception as e:
         logger.error(f"Error en API estadísticas: {e}")
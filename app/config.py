@@ -33,6 +33,20 @@ class Config:
     UPLOAD_FOLDER = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'static/uploads')
     MAX_CONTENT_LENGTH = 16 * 1024 * 1024  # 16 MB
 
+    # Listados paginados por cursor
+    PAGINA_TAMANO = int(os.getenv("PAGINA_TAMANO", "50"))
+
+    # Caché
+    DASHBOARD_CACHE_TTL = int(os.getenv("DASHBOARD_CACHE_TTL", "60"))  # segundos
+    COBROS_CACHE_TTL = int(os.getenv("COBROS_CACHE_TTL", "30"))  # segundos
+    CATALOGO_CACHE_TTL = int(os.getenv("CATALOGO_CACHE_TTL", "300"))  # segundos
+    # Cada cuánto un worker comprueba si otro cambió la configuración de la empresa
+    CONFIG_VERIFICAR_CADA = int(os.getenv("CONFIG_VERIFICAR_CADA", "5"))  # segundos
+
+    # Contadores en tiempo real (Server-Sent Events)
+    SSE_HEARTBEAT = int(os.getenv("SSE_HEARTBEAT", "30"))  # segundos
+    SSE_DURACION_MAXIMA = int(os.getenv("SSE_DURACION_MAXIMA", "600"))  # segundos
+
 # Configuración de logging
 logging.basicConfig(
     level=logging.INFO,
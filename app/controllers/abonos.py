@@ -6,6 +6,12 @@ from app.models import Abono, Cliente, Credito, CreditoVenta, Venta, Caja, Movim
 from app.forms import AbonoForm, AbonoEditForm
 from app.decorators import cobrador_required, vendedor_cobrador_required, admin_required
 from app.utils import registrar_movimiento_caja, calcular_comision
+from app.saldos_comision import registrar_comision
+from app.resumen import resumir_abono
+from app.cronograma import aplicar_pagos
+from app.saldos_caja import registrar_movimiento, revertir_movimiento
+from app.paginacion import paginar_keyset, totales_listado
+from app.busqueda_clientes import filtro_clientes, cliente_seleccionable, opcion_cliente
 from app.pdf.abono import generar_pdf_abono
 from datetime import datetime
 import logging
@@ -32,7 +38,7 @@ def index():
     
     if busqueda:
         # Buscar por nombre de cliente asociado a la venta del abono
-        query = query.join(Abono.venta).join(Venta.cliente).filter(Cliente.nombre.ilike(f"%{busqueda}%"))
+        query = query.join(Abono.venta).join(Venta.cliente).filter(filtro_clientes(busqueda))
     
     if desde_str:
         try:
@@ -49,15 +55,17 @@ def index():
         except ValueError:
             flash('Fecha "hasta" inválida.', 'warning')
 
-    # Ordenar por fecha descendente
-    abonos = query.order_by(Abono.fecha.desc()).all()
+    # Totales sobre todo el filtro (una consulta agregada)
+    totales = totales_listado(query, cantidad=db.func.count(Abono.id), monto=db.func.sum(Abono.monto))
     
-    # Calcular total de abonos
-    total_abonos = sum(a.monto for a in abonos) if abonos else 0
+    # Solo se cargan los abonos de la página actual, del más reciente al más antiguo
+    pagina = paginar_keyset(query, [Abono.fecha, Abono.id])
     
     return render_template('abonos/index.html', 
-                          abonos=abonos, 
-                          total_abonos=total_abonos,
+                          abonos=pagina.items, 
+                          pagina=pagina,
+                          cantidad_abonos=totales['cantidad'],
+                          total_abonos=totales['monto'],
                           busqueda=busqueda,
                           desde=desde_str,
                           hasta=hasta_str)
@@ -76,26 +84,16 @@ def crear():
     cliente_id = request.args.get('cliente_id', type=int)
     venta_id = request.args.get('venta_id', type=int)
     
-    # Modificar la consulta para vendedores - solo mostrar sus clientes
-    if current_user.is_vendedor() and not current_user.is_admin():
-        clientes_query = db.session.query(Cliente).join(Venta).filter(
-            Venta.tipo == 'credito',
-            Venta.saldo_pendiente > 0,
-            Venta.vendedor_id == current_user.id
-        ).distinct().order_by(Cliente.nombre)
-    else:
-        clientes_query = db.session.query(Cliente).join(Venta).filter(
-            Venta.tipo == 'credito',
-            Venta.saldo_pendiente > 0
-        ).distinct().order_by(Cliente.nombre)
-    
-    clientes = clientes_query.all()
+    # El selector de cliente solo lleva el cliente elegido; los demás se buscan en
+    # /clientes/buscar (clientes con créditos pendientes, del vendedor si aplica)
+    form.cliente_id.choices = [(-1, "Busque un cliente con créditos pendientes")]
 
-    # Configurar opciones para el select de clientes
-    if clientes:
-        form.cliente_id.choices = [(c.id, f"{c.nombre} - {c.cedula}") for c in clientes]
-    else:
-        form.cliente_id.choices = [(-1, "No hay clientes con créditos pendientes")]
+    def preseleccionar_cliente(id_cliente):
+        cliente = cliente_seleccionable(id_cliente, 'abono', current_user)
+        if cliente:
+            form.cliente_id.choices = [opcion_cliente(cliente)]
+            form.cliente_id.data = cliente.id
+        return cliente
     
     # Inicialmente, configurar opciones para ventas (esto se actualizará dinámicamente)
     form.venta_id.choices = [(-1, "Seleccione un cliente primero")]
@@ -107,33 +105,30 @@ def crear():
     if cliente_id:
         current_app.logger.info(f"Preseleccionando cliente_id={cliente_id}")
         
-        cliente = Cliente.query.get(cliente_id)
-        if cliente:
-            if any(c[0] == cliente_id for c in form.cliente_id.choices):
-                form.cliente_id.data = cliente_id
-                client_selected = True
-                
-                # Cargar las ventas de este cliente (filtrar por vendedor si es necesario)
-                ventas_query = Venta.query.filter(
-                    Venta.cliente_id == cliente_id,
-                    Venta.tipo == 'credito', 
-                    Venta.saldo_pendiente > 0
-                )
-                
-                if current_user.is_vendedor() and not current_user.is_admin():
-                    ventas_query = ventas_query.filter(Venta.vendedor_id == current_user.id)
-                
-                ventas_pendientes = ventas_query.all()
-                
-                if ventas_pendientes:
-                    form.venta_id.choices = [
-                        (v.id, f"Venta #{v.id} - {v.fecha.strftime('%d/%m/%Y')} - Saldo: ${v.saldo_pendiente:,.0f}")
-                        for v in ventas_pendientes
-                    ]
-                else:
-                    form.venta_id.choices = [(-1, "Este cliente no tiene ventas pendientes")]
+        if preseleccionar_cliente(cliente_id):
+            client_selected = True
+            
+            # Cargar las ventas de este cliente (filtrar por vendedor si es necesario)
+            ventas_query = Venta.query.filter(
+                Venta.cliente_id == cliente_id,
+                Venta.tipo == 'credito', 
+                Venta.saldo_pendiente > 0
+            )
+            
+            if current_user.is_vendedor() and not current_user.is_admin():
+                ventas_query = ventas_query.filter(Venta.vendedor_id == current_user.id)
+            
+            ventas_pendientes = ventas_query.all()
+            
+            if ventas_pendientes:
+                form.venta_id.choices = [
+                    (v.id, f"Venta #{v.id} - {v.fecha.strftime('%d/%m/%Y')} - Saldo: ${v.saldo_pendiente:,.0f}")
+                    for v in ventas_pendientes
+                ]
             else:
-                flash(f"El cliente con ID {cliente_id} no tiene ventas a crédito pendientes o no pertenece a sus ventas", "warning")
+                form.venta_id.choices = [(-1, "Este cliente no tiene ventas pendientes")]
+        else:
+            flash(f"El cliente con ID {cliente_id} no tiene ventas a crédito pendientes o no pertenece a sus ventas", "warning")
     
     # Si tiene venta_id, preseleccionar la venta
     if venta_id:
@@ -150,8 +145,7 @@ def crear():
             if not client_selected:
                 cliente_id = venta.cliente_id
                 
-                if any(c[0] == cliente_id for c in form.cliente_id.choices):
-                    form.cliente_id.data = cliente_id
+                if preseleccionar_cliente(cliente_id):
                     client_selected = True
                 
                 # Cargar las ventas de este cliente
@@ -187,16 +181,15 @@ def crear():
         validation_errors = []
         
         # Validar cliente_id
+        cliente_form = None
+        venta_form = None
         cliente_id_form = request.form.get('cliente_id')
         if not cliente_id_form or cliente_id_form == '-1':
             validation_errors.append("Debe seleccionar un cliente")
         else:
-            try:
-                cliente_id_form = int(cliente_id_form)
-                cliente_form = Cliente.query.get(cliente_id_form)
-                if not cliente_form:
-                    validation_errors.append("Cliente no válido")
-            except ValueError:
+            # Debe ser un cliente que el selector podía ofrecer a este usuario
+            cliente_form = preseleccionar_cliente(cliente_id_form)
+            if not cliente_form:
                 validation_errors.append("Cliente no válido")
         
         # Validar venta_id MANUALMENTE (evitar el error "Not a valid choice")
@@ -216,6 +209,10 @@ def crear():
                 elif current_user.is_vendedor() and not current_user.is_admin():
                     if venta_form.vendedor_id != current_user.id:
                         validation_errors.append("No tienes permisos para abonar a esta venta")
+
+                # Aplica a todos los roles (también a los vendedores)
+                if venta_form and cliente_form and venta_form.cliente_id != cliente_form.id:
+                    validation_errors.append("La venta no pertenece al cliente seleccionado")
             except ValueError:
                 validation_errors.append("Venta no válida")
         
@@ -239,7 +236,7 @@ def crear():
                 if monto_decimal is not None:
                     if monto_decimal <= 0:
                         validation_errors.append("El monto debe ser mayor a cero")
-                    elif 'venta_form' in locals() and venta_form and monto_decimal > venta_form.saldo_pendiente:
+                    elif venta_form and monto_decimal > venta_form.saldo_pendiente:
                         validation_errors.append(f"El monto no puede ser mayor al saldo pendiente (${venta_form.saldo_pendiente:,.0f})")
             except Exception as e:
                 validation_errors.append("Error al procesar el monto")
@@ -262,7 +259,7 @@ def crear():
             for error in validation_errors:
                 flash(error, 'danger')
             current_app.logger.warning(f"Errores de validación personalizados: {validation_errors}")
-            return render_template('abonos/crear.html', form=form, clientes=clientes)
+            return render_template('abonos/crear.html', form=form)
         
         # Si llegamos aquí, la validación pasó - procesar el abono
         try:
@@ -296,20 +293,21 @@ def crear():
                     venta.estado = 'pagado'
                     venta.saldo_pendiente = 0
                 
-                # Registrar movimiento en caja
-                movimiento = MovimientoCaja(
-                    caja_id=caja_id_form,
-                    tipo='entrada',
-                    monto=monto_int,  # Usar int
-                    descripcion=f'Abono a venta #{venta.id}',
+                # Aplicar el abono a las cuotas del cronograma
+                aplicar_pagos(venta)
+                
+                # Registrar movimiento en caja (y su resumen diario) y sumar el abono
+                # al saldo con un UPDATE atómico: los cobros simultáneos no se pisan
+                registrar_movimiento(
+                    caja_id_form,
+                    'entrada',
+                    monto_int,  # Usar int
+                    f'Abono a venta #{venta.id}',
                     abono_id=abono.id
                 )
-                db.session.add(movimiento)
                 
-                # Actualizar saldo de caja
-                caja = Caja.query.get(caja_id_form)
-                if caja:
-                    caja.saldo_actual = int(caja.saldo_actual) + monto_int
+                # Acumular abono en el resumen diario
+                resumir_abono(abono)
             
             # Calcular comisión (fuera del no_autoflush)
             try:
@@ -334,7 +332,7 @@ def crear():
             current_app.logger.error(f"Error general al registrar abono: {e}")
             flash(f'Error al registrar el abono: {str(e)}', 'danger')
     
-    return render_template('abonos/crear.html', form=form, clientes=clientes)
+    return render_template('abonos/crear.html', form=form)
 
 @abonos_bp.route('/cargar-ventas/<int:cliente_id>')
 @login_required
@@ -439,10 +437,14 @@ def editar(id):
                 # Calcular diferencia de montos
                 diferencia_monto = nuevo_monto - monto_original
                 
+                # Revertir los valores anteriores del abono en el resumen diario
+                resumir_abono(abono, signo=-1)
+                
                 # Actualizar el abono
                 abono.monto = nuevo_monto
                 abono.caja_id = form.caja_id.data
                 abono.notas = form.notas.data
+                resumir_abono(abono)
                 
                 # Actualizar saldo de la venta
                 venta.saldo_pendiente = int(venta.saldo_pendiente) - diferencia_monto
@@ -453,33 +455,25 @@ def editar(id):
                 else:
                     venta.estado = 'pendiente'
                 
+                aplicar_pagos(venta)
+                
                 # Actualizar movimientos de caja
                 movimientos_existentes = MovimientoCaja.query.filter_by(abono_id=abono.id).all()
                 
                 # Si cambió la caja o el monto, actualizar movimientos
                 if caja_original_id != form.caja_id.data or diferencia_monto != 0:
-                    # Eliminar movimientos existentes
+                    # Eliminar movimientos existentes (revierte saldo y resumen)
                     for mov in movimientos_existentes:
-                        # Revertir el movimiento en la caja original
-                        caja_original = Caja.query.get(mov.caja_id)
-                        if caja_original:
-                            caja_original.saldo_actual = int(caja_original.saldo_actual) - int(mov.monto)
-                        db.session.delete(mov)
+                        revertir_movimiento(mov)
                     
-                    # Crear nuevo movimiento en la caja seleccionada
-                    nuevo_movimiento = MovimientoCaja(
-                        caja_id=form.caja_id.data,
-                        tipo='entrada',
-                        monto=nuevo_monto,
-                        descripcion=f'Abono a venta #{venta.id} (editado)',
+                    # Crear nuevo movimiento en la caja seleccionada y sumar al saldo
+                    registrar_movimiento(
+                        form.caja_id.data,
+                        'entrada',
+                        nuevo_monto,
+                        f'Abono a venta #{venta.id} (editado)',
                         abono_id=abono.id
                     )
-                    db.session.add(nuevo_movimiento)
-                    
-                    # Actualizar saldo de la nueva caja
-                    nueva_caja = Caja.query.get(form.caja_id.data)
-                    if nueva_caja:
-                        nueva_caja.saldo_actual = int(nueva_caja.saldo_actual) + nuevo_monto
             
             db.session.commit()
             
@@ -514,24 +508,23 @@ def eliminar(id):
                 venta = abono.venta
                 venta.saldo_pendiente = int(venta.saldo_pendiente) + monto_abono
                 venta.estado = 'pendiente'  # Cambiar estado a pendiente
+                aplicar_pagos(venta)
             
             # Eliminar movimientos de caja asociados y revertir saldos
             movimientos = MovimientoCaja.query.filter_by(abono_id=abono.id).all()
             for movimiento in movimientos:
-                # Revertir el saldo de la caja
-                caja = Caja.query.get(movimiento.caja_id)
-                if caja:
-                    caja.saldo_actual = int(caja.saldo_actual) - int(movimiento.monto)
-                
-                db.session.delete(movimiento)
+                # Revertir el saldo de la caja y el resumen diario
+                revertir_movimiento(movimiento)
             
-            # Eliminar comisiones asociadas (si existen)
+            # Eliminar comisiones asociadas (si existen) y descontarlas del saldo del período
             from app.models import Comision
             comisiones = Comision.query.filter_by(abono_id=abono.id).all()
             for comision in comisiones:
+                registrar_comision(comision, signo=-1)
                 db.session.delete(comision)
             
-            # Eliminar el abono
+            # Revertir el abono en el resumen diario y eliminarlo
+            resumir_abono(abono, signo=-1)
             db.session.delete(abono)
         
         db.session.commit()
@@ -5,6 +5,8 @@ from app import db
 from app.models import Caja, MovimientoCaja
 from app.forms import MovimientoCajaForm, CajaForm
 from app.decorators import (vendedor_required, cobrador_required, admin_required)
+from app.saldos_caja import registrar_movimiento, transferir, SaldoInsuficiente
+from app.paginacion import paginar_keyset, totales_listado, sumar_si
 
 cajas_bp = Blueprint('cajas', __name__, url_prefix='/cajas')
 
@@ -86,22 +88,27 @@ def movimientos(id):
     if tipo:
         query = query.filter_by(tipo=tipo)
     
-    movimientos = query.order_by(MovimientoCaja.fecha.desc()).all()
+    # Totales por tipo sobre todo el filtro (una consulta agregada)
+    totales = totales_listado(
+        query,
+        entradas=sumar_si(MovimientoCaja.tipo == 'entrada', MovimientoCaja.monto),
+        salidas=sumar_si(MovimientoCaja.tipo == 'salida', MovimientoCaja.monto),
+        transferencias=sumar_si(MovimientoCaja.tipo == 'transferencia', MovimientoCaja.monto)
+    )
     
-    # Calcular totales
-    total_entradas = sum(m.monto for m in movimientos if m.tipo == 'entrada')
-    total_salidas = sum(m.monto for m in movimientos if m.tipo == 'salida')
-    total_transferencias = sum(m.monto for m in movimientos if m.tipo == 'transferencia')
+    # Solo se cargan los movimientos de la página actual
+    pagina = paginar_keyset(query, [MovimientoCaja.fecha, MovimientoCaja.id])
     
     return render_template('cajas/movimientos.html', 
                            caja=caja, 
-                           movimientos=movimientos,
+                           movimientos=pagina.items,
+                           pagina=pagina,
                            desde=desde,
                            hasta=hasta,
                            tipo=tipo,
-                           total_entradas=total_entradas,
-                           total_salidas=total_salidas,
-                           total_transferencias=total_transferencias)
+                           total_entradas=totales['entradas'],
+                           total_salidas=totales['salidas'],
+                           total_transferencias=totales['transferencias'])
 
 @cajas_bp.route('/<int:id>/nuevo-movimiento', methods=['GET','POST'])
 @login_required
@@ -121,50 +128,42 @@ def nuevo_movimiento(id):
     if form.validate_on_submit():
         try:
             # Validar montos
-            monto = form.monto.data
+            monto = int(form.monto.data)
             if (form.tipo.data == 'salida' or form.tipo.data == 'transferencia') and monto > caja.saldo_actual:
                 flash(f"El monto no puede ser mayor al saldo actual (${caja.saldo_actual:,.2f})", 'danger')
                 return render_template('cajas/nuevo_movimiento.html', form=form, caja=caja)
             
-            # Crear el movimiento
-            mov = MovimientoCaja(
-                tipo=form.tipo.data,
-                monto=monto,
-                descripcion=form.concepto.data,  # ¡IMPORTANTE! Usar descripcion en lugar de concepto
-                caja_id=caja.id,
-                caja_destino_id=form.caja_destino_id.data if form.tipo.data == 'transferencia' else None
-            )
-            
-            db.session.add(mov)
-            
-            # Actualizar saldos
-            if form.tipo.data == 'entrada':
-                caja.saldo_actual += monto
-            elif form.tipo.data == 'salida':
-                caja.saldo_actual -= monto
-            elif form.tipo.data == 'transferencia' and form.caja_destino_id.data:
-                caja.saldo_actual -= monto
-                caja_destino = CajaModel.query.get(form.caja_destino_id.data)
-                if not caja_destino:
+            # Registrar el movimiento y actualizar saldos en la base de datos.
+            # exigir_saldo repite la validación dentro del UPDATE, por si otro
+            # movimiento usó el saldo entre la lectura y la escritura.
+            if form.tipo.data == 'transferencia' and form.caja_destino_id.data:
+                if not CajaModel.query.get(form.caja_destino_id.data):
                     flash(f"Caja destino no encontrada", 'danger')
                     return render_template('cajas/nuevo_movimiento.html', form=form, caja=caja)
                 
-                caja_destino.saldo_actual += monto
-                
-                # Crear movimiento en la caja destino
-                mov_destino = MovimientoCaja(
-                    tipo='entrada',
-                    monto=monto,
-                    descripcion=f"Transferencia desde {caja.nombre}",
-                    caja_id=caja_destino.id,
-                    caja_destino_id=caja.id
+                transferir(
+                    caja.id,
+                    form.caja_destino_id.data,
+                    monto,
+                    form.concepto.data,  # ¡IMPORTANTE! Se guarda en descripcion
+                    exigir_saldo=True
+                )
+            else:
+                registrar_movimiento(
+                    caja.id,
+                    form.tipo.data,
+                    monto,
+                    form.concepto.data,  # ¡IMPORTANTE! Se guarda en descripcion
+                    exigir_saldo=form.tipo.data != 'entrada'
                 )
-                db.session.add(mov_destino)
             
             db.session.commit()
             flash('Movimiento registrado exitosamente', 'success')
             return redirect(url_for('cajas.movimientos', id=id))
             
+        except SaldoInsuficiente:
+            db.session.rollback()
+            flash("El saldo de la caja cambió y ya no alcanza para este movimiento", 'danger')
         except Exception as e:
             db.session.rollback()
             flash(f"Error al registrar movimiento: {str(e)}", 'danger')
@@ -187,7 +186,6 @@ def editar(id):
     if form.validate_on_submit():
         # Guardar saldo actual para calcular la diferencia
         saldo_inicial_anterior = caja.saldo_inicial
-        saldo_actual_anterior = caja.saldo_actual
         
         # Actualizar nombre y tipo
         caja.nombre = form.nombre.data
@@ -197,22 +195,21 @@ def editar(id):
         if form.saldo_inicial.data != saldo_inicial_anterior:
             # Ajustar saldo_actual proporcionalmente
             diferencia = form.saldo_inicial.data - saldo_inicial_anterior
-            caja.saldo_actual = saldo_actual_anterior + diferencia
             caja.saldo_inicial = form.saldo_inicial.data
             
             # Registrar este cambio como un movimiento de ajuste si hay diferencia
+            # (el movimiento suma o resta la diferencia al saldo actual)
             if diferencia != 0:
                 tipo_movimiento = 'entrada' if diferencia > 0 else 'salida'
                 monto_movimiento = abs(diferencia)
                 
-                movimiento = MovimientoCaja(
-                    caja_id=caja.id,
-                    tipo=tipo_movimiento,
-                    monto=monto_movimiento,
-                    descripcion=f"Ajuste por modificación de saldo inicial",
+                registrar_movimiento(
+                    caja.id,
+                    tipo_movimiento,
+                    monto_movimiento,
+                    f"Ajuste por modificación de saldo inicial",
                     fecha=datetime.now()
                 )
-                db.session.add(movimiento)
         
         # Guardar los cambios
         db.session.commit()
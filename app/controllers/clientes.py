@@ -6,6 +6,7 @@ from flask import (
     flash,
     request,
     make_response,
+    jsonify,
 )
 from flask_login import login_required, current_user
 from app import db
@@ -13,6 +14,17 @@ from app.models import Cliente, Venta, Credito, Abono
 from app.forms import ClienteForm
 from app.decorators import vendedor_required, cobrador_required, admin_required
 from app.pdf.cliente import generar_pdf_historial
+from app.gestores import precargar_usuarios
+from app.paginacion import paginar_keyset, totales_listado
+from app.busqueda_clientes import (
+    consulta_por_relevancia,
+    buscar_clientes,
+    clientes_seleccionables,
+    opcion_cliente,
+    CONTEXTOS_SELECCION,
+    LIMITE_SUGERENCIAS,
+    MAXIMO_SUGERENCIAS,
+)
 
 clientes_bp = Blueprint("clientes", __name__, url_prefix="/clientes")
 
@@ -34,12 +46,16 @@ def index():
         query = query.filter(Cliente.id.in_(clientes_ids))
 
     if busqueda:
-        query = query.filter(
-            Cliente.nombre.ilike(f"%{busqueda}%")
-            | Cliente.cedula.ilike(f"%{busqueda}%")
-        )
-
-    clientes = query.all()
+        # Búsqueda indexada por nombre, cédula o teléfono, por relevancia (y id)
+        query, relevancia = consulta_por_relevancia(query, busqueda)
+        totales = totales_listado(query, cantidad=db.func.count(Cliente.id))
+        pagina = paginar_keyset(query, [relevancia, Cliente.id], descendente=False)
+        clientes = [fila[0] for fila in pagina.items]
+    else:
+        totales = totales_listado(query, cantidad=db.func.count(Cliente.id))
+        # Solo se cargan los clientes de la página actual, en orden de registro (por id)
+        pagina = paginar_keyset(query, [Cliente.id], descendente=False)
+        clientes = pagina.items
 
     # Determinar si el usuario actual solo puede consultar
     solo_consulta = current_user.is_vendedor() and not current_user.is_admin()
@@ -47,11 +63,59 @@ def index():
     return render_template(
         "clientes/index.html",
         clientes=clientes,
+        pagina=pagina,
+        total_clientes=totales["cantidad"],
         busqueda=busqueda,
         solo_consulta=solo_consulta,
     )
 
 
+@clientes_bp.route("/buscar")
+@login_required
+def buscar():
+    """
+    Sugerencias JSON para los selectores de cliente (?q=, ?contexto=venta|abono).
+    Solo devuelve clientes que el usuario puede elegir en ese formulario.
+    """
+    contexto = request.args.get("contexto", "venta")
+    if contexto not in CONTEXTOS_SELECCION:
+        contexto = "venta"
+
+    if contexto == "venta":
+        permitido = current_user.is_vendedor() or current_user.is_admin()
+    else:
+        permitido = (
+            current_user.is_vendedor()
+            or current_user.is_cobrador()
+            or current_user.is_admin()
+        )
+    if not permitido:
+        return jsonify({"error": "No tiene permisos para buscar clientes"}), 403
+
+    busqueda = request.args.get("q", "").strip()
+    if len(busqueda) < 2:
+        return jsonify([])
+
+    limite = request.args.get("limite", type=int) or LIMITE_SUGERENCIAS
+    clientes = buscar_clientes(
+        busqueda,
+        query=clientes_seleccionables(contexto, current_user),
+        limite=min(max(limite, 1), MAXIMO_SUGERENCIAS),
+    )
+    return jsonify(
+        [
+            {
+                "id": cliente.id,
+                "nombre": cliente.nombre,
+                "cedula": cliente.cedula,
+                "telefono": cliente.telefono,
+                "texto": opcion_cliente(cliente)[1],
+            }
+            for cliente in clientes
+        ]
+    )
+
+
 @clientes_bp.route("/crear", methods=["GET", "POST"])
 @login_required
 @vendedor_required
@@ -148,6 +212,16 @@ def editar(id):
 @vendedor_required
 def eliminar(id):
     cliente = Cliente.query.get_or_404(id)
+    # Borrar en cascada sus ventas (y abonos) dejaría el resumen diario, las cajas y
+    # las comisiones con montos que ya no existen: se eliminan primero las ventas
+    ventas = db.session.query(db.func.count(Venta.id)).filter(Venta.cliente_id == id).scalar()
+    if ventas:
+        flash(
+            f"No se puede eliminar el cliente: tiene {ventas} ventas registradas. "
+            "Elimine primero sus ventas.",
+            "warning",
+        )
+        return redirect(url_for("clientes.detalle", id=id))
     try:
         db.session.delete(cliente)
         db.session.commit()
@@ -171,6 +245,7 @@ def detalle(id):
 
         # Obtener ventas del cliente con información de gestor segura
         ventas_raw = cliente.ventas
+        precargar_usuarios(ventas_raw)
         ventas_procesadas = []
 
         for venta in ventas_raw:
@@ -5,6 +5,8 @@ from app.models import Credito, Cliente, Venta
 from app.forms import CreditoForm
 from app.decorators import cobrador_required, vendedor_cobrador_required
 from app.pdf.credito import generar_pdf_credito
+from app.paginacion import paginar_keyset, totales_listado
+from app.busqueda_clientes import filtro_clientes
 from datetime import datetime
 
 creditos_bp = Blueprint('creditos', __name__, url_prefix='/creditos')
@@ -31,7 +33,7 @@ def index():
         
         if busqueda:
             # Buscar por nombre de cliente
-            query = query.join(Cliente).filter(Cliente.nombre.ilike(f"%{busqueda}%"))
+            query = query.join(Cliente).filter(filtro_clientes(busqueda))
         
         if desde_str:
             try:
@@ -48,17 +50,23 @@ def index():
             except ValueError:
                 flash('Fecha "hasta" inválida.', 'warning')
 
-        # Ordenar por fecha descendente
-        creditos = query.order_by(Venta.fecha.desc()).all()
+        # Totales sobre todo el filtro (una consulta agregada)
+        totales = totales_listado(
+            query,
+            cantidad=db.func.count(Venta.id),
+            total=db.func.sum(Venta.total),
+            pendiente=db.func.sum(Venta.saldo_pendiente)
+        )
         
-        # Calcular totales
-        total_creditos = sum(c.total for c in creditos)
-        total_pendiente = sum(c.saldo_pendiente for c in creditos)
+        # Solo se cargan los créditos de la página actual
+        pagina = paginar_keyset(query, [Venta.fecha, Venta.id])
         
         return render_template('creditos/index.html', 
-                              creditos=creditos, 
-                              total_creditos=total_creditos,
-                              total_pendiente=total_pendiente,
+                              creditos=pagina.items, 
+                              pagina=pagina,
+                              cantidad_creditos=totales['cantidad'],
+                              total_creditos=totales['total'],
+                              total_pendiente=totales['pendiente'],
                               busqueda=busqueda,
                               desde=desde_str,
                               hasta=hasta_str)
@@ -67,5 +75,6 @@ def index():
         flash(f'Error al cargar créditos: {str(e)}', 'danger')
         return render_template('creditos/index.html', 
                               creditos=[],
+                              cantidad_creditos=0,
                               total_creditos=0,
                               total_pendiente=0)
@@ -0,0 +1,104 @@
+from flask import Blueprint, Response, current_app, request, stream_with_context
+from flask_login import login_required, current_user
+from app import db
+from app.clasificacion_cobros import estadisticas_cobros_cacheadas
+from app.eventos import canal_eventos, contadores_cacheados
+from app.metricas import total_cajas, estadisticas_sistema
+from app.utils import format_currency
+import json
+import logging
+import time
+
+logger = logging.getLogger("app.eventos")
+
+eventos_bp = Blueprint('eventos', __name__, url_prefix='/eventos')
+
+
+def _contadores_cajas():
+    total = total_cajas()
+    return {'total': total, 'total_formateado': format_currency(total)}
+
+
+def _calcular_contadores(temas, vendedor_id):
+    """
+    Contadores de los temas de la conexión. Cada uno se calcula una vez por
+    alcance para todas las pestañas abiertas (caché invalidado en cada commit
+    que toca el tema, con TTL para los cambios hechos en otros procesos).
+    """
+    ttl = current_app.config.get('SSE_HEARTBEAT', 30)
+    contadores = {}
+    if 'cobros' in temas:
+        estadisticas, _ = estadisticas_cobros_cacheadas(
+            vendedor_id, ttl=current_app.config.get('COBROS_CACHE_TTL')
+        )
+        contadores['cobros'] = estadisticas
+    if 'cajas' in temas:
+        contadores['cajas'] = contadores_cacheados('cajas', _contadores_cajas, ttl)
+    if 'respaldos' in temas:
+        contadores['respaldos'] = contadores_cacheados('respaldos', estadisticas_sistema, ttl)
+    return contadores
+
+
+@eventos_bp.route('/stream')
+@login_required
+def stream():
+    """
+    Server-Sent Events con los contadores del usuario (cobros, cajas, respaldos).
+    Envía un evento 'contadores' al conectar y después de cada commit que afecte
+    sus temas. Los contadores de respaldos solo se envían a la página que los
+    pide (?temas=respaldos). Cada SSE_HEARTBEAT segundos vuelve a calcular (cubre commits hechos
+    en otros procesos) y, si nada cambió, envía un comentario para mantener viva
+    la conexión. Tras SSE_DURACION_MAXIMA se cierra y el navegador reconecta.
+    """
+    es_admin = current_user.is_admin()
+    ve_cobros = es_admin or current_user.is_vendedor() or current_user.is_cobrador()
+    vendedor_id = current_user.id if current_user.is_vendedor() and not es_admin else None
+
+    temas = set()
+    if ve_cobros:
+        temas.add('cobros')
+    if es_admin:
+        temas.add('cajas')
+        # Las 8 cuentas de tablas solo interesan en el panel de respaldos
+        if 'respaldos' in request.args.get('temas', '').split(','):
+            temas.add('respaldos')
+
+    heartbeat = current_app.config.get('SSE_HEARTBEAT', 30)
+    duracion_maxima = current_app.config.get('SSE_DURACION_MAXIMA', 600)
+
+    def generar():
+        suscripcion = canal_eventos.suscribir(temas)
+        inicio = time.monotonic()
+        ultimo = None
+        try:
+            yield 'retry: 5000\n\n'
+            while True:
+                try:
+                    carga = json.dumps(
+                        _calcular_contadores(temas, vendedor_id),
+                        sort_keys=True,
+                    )
+                except Exception as e:
+                    logger.error(f"Error calculando contadores en tiempo real: {e}")
+                    db.session.rollback()
+                    carga = ultimo
+                finally:
+                    # No retener una conexión de la base de datos mientras se espera
+                    db.session.remove()
+
+                if carga != ultimo:
+                    ultimo = carga
+                    yield f'event: contadores\ndata: {carga}\n\n'
+                else:
+                    yield ': ping\n\n'
+
+                if time.monotonic() - inicio >= duracion_maxima:
+                    return
+                suscripcion.esperar(heartbeat)
+        finally:
+            canal_eventos.cancelar(suscripcion)
+
+    response = Response(stream_with_context(generar()), mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
@@ -4,6 +4,7 @@ from app import db
 from app.models import Producto
 from app.forms import ProductoForm
 from app.decorators import vendedor_required, admin_required
+from app.paginacion import paginar_keyset, totales_listado, contar_si
 
 productos_bp = Blueprint('productos', __name__, url_prefix='/productos')
 
@@ -15,10 +16,19 @@ def index():
     query = Producto.query
     if busqueda:
         query = query.filter(Producto.nombre.ilike(f"%{busqueda}%"))
-    productos = query.all()
+    # Resumen del inventario sobre todo el filtro (una consulta agregada)
+    resumen = totales_listado(
+        query,
+        total=db.func.count(Producto.id),
+        agotados=contar_si(Producto.stock <= 0),
+        stock_bajo=contar_si(db.and_(Producto.stock > 0, Producto.stock <= Producto.stock_minimo)),
+        valor_costo=db.func.sum(Producto.precio_compra)
+    )
+    # Solo se cargan los productos de la página actual, en orden de registro (por id)
+    pagina = paginar_keyset(query, [Producto.id], descendente=False)
     # Pasamos el flag de solo_consulta para vendedores
     solo_consulta = current_user.is_vendedor() and not current_user.is_admin()
-    return render_template('productos/index.html', productos=productos, busqueda=busqueda, solo_consulta=solo_consulta)
+    return render_template('productos/index.html', productos=pagina.items, pagina=pagina, resumen=resumen, busqueda=busqueda, solo_consulta=solo_consulta)
 
 @productos_bp.route('/<int:id>')
 @login_required
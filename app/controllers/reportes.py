@@ -1,14 +1,23 @@
 from flask import Blueprint, render_template, redirect, url_for, request, make_response, flash, jsonify, current_app
 from flask_login import login_required, current_user
 from app import db
-from app.models import Comision, Usuario, Venta, Abono, MovimientoCaja
+from app.models import Comision, Usuario, Venta, Abono, MovimientoCaja, Cliente, Caja
 from app.forms import ReporteComisionesForm
 from app.decorators import admin_required, vendedor_extended_required, vendedor_cobrador_required
+from app.exportacion import por_lotes, respuesta_exportacion
+from app.paginacion import paginar_keyset
+from app.saldos_comision import saldo_periodo
+from app.liquidaciones import (
+    consulta_pendientes,
+    liquidaciones_recientes,
+    liquidar_comisiones,
+    resumen_pendientes,
+    revertir_liquidacion,
+)
 from datetime import datetime, timedelta
+from sqlalchemy.orm import aliased
 import csv
 import io
-import pandas as pd
-from io import BytesIO
 
 
 reportes_bp = Blueprint('reportes', __name__, url_prefix='/reportes')
@@ -21,12 +30,14 @@ def comisiones():
     comisiones_por_usuario = {}
     total_base = 0
     total_comision = 0
+    total_registros = 0
     fecha_inicio = None
     fecha_fin = None
-    pagination = None
+    pagina = None
+    solo_propias = (current_user.is_vendedor() or current_user.is_cobrador()) and not current_user.is_admin()
 
     # Si el usuario es vendedor o cobrador, solo mostrar sus propias comisiones
-    if (current_user.is_vendedor() or current_user.is_cobrador()) and not current_user.is_admin():
+    if solo_propias:
         form.usuario_id.choices = [(current_user.id, current_user.nombre)]
         form.usuario_id.data = current_user.id
     else:
@@ -52,81 +63,108 @@ def comisiones():
         try:
             fecha_inicio = datetime.strptime(form.fecha_inicio.data, '%Y-%m-%d')
             fecha_fin = datetime.strptime(form.fecha_fin.data, '%Y-%m-%d')
-            usuario_id = form.usuario_id.data
-            
-            # Para vendedores y cobradores, siempre usar su ID
-            if (current_user.is_vendedor() or current_user.is_cobrador()) and not current_user.is_admin():
-                usuario_id = current_user.id
-            
-            # Usar la función corregida con manejo de errores
-            try:
-                # Crear consulta manualmente para mejor control de errores
-                base_query = db.session.query(Comision, Usuario)\
-                    .join(Usuario, Comision.usuario_id == Usuario.id)\
-                    .filter(
-                        Comision.fecha_generacion >= fecha_inicio,
-                        Comision.fecha_generacion <= fecha_fin
-                    )
-                
-                if usuario_id and usuario_id != 0:
-                    base_query = base_query.filter(Comision.usuario_id == usuario_id)
-                
-                # Ejecutar consulta con manejo de errores
-                try:
-                    all_comisiones = base_query.all()
-                except Exception as db_error:
-                    # Rollback y reintentar
-                    db.session.rollback()
-                    current_app.logger.error(f"Error en consulta comisiones: {db_error}")
-                    all_comisiones = base_query.all()
-                
-                # Procesar resultados
-                comisiones_paginadas = all_comisiones[:25]  # Limitar para evitar problemas
-                
-                if not comisiones_paginadas and (current_user.is_vendedor() or current_user.is_cobrador()):
-                    flash('No se encontraron comisiones registradas para este período.', 'info')
-                
-                # Agrupar por usuario
-                for comision, usuario in comisiones_paginadas:
-                    if usuario.id not in comisiones_por_usuario:
-                        comisiones_por_usuario[usuario.id] = {
-                            'usuario': usuario,
-                            'comisiones': [],
-                            'total_base': 0,
-                            'total_comision': 0
-                        }
-
-                    comisiones_por_usuario[usuario.id]['comisiones'].append(comision)
-                    comisiones_por_usuario[usuario.id]['total_base'] += comision.monto_base
-                    comisiones_por_usuario[usuario.id]['total_comision'] += comision.monto_comision
-                
-                # Calcular totales generales
-                for comision, usuario in all_comisiones:
-                    total_base += comision.monto_base
-                    total_comision += comision.monto_comision
-
-                # Si se solicita exportar Excel
-                if 'export' in request.form:
-                    return exportar_excel_comisiones([c for c, _ in all_comisiones], fecha_inicio, fecha_fin)
-                    
-            except Exception as query_error:
-                current_app.logger.error(f"Error en procesamiento de comisiones: {query_error}")
-                flash("Error al procesar las comisiones. Intente nuevamente.", "danger")
-                db.session.rollback()
-                
+            usuario_id = current_user.id if solo_propias else form.usuario_id.data
+
+            # Si se solicita exportar Excel (se escribe por lotes desde la consulta)
+            if 'export' in request.form:
+                return exportar_excel_comisiones(
+                    _consulta_comisiones(fecha_inicio, fecha_fin, usuario_id),
+                    fecha_inicio, fecha_fin
+                )
+
+            # El reporte se muestra por GET: los enlaces de paginación conservan los filtros
+            return redirect(url_for('reportes.comisiones',
+                                    fecha_inicio=form.fecha_inicio.data,
+                                    fecha_fin=form.fecha_fin.data,
+                                    usuario_id=usuario_id or 0))
+
+        except Exception as e:
+            current_app.logger.error(f"Error al generar reporte de comisiones: {str(e)}")
+            flash(f"Error al generar el reporte: {str(e)}", "danger")
+            db.session.rollback()
+
+    elif request.method == 'GET' and request.args.get('fecha_inicio'):
+        try:
+            fecha_inicio = datetime.strptime(request.args.get('fecha_inicio', ''), '%Y-%m-%d')
+            fecha_fin = datetime.strptime(request.args.get('fecha_fin', ''), '%Y-%m-%d')
+            usuario_id = current_user.id if solo_propias else request.args.get('usuario_id', 0, type=int)
+            form.fecha_inicio.data = fecha_inicio.strftime('%Y-%m-%d')
+            form.fecha_fin.data = fecha_fin.strftime('%Y-%m-%d')
+            form.usuario_id.data = usuario_id
+
+            query = _consulta_comisiones(fecha_inicio, fecha_fin, usuario_id)
+
+            # Totales por usuario y generales con GROUP BY, sin cargar las comisiones
+            totales = query.with_entities(
+                Usuario,
+                db.func.count(Comision.id),
+                db.func.coalesce(db.func.sum(Comision.monto_base), 0),
+                db.func.coalesce(db.func.sum(Comision.monto_comision), 0)
+            ).group_by(Usuario.id).order_by(Usuario.nombre).all()
+
+            for usuario, cantidad, base, comision in totales:
+                comisiones_por_usuario[usuario.id] = {
+                    'usuario': usuario,
+                    'comisiones': [],
+                    'cantidad': cantidad,
+                    'total_base': int(base),
+                    'total_comision': int(comision)
+                }
+                total_registros += cantidad
+                total_base += int(base)
+                total_comision += int(comision)
+
+            if not totales and solo_propias:
+                flash('No se encontraron comisiones registradas para este período.', 'info')
+
+            # Detalle: solo las comisiones de la página actual
+            if totales:
+                pagina = paginar_keyset(
+                    query.options(
+                        db.joinedload(Comision.venta).joinedload(Venta.cliente),
+                        db.joinedload(Comision.abono)
+                    ),
+                    [Comision.fecha_generacion, Comision.id]
+                )
+                for comision in pagina.items:
+                    comisiones_por_usuario[comision.usuario_id]['comisiones'].append(comision)
+
+        except ValueError:
+            flash("Las fechas del reporte no son válidas.", "danger")
         except Exception as e:
             current_app.logger.error(f"Error al generar reporte de comisiones: {str(e)}")
             flash(f"Error al generar el reporte: {str(e)}", "danger")
             db.session.rollback()
 
+    # Saldo del período en curso: una fila por usuario (o la suma de las del período)
+    saldo_actual = None
+    try:
+        saldo_actual = saldo_periodo(form.usuario_id.data or None)
+    except Exception as e:
+        current_app.logger.error(f"Error al consultar el saldo de comisiones: {e}")
+        db.session.rollback()
+
     return render_template('reportes/comisiones.html',
                           form=form,
+                          saldo_actual=saldo_actual,
                           comisiones_por_usuario=comisiones_por_usuario,
                           total_base=total_base,
                           total_comision=total_comision,
+                          total_registros=total_registros,
                           fecha_inicio=fecha_inicio,
                           fecha_fin=fecha_fin,
-                          pagination=pagination)
+                          pagina=pagina)
+
+
+def _consulta_comisiones(fecha_inicio, fecha_fin, usuario_id=None):
+    """Comisiones del período (con su usuario), de un usuario o de todos (0/None)"""
+    query = Comision.query.join(Usuario, Comision.usuario_id == Usuario.id).filter(
+        Comision.fecha_generacion >= fecha_inicio,
+        Comision.fecha_generacion <= fecha_fin
+    )
+    if usuario_id:
+        query = query.filter(Comision.usuario_id == usuario_id)
+    return query
 
 
 @reportes_bp.route('/comisiones/liquidar-masiva', methods=['GET', 'POST'])
@@ -137,58 +175,41 @@ def liquidar_masiva():
         # Obtener fechas del formulario
         fecha_inicio = datetime.strptime(request.form['fecha_inicio'], '%Y-%m-%d')
         fecha_fin = datetime.strptime(request.form['fecha_fin'], '%Y-%m-%d')
-        usuario_id = request.form.get('usuario_id')
-        
+        usuario_id = request.form.get('usuario_id', 0, type=int)
+
         try:
-            # Construir consulta con mejor manejo de errores
-            query = Comision.query.filter(
-                Comision.fecha_generacion >= fecha_inicio,
-                Comision.fecha_generacion <= fecha_fin,
-                Comision.pagado == False
-            )
-            
-            if usuario_id and usuario_id != '0':
-                query = query.filter(Comision.usuario_id == usuario_id)
-            
-            # Ejecutar consulta con manejo de errores
-            try:
-                comisiones = query.all()
-            except Exception as db_error:
-                db.session.rollback()
-                current_app.logger.error(f"Error en consulta liquidación masiva: {db_error}")
-                comisiones = query.all()
-            
+            if 'exportar' in request.form:
+                # Exportar a Excel (se escribe por lotes desde la consulta)
+                return exportar_excel_liquidacion(
+                    consulta_pendientes(fecha_inicio, fecha_fin, usuario_id),
+                    fecha_inicio, fecha_fin
+                )
+
             if 'liquidar' in request.form:
-                # Marcar todas como pagadas
-                for comision in comisiones:
-                    comision.pagado = True
-                
+                # Un solo UPDATE marca las comisiones y registra la liquidación
+                liquidacion = liquidar_comisiones(
+                    current_user.id, fecha_inicio, fecha_fin, usuario_id
+                )
                 db.session.commit()
-                total_liquidado = sum(c.monto_comision for c in comisiones)
-                flash(f'Liquidadas {len(comisiones)} comisiones por un total de ${total_liquidado:,.0f}', 'success')
+                if liquidacion is None:
+                    flash('No hay comisiones pendientes para liquidar en el período.', 'info')
+                else:
+                    flash(f'Liquidadas {liquidacion.cantidad} comisiones por un total de '
+                          f'${liquidacion.total:,.0f} (liquidación #{liquidacion.id})', 'success')
                 return redirect(url_for('reportes.liquidar_masiva'))
-            
-            elif 'exportar' in request.form:
-                # Exportar a Excel
-                return exportar_excel_liquidacion(comisiones, fecha_inicio, fecha_fin)
-            
-            # Agrupar por usuario para mostrar resumen
-            resumen_usuarios = {}
-            for comision in comisiones:
-                if comision.usuario_id not in resumen_usuarios:
-                    resumen_usuarios[comision.usuario_id] = {
-                        'usuario': comision.usuario,
-                        'total_comision': 0,
-                        'cantidad': 0
-                    }
-                resumen_usuarios[comision.usuario_id]['total_comision'] += comision.monto_comision
-                resumen_usuarios[comision.usuario_id]['cantidad'] += 1
-            
+
+            # Resumen por usuario con GROUP BY, sin cargar las comisiones
+            resumen_usuarios, total_general = resumen_pendientes(fecha_inicio, fecha_fin, usuario_id)
+
+            usuarios = Usuario.query.filter(Usuario.rol.in_(['vendedor', 'cobrador', 'administrador'])).all()
             return render_template('reportes/liquidar_masiva.html', 
+                                 usuarios=usuarios,
                                  resumen_usuarios=resumen_usuarios,
                                  fecha_inicio=fecha_inicio,
                                  fecha_fin=fecha_fin,
-                                 total_general=sum(c.monto_comision for c in comisiones))
+                                 usuario_id=usuario_id,
+                                 total_general=total_general,
+                                 liquidaciones=liquidaciones_recientes())
         
         except Exception as e:
             current_app.logger.error(f"Error en liquidación masiva: {e}")
@@ -197,14 +218,37 @@ def liquidar_masiva():
     
     # GET: mostrar formulario
     usuarios = Usuario.query.filter(Usuario.rol.in_(['vendedor', 'cobrador', 'administrador'])).all()
-    return render_template('reportes/liquidar_masiva.html', usuarios=usuarios)
+    return render_template('reportes/liquidar_masiva.html', usuarios=usuarios,
+                           liquidaciones=liquidaciones_recientes())
+
+@reportes_bp.route('/comisiones/liquidaciones/<int:id>/revertir', methods=['POST'])
+@login_required
+@admin_required
+def revertir_liquidacion_comisiones(id):
+    try:
+        revertidas = revertir_liquidacion(id, current_user.id)
+        db.session.commit()
+        flash(f'Liquidación #{id} revertida: {revertidas} comisiones vuelven a estar pendientes', 'success')
+    except ValueError as e:
+        db.session.rollback()
+        flash(str(e), 'warning')
+    except Exception as e:
+        db.session.rollback()
+        current_app.logger.error(f"Error al revertir la liquidación {id}: {e}")
+        flash(f"Error al revertir la liquidación: {str(e)}", "danger")
+    return redirect(url_for('reportes.liquidar_masiva'))
 
 @reportes_bp.route('/comisiones/<int:id>/marcar-pagado', methods=['POST'])
 @login_required
 @admin_required
 def marcar_pagado(id):
-    comision = Comision.query.get_or_404(id)
-    comision.pagado = True
+    Comision.query.get_or_404(id)
+    liquidacion = liquidar_comisiones(current_user.id, comision_ids=[id])
+    if liquidacion is None:
+        # Ya estaba pagada (o la liquidó otra petición al mismo tiempo)
+        db.session.rollback()
+        flash('La comisión ya estaba pagada', 'warning')
+        return jsonify({'success': False, 'error': 'La comisión ya estaba pagada'})
     db.session.commit()
     flash('Comisión marcada como pagada exitosamente', 'success')
     # No redirigir para evitar resetear filtros
@@ -215,84 +259,78 @@ def marcar_pagado(id):
 @admin_required
 def marcar_todas_pagadas():
     data = request.get_json()
-    comision_ids = data.get('comision_ids', [])
+    comision_ids = [int(comision_id) for comision_id in data.get('comision_ids', [])]
     
     if comision_ids:
-        comisiones = Comision.query.filter(Comision.id.in_(comision_ids)).all()
-        for comision in comisiones:
-            comision.pagado = True
+        liquidacion = liquidar_comisiones(current_user.id, comision_ids=comision_ids)
         db.session.commit()
-        flash(f'{len(comisiones)} comisiones marcadas como pagadas exitosamente', 'success')
-        return jsonify({'success': True, 'count': len(comisiones)})
+        cantidad = liquidacion.cantidad if liquidacion else 0
+        flash(f'{cantidad} comisiones marcadas como pagadas exitosamente', 'success')
+        return jsonify({'success': True, 'count': cantidad})
     
     return jsonify({'success': False, 'error': 'No se seleccionaron comisiones'})
 
 
-def exportar_excel_liquidacion(comisiones, fecha_inicio, fecha_fin):
+def exportar_excel_liquidacion(query, fecha_inicio, fecha_fin):
     """Exporta liquidación de comisiones a Excel"""
-    data = []
-    
-    # Agrupar por usuario
-    usuarios_dict = {}
-    for comision in comisiones:
-        if comision.usuario_id not in usuarios_dict:
-            usuarios_dict[comision.usuario_id] = {
-                'nombre': comision.usuario.nombre,
-                'comisiones': [],
-                'total': 0
-            }
-        usuarios_dict[comision.usuario_id]['comisiones'].append(comision)
-        usuarios_dict[comision.usuario_id]['total'] += comision.monto_comision
-    
-    # Crear data para Excel
-    for usuario_id, datos in usuarios_dict.items():
-        # Fila de resumen del usuario
-        data.append({
-            'EMPLEADO': datos['nombre'],
-            'CONCEPTO': 'TOTAL A PAGAR',
-            'CANTIDAD': len(datos['comisiones']),
-            'MONTO': f"${datos['total']:,.0f}",
-            'PERIODO': f"{fecha_inicio.strftime('%d/%m/%Y')} - {fecha_fin.strftime('%d/%m/%Y')}"
-        })
-        
-        # Detalle de cada comisión
-        for comision in datos['comisiones']:
-            origen = "Venta" if comision.venta_id else "Abono" if comision.abono_id else "N/A"
-            data.append({
-                'EMPLEADO': '',
-                'CONCEPTO': f"{origen} #{comision.venta_id or comision.abono_id or 'N/A'}",
-                'CANTIDAD': f"{comision.porcentaje}%",
-                'MONTO': f"${comision.monto_comision:,.0f}",
-                'PERIODO': comision.fecha_generacion.strftime('%d/%m/%Y')
-            })
-        
-        # Fila vacía entre empleados
-        data.append({'EMPLEADO': '', 'CONCEPTO': '', 'CANTIDAD': '', 'MONTO': '', 'PERIODO': ''})
-    
-    df = pd.DataFrame(data)
-    
-    output = BytesIO()
-    with pd.ExcelWriter(output, engine='openpyxl') as writer:
-        df.to_excel(writer, sheet_name='Liquidación Comisiones', index=False)
-        
-        # Formatear el Excel
-        workbook = writer.book
-        worksheet = writer.sheets['Liquidación Comisiones']
-        
-        # Ajustar anchos de columna
-        worksheet.column_dimensions['A'].width = 20
-        worksheet.column_dimensions['B'].width = 25
-        worksheet.column_dimensions['C'].width = 15
-        worksheet.column_dimensions['D'].width = 15
-        worksheet.column_dimensions['E'].width = 20
-    
-    output.seek(0)
-    
-    response = make_response(output.getvalue())
-    response.headers['Content-Disposition'] = f'attachment; filename=liquidacion_comisiones_{fecha_inicio.strftime("%Y%m%d")}-{fecha_fin.strftime("%Y%m%d")}.xlsx'
-    response.headers['Content-Type'] = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
-    
-    return response
+    periodo = f"{fecha_inicio.strftime('%d/%m/%Y')} - {fecha_fin.strftime('%d/%m/%Y')}"
+
+    # Totales por usuario en una consulta agregada (la fila de resumen va antes
+    # que el detalle de cada empleado)
+    totales = {
+        usuario_id: (cantidad, total)
+        for usuario_id, cantidad, total in query.with_entities(
+            Comision.usuario_id,
+            db.func.count(Comision.id),
+            db.func.coalesce(db.func.sum(Comision.monto_comision), 0),
+        ).group_by(Comision.usuario_id)
+    }
+
+    detalle = por_lotes(
+        query.join(Usuario, Usuario.id == Comision.usuario_id)
+        .with_entities(
+            Comision.usuario_id,
+            Usuario.nombre,
+            Comision.venta_id,
+            Comision.abono_id,
+            Comision.porcentaje,
+            Comision.monto_comision,
+            Comision.fecha_generacion,
+        )
+        .order_by(Comision.usuario_id, Comision.id)
+    )
+
+    def filas():
+        usuario_anterior = None
+        for usuario_id, nombre, venta_id, abono_id, porcentaje, monto, fecha in detalle:
+            if usuario_id != usuario_anterior:
+                if usuario_anterior is not None:
+                    # Fila vacía entre empleados
+                    yield ('', '', '', '', '')
+                cantidad, total = totales.get(usuario_id, (0, 0))
+                # Fila de resumen del usuario
+                yield (nombre, 'TOTAL A PAGAR', cantidad, f"${total:,.0f}", periodo)
+                usuario_anterior = usuario_id
+
+            # Detalle de cada comisión
+            origen = "Venta" if venta_id else "Abono" if abono_id else "N/A"
+            yield (
+                '',
+                f"{origen} #{venta_id or abono_id or 'N/A'}",
+                f"{porcentaje}%",
+                f"${monto:,.0f}",
+                fecha.strftime('%d/%m/%Y'),
+            )
+        if usuario_anterior is not None:
+            yield ('', '', '', '', '')
+
+    return respuesta_exportacion(
+        f'liquidacion_comisiones_{fecha_inicio.strftime("%Y%m%d")}-{fecha_fin.strftime("%Y%m%d")}',
+        'Liquidación Comisiones',
+        ['EMPLEADO', 'CONCEPTO', 'CANTIDAD', 'MONTO', 'PERIODO'],
+        filas(),
+        anchos={'A': 20, 'B': 25, 'C': 15, 'D': 15, 'E': 20},
+    )
 
 # NUEVOS REPORTES
 @reportes_bp.route('/ventas', methods=['GET', 'POST'])
@@ -312,10 +350,10 @@ def ventas():
         if current_user.is_vendedor() and not current_user.is_admin():
             query = query.filter(Venta.vendedor_id == current_user.id)
         
-        ventas = query.all()
-        
         if 'export' in request.form:
-            return exportar_excel_ventas(ventas, fecha_inicio, fecha_fin)
+            return exportar_excel_ventas(query, fecha_inicio, fecha_fin)
+        
+        ventas = query.all()
         
         return render_template('reportes/ventas.html', ventas=ventas, 
                              fecha_inicio=fecha_inicio, fecha_fin=fecha_fin)
@@ -339,10 +377,10 @@ def abonos():
         if current_user.is_vendedor() and not current_user.is_admin():
             query = query.join(Venta).filter(Venta.vendedor_id == current_user.id)
         
-        abonos = query.all()
-        
         if 'export' in request.form:
-            return exportar_excel_abonos(abonos, fecha_inicio, fecha_fin)
+            return exportar_excel_abonos(query, fecha_inicio, fecha_fin)
+        
+        abonos = query.all()
         
         return render_template('reportes/abonos.html', abonos=abonos,
                              fecha_inicio=fecha_inicio, fecha_fin=fecha_fin)
@@ -360,11 +398,16 @@ def egresos():
         # Ajustar fecha_fin para incluir todo el día
         fecha_fin_completa = datetime.combine(fecha_fin, datetime.max.time())
         
-        egresos = MovimientoCaja.query.filter(
+        query = MovimientoCaja.query.filter(
             MovimientoCaja.tipo == 'salida',
             MovimientoCaja.fecha >= fecha_inicio,
             MovimientoCaja.fecha <= fecha_fin_completa
-        ).all()
+        )
+        
+        if 'export' in request.form:
+            return exportar_excel_egresos(query, fecha_inicio, fecha_fin)
+        
+        egresos = query.all()
         
         # DEBUG: Agregar información de debug
         current_app.logger.info(f"Buscando egresos desde {fecha_inicio} hasta {fecha_fin_completa}")
@@ -380,135 +423,157 @@ def egresos():
             for mov in todos_movimientos:
                 current_app.logger.info(f"Movimiento ID: {mov.id}, Tipo: {mov.tipo}, Fecha: {mov.fecha}, Monto: {mov.monto}")
         
-        if 'export' in request.form:
-            return exportar_excel_egresos(egresos, fecha_inicio, fecha_fin)
-        
         return render_template('reportes/egresos.html', egresos=egresos,
                              fecha_inicio=fecha_inicio, fecha_fin=fecha_fin)
     
     return render_template('reportes/egresos.html')
 
-def exportar_excel_comisiones(comisiones, fecha_inicio, fecha_fin):
+def exportar_excel_comisiones(query, fecha_inicio, fecha_fin):
     """Exporta las comisiones a un archivo Excel con formato correcto"""
-    data = []
-    for comision in comisiones:
-        origen = "N/A"
-        if hasattr(comision, 'venta_id') and comision.venta_id and comision.venta:
-            origen = f"Venta #{comision.venta_id} - {comision.venta.cliente.nombre}"
-        elif hasattr(comision, 'abono_id') and comision.abono_id and comision.abono:
-            origen = f"Abono #{comision.abono_id} - Venta #{comision.abono.venta_id}"
-            
-        data.append({
-            'ID': comision.id,
-            'Fecha': comision.fecha_generacion.strftime('%d/%m/%Y %H:%M'),
-            'Usuario': comision.usuario.nombre,
-            'Monto Base': int(comision.monto_base),
-            'Porcentaje': f"{comision.porcentaje}%",
-            'Monto Comision': int(comision.monto_comision),
-            'Periodo': comision.periodo,
-            'Origen': origen,
-            'Pagado': 'Si' if comision.pagado else 'No'
-        })
-    
-    df = pd.DataFrame(data)
-    
-    # Crear el archivo Excel en memoria
-    output = BytesIO()
-    with pd.ExcelWriter(output, engine='openpyxl') as writer:
-        df.to_excel(writer, sheet_name='Comisiones', index=False)
-    
-    output.seek(0)
-    
-    # Crear respuesta
-    response = make_response(output.getvalue())
-    response.headers['Content-Disposition'] = f'attachment; filename=comisiones_{fecha_inicio.strftime("%Y%m%d")}-{fecha_fin.strftime("%Y%m%d")}.xlsx'
-    response.headers['Content-Type'] = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
-    
-    return response
+    VentaComision = aliased(Venta)
+    filas_db = por_lotes(
+        query.outerjoin(VentaComision, VentaComision.id == Comision.venta_id)
+        .outerjoin(Cliente, Cliente.id == VentaComision.cliente_id)
+        .outerjoin(Abono, Abono.id == Comision.abono_id)
+        .with_entities(
+            Comision.id,
+            Comision.fecha_generacion,
+            Usuario.nombre,
+            Comision.monto_base,
+            Comision.porcentaje,
+            Comision.monto_comision,
+            Comision.periodo,
+            Comision.venta_id,
+            VentaComision.id,
+            Cliente.nombre,
+            Comision.abono_id,
+            Abono.id,
+            Abono.venta_id,
+            Comision.pagado,
+        )
+        .order_by(Comision.id)
+    )
+
+    def filas():
+        for (id, fecha, usuario, monto_base, porcentaje, monto_comision, periodo,
+             venta_id, venta_existe, cliente, abono_id, abono_existe, abono_venta_id,
+             pagado) in filas_db:
+            origen = "N/A"
+            if venta_id and venta_existe:
+                origen = f"Venta #{venta_id} - {cliente}"
+            elif abono_id and abono_existe:
+                origen = f"Abono #{abono_id} - Venta #{abono_venta_id}"
+            yield (
+                id,
+                fecha.strftime('%d/%m/%Y %H:%M'),
+                usuario,
+                int(monto_base),
+                f"{porcentaje}%",
+                int(monto_comision),
+                periodo,
+                origen,
+                'Si' if pagado else 'No',
+            )
 
-def exportar_excel_ventas(ventas, fecha_inicio, fecha_fin):
+    return respuesta_exportacion(
+        f'comisiones_{fecha_inicio.strftime("%Y%m%d")}-{fecha_fin.strftime("%Y%m%d")}',
+        'Comisiones',
+        ['ID', 'Fecha', 'Usuario', 'Monto Base', 'Porcentaje', 'Monto Comision',
+         'Periodo', 'Origen', 'Pagado'],
+        filas(),
+    )
+
+def exportar_excel_ventas(query, fecha_inicio, fecha_fin):
     """Exporta las ventas a Excel"""
-    data = []
-    for venta in ventas:
-        data.append({
-            'ID': venta.id,
-            'Fecha': venta.fecha.strftime('%d/%m/%Y %H:%M'),
-            'Cliente': venta.cliente.nombre,
-            'Vendedor': venta.vendedor.nombre,
-            'Tipo': venta.tipo.title(),
-            'Total': int(venta.total),
-            'Saldo Pendiente': int(venta.saldo_pendiente) if venta.saldo_pendiente else 0,
-            'Estado': venta.estado.title()
-        })
-    
-    df = pd.DataFrame(data)
-    
-    output = BytesIO()
-    with pd.ExcelWriter(output, engine='openpyxl') as writer:
-        df.to_excel(writer, sheet_name='Ventas', index=False)
-    
-    output.seek(0)
-    
-    response = make_response(output.getvalue())
-    response.headers['Content-Disposition'] = f'attachment; filename=ventas_{fecha_inicio.strftime("%Y%m%d")}-{fecha_fin.strftime("%Y%m%d")}.xlsx'
-    response.headers['Content-Type'] = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
-    
-    return response
+    filas_db = por_lotes(
+        query.join(Cliente, Cliente.id == Venta.cliente_id)
+        .join(Usuario, Usuario.id == Venta.vendedor_id)
+        .with_entities(
+            Venta.id, Venta.fecha, Cliente.nombre, Usuario.nombre, Venta.tipo,
+            Venta.total, Venta.saldo_pendiente, Venta.estado,
+        )
+        .order_by(Venta.id)
+    )
+    filas = (
+        (
+            id,
+            fecha.strftime('%d/%m/%Y %H:%M'),
+            cliente,
+            vendedor,
+            tipo.title(),
+            int(total),
+            int(saldo_pendiente) if saldo_pendiente else 0,
+            estado.title(),
+        )
+        for id, fecha, cliente, vendedor, tipo, total, saldo_pendiente, estado in filas_db
+    )
+    return respuesta_exportacion(
+        f'ventas_{fecha_inicio.strftime("%Y%m%d")}-{fecha_fin.strftime("%Y%m%d")}',
+        'Ventas',
+        ['ID', 'Fecha', 'Cliente', 'Vendedor', 'Tipo', 'Total', 'Saldo Pendiente', 'Estado'],
+        filas,
+    )
 
-def exportar_excel_abonos(abonos, fecha_inicio, fecha_fin):
+def exportar_excel_abonos(query, fecha_inicio, fecha_fin):
     """Exporta los abonos a Excel"""
-    data = []
-    for abono in abonos:
-        data.append({
-            'ID': abono.id,
-            'Fecha': abono.fecha.strftime('%d/%m/%Y %H:%M'),
-            'Cliente': abono.venta.cliente.nombre if abono.venta else 'N/A',
-            'Factura': f"#{abono.venta_id}" if abono.venta_id else 'N/A',
-            'Monto': int(abono.monto),
-            'Cobrador': abono.cobrador.nombre,
-            'Caja': abono.caja.nombre if abono.caja else 'N/A',
-            'Notas': abono.notas or 'Sin notas'
-        })
-    
-    df = pd.DataFrame(data)
-    
-    output = BytesIO()
-    with pd.ExcelWriter(output, engine='openpyxl') as writer:
-        df.to_excel(writer, sheet_name='Abonos', index=False)
-    
-    output.seek(0)
-    
-    response = make_response(output.getvalue())
-    response.headers['Content-Disposition'] = f'attachment; filename=abonos_{fecha_inicio.strftime("%Y%m%d")}-{fecha_fin.strftime("%Y%m%d")}.xlsx'
-    response.headers['Content-Type'] = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
-    
-    return response
+    VentaAbono = aliased(Venta)
+    filas_db = por_lotes(
+        query.outerjoin(VentaAbono, VentaAbono.id == Abono.venta_id)
+        .outerjoin(Cliente, Cliente.id == VentaAbono.cliente_id)
+        .outerjoin(Usuario, Usuario.id == Abono.cobrador_id)
+        .outerjoin(Caja, Caja.id == Abono.caja_id)
+        .with_entities(
+            Abono.id, Abono.fecha, VentaAbono.id, Cliente.nombre, Abono.venta_id,
+            Abono.monto, Usuario.nombre, Caja.nombre, Abono.notas,
+        )
+        .order_by(Abono.id)
+    )
+    filas = (
+        (
+            id,
+            fecha.strftime('%d/%m/%Y %H:%M'),
+            cliente if venta_existe else 'N/A',
+            f"#{venta_id}" if venta_id else 'N/A',
+            int(monto),
+            cobrador,
+            caja or 'N/A',
+            notas or 'Sin notas',
+        )
+        for id, fecha, venta_existe, cliente, venta_id, monto, cobrador, caja, notas in filas_db
+    )
+    return respuesta_exportacion(
+        f'abonos_{fecha_inicio.strftime("%Y%m%d")}-{fecha_fin.strftime("%Y%m%d")}',
+        'Abonos',
+        ['ID', 'Fecha', 'Cliente', 'Factura', 'Monto', 'Cobrador', 'Caja', 'Notas'],
+        filas,
+    )
 
-def exportar_excel_egresos(egresos, fecha_inicio, fecha_fin):
+def exportar_excel_egresos(query, fecha_inicio, fecha_fin):
     """Exporta los egresos a Excel"""
-    data = []
-    for egreso in egresos:
-        data.append({
-            'ID': egreso.id,
-            'Fecha': egreso.fecha.strftime('%d/%m/%Y %H:%M'),
-            'Caja': egreso.caja.nombre,
-            'Monto': int(egreso.monto),
-            'Descripcion': egreso.descripcion or 'Sin descripcion'
-        })
-    
-    df = pd.DataFrame(data)
-    
-    output = BytesIO()
-    with pd.ExcelWriter(output, engine='openpyxl') as writer:
-        df.to_excel(writer, sheet_name='Egresos', index=False)
-    
-    output.seek(0)
-    
-    response = make_response(output.getvalue())
-    response.headers['Content-Disposition'] = f'attachment; filename=egresos_{fecha_inicio.strftime("%Y%m%d")}-{fecha_fin.strftime("%Y%m%d")}.xlsx'
-    response.headers['Content-Type'] = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
-    
-    return response
+    filas_db = por_lotes(
+        query.join(Caja, Caja.id == MovimientoCaja.caja_id)
+        .with_entities(
+            MovimientoCaja.id, MovimientoCaja.fecha, Caja.nombre,
+            MovimientoCaja.monto, MovimientoCaja.descripcion,
+        )
+        .order_by(MovimientoCaja.id)
+    )
+    filas = (
+        (
+            id,
+            fecha.strftime('%d/%m/%Y %H:%M'),
+            caja,
+            int(monto),
+            descripcion or 'Sin descripcion',
+        )
+        for id, fecha, caja, monto, descripcion in filas_db
+    )
+    return respuesta_exportacion(
+        f'egresos_{fecha_inicio.strftime("%Y%m%d")}-{fecha_fin.strftime("%Y%m%d")}',
+        'Egresos',
+        ['ID', 'Fecha', 'Caja', 'Monto', 'Descripcion'],
+        filas,
+    )
 
 @reportes_bp.route('/creditos', methods=['GET', 'POST'])
 @login_required
@@ -528,41 +593,46 @@ def creditos():
         if current_user.is_vendedor() and not current_user.is_admin():
             query = query.filter(Venta.vendedor_id == current_user.id)
         
-        creditos = query.all()
-        
         if 'export' in request.form:
-            return exportar_excel_creditos(creditos, fecha_inicio, fecha_fin)
+            return exportar_excel_creditos(query, fecha_inicio, fecha_fin)
+        
+        creditos = query.all()
         
         return render_template('reportes/creditos.html', creditos=creditos,
                              fecha_inicio=fecha_inicio, fecha_fin=fecha_fin)
     
     return render_template('reportes/creditos.html')
 
-def exportar_excel_creditos(creditos, fecha_inicio, fecha_fin):
+def exportar_excel_creditos(query, fecha_inicio, fecha_fin):
     """Exporta los créditos a Excel"""
-    data = []
-    for credito in creditos:
-        data.append({
-            'ID': credito.id,
-            'Fecha': credito.fecha.strftime('%d/%m/%Y %H:%M'),
-            'Cliente': credito.cliente.nombre,
-            'Vendedor': credito.vendedor.nombre,
-            'Total': int(credito.total),
-            'Saldo Pendiente': int(credito.saldo_pendiente) if credito.saldo_pendiente else 0,
-            'Estado': credito.estado.title(),
-            'Días Transcurridos': (datetime.now() - credito.fecha).days
-        })
-    
-    df = pd.DataFrame(data)
-    
-    output = BytesIO()
-    with pd.ExcelWriter(output, engine='openpyxl') as writer:
-        df.to_excel(writer, sheet_name='Créditos', index=False)
-    
-    output.seek(0)
-    
-    response = make_response(output.getvalue())
-    response.headers['Content-Disposition'] = f'attachment; filename=creditos_{fecha_inicio.strftime("%Y%m%d")}-{fecha_fin.strftime("%Y%m%d")}.xlsx'
-    response.headers['Content-Type'] = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
-    
-    return response
+    ahora = datetime.now()
+    filas_db = por_lotes(
+        query.join(Cliente, Cliente.id == Venta.cliente_id)
+        .join(Usuario, Usuario.id == Venta.vendedor_id)
+        .with_entities(
+            Venta.id, Venta.fecha, Cliente.nombre, Usuario.nombre, Venta.total,
+            Venta.saldo_pendiente, Venta.estado,
+        )
+        .order_by(Venta.id)
+    )
+    filas = (
+        (
+            id,
+            fecha.strftime('%d/%m/%Y %H:%M'),
+            cliente,
+            vendedor,
+            int(total),
+            int(saldo_pendiente) if saldo_pendiente else 0,
+            estado.title(),
+            (ahora - fecha).days,
+        )
+        for id, fecha, cliente, vendedor, total, saldo_pendiente, estado in filas_db
+    )
+    return respuesta_exportacion(
+        f'creditos_{fecha_inicio.strftime("%Y%m%d")}-{fecha_fin.strftime("%Y%m%d")}',
+        'Créditos',
+        ['ID', 'Fecha', 'Cliente', 'Vendedor', 'Total', 'Saldo Pendiente', 'Estado',
+         'Días Transcurridos'],
+        filas,
+    )
+
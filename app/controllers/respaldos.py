@@ -3,8 +3,8 @@ from flask_login import login_required, current_user
 from app import db
 from app.models import *
 from app.decorators import admin_required
-import pandas as pd
-from io import BytesIO
+from app.metricas import estadisticas_sistema
+from app.exportacion import por_lotes, formato_solicitado, respuesta_csv, respuesta_libro
 from datetime import datetime
 import traceback
 
@@ -17,270 +17,224 @@ def index():
     """Panel principal de respaldos con estadísticas del sistema"""
     try:
         # Obtener estadísticas del sistema
-        estadisticas = {
-            'usuarios': Usuario.query.count(),
-            'clientes': Cliente.query.count(),
-            'productos': Producto.query.count(),
-            'ventas': Venta.query.count(),
-            'abonos': Abono.query.count(),
-            'comisiones': Comision.query.count(),
-            'cajas': Caja.query.count(),
-            'movimientos_caja': MovimientoCaja.query.count()
-        }
-        return render_template('respaldos/index.html', estadisticas=estadisticas)
+        estadisticas = estadisticas_sistema()
+        return render_template('respaldos/index.html', estadisticas=estadisticas,
+                               temas_contadores='respaldos')
     except Exception as e:
         current_app.logger.error(f"Error obteniendo estadísticas del sistema: {e}")
         estadisticas = {}
-        return render_template('respaldos/index.html', estadisticas=estadisticas)
+        return render_template('respaldos/index.html', estadisticas=estadisticas,
+                               temas_contadores='respaldos')
+
+def _fecha(valor):
+    return valor.strftime('%Y-%m-%d %H:%M:%S') if valor else None
+
+
+def _secciones_respaldo():
+    """
+    Tablas del respaldo: [(hoja, columnas, filas)]. Las filas son generadores que
+    leen la base por lotes recién cuando se escriben (Excel o CSV).
+    """
+    secciones = []
+
+    # 1. CONFIGURACIÓN
+    config = Configuracion.query.first()
+    if config:
+        secciones.append(('Configuracion', [
+            'id', 'nombre_empresa', 'direccion', 'telefono', 'moneda', 'iva',
+            'porcentaje_comision_vendedor', 'porcentaje_comision_cobrador',
+            'periodo_comision', 'min_password'
+        ], [(
+            config.id, config.nombre_empresa, config.direccion, config.telefono,
+            config.moneda, config.iva, config.porcentaje_comision_vendedor,
+            config.porcentaje_comision_cobrador, config.periodo_comision,
+            config.min_password
+        )]))
+
+    # 2. USUARIOS
+    secciones.append(('Usuarios', ['id', 'nombre', 'email', 'rol', 'fecha_creacion'], (
+        (u.id, u.nombre, u.email, u.rol, _fecha(getattr(u, 'fecha_creacion', None)))
+        for u in por_lotes(Usuario.query.order_by(Usuario.id))
+    )))
+
+    # 3. CLIENTES
+    secciones.append(('Clientes', ['id', 'nombre', 'telefono', 'direccion', 'email', 'fecha_creacion'], (
+        (c.id, c.nombre, c.telefono, c.direccion, c.email, _fecha(getattr(c, 'fecha_creacion', None)))
+        for c in por_lotes(Cliente.query.order_by(Cliente.id))
+    )))
+
+    # 4. PRODUCTOS
+    secciones.append(('Productos', [
+        'id', 'codigo', 'nombre', 'descripcion', 'precio_compra', 'precio_venta',
+        'stock', 'stock_minimo', 'tiene_precio_individual', 'precio_individual',
+        'precio_kit', 'cantidad_kit', 'fecha_registro'
+    ], (
+        (
+            p.id, p.codigo, p.nombre, p.descripcion, p.precio_compra, p.precio_venta,
+            p.stock, getattr(p, 'stock_minimo', 0),
+            getattr(p, 'tiene_precio_individual', False),
+            getattr(p, 'precio_individual', None), getattr(p, 'precio_kit', None),
+            getattr(p, 'cantidad_kit', 1), _fecha(p.fecha_registro)
+        )
+        for p in por_lotes(Producto.query.order_by(Producto.id))
+    )))
+
+    # 5. CAJAS
+    secciones.append(('Cajas', ['id', 'nombre', 'tipo', 'saldo_inicial', 'saldo_actual', 'fecha_apertura'], (
+        (c.id, c.nombre, c.tipo, c.saldo_inicial, c.saldo_actual, _fecha(c.fecha_apertura))
+        for c in por_lotes(Caja.query.order_by(Caja.id))
+    )))
+
+    # 6. VENTAS (nombres de cliente y vendedor en la misma consulta)
+    ventas = (
+        Venta.query.outerjoin(Cliente, Cliente.id == Venta.cliente_id)
+        .outerjoin(Usuario, Usuario.id == Venta.vendedor_id)
+        .add_columns(Cliente.nombre, Usuario.nombre)
+        .order_by(Venta.id)
+    )
+    secciones.append(('Ventas', [
+        'id', 'fecha', 'cliente_id', 'cliente_nombre', 'vendedor_id', 'vendedor_nombre',
+        'tipo', 'total', 'saldo_pendiente', 'estado', 'numero_cuotas',
+        'frecuencia_pago', 'valor_cuota', 'observaciones'
+    ], (
+        (
+            v.id, _fecha(v.fecha), v.cliente_id, cliente or 'N/A', v.vendedor_id,
+            vendedor or 'N/A', v.tipo, v.total, v.saldo_pendiente, v.estado,
+            getattr(v, 'numero_cuotas', None), getattr(v, 'frecuencia_pago', None),
+            getattr(v, 'valor_cuota', None), getattr(v, 'observaciones', None)
+        )
+        for v, cliente, vendedor in por_lotes(ventas)
+    )))
+
+    # 7. DETALLE VENTAS
+    detalles = (
+        DetalleVenta.query.outerjoin(Producto, Producto.id == DetalleVenta.producto_id)
+        .add_columns(Producto.codigo, Producto.nombre)
+        .order_by(DetalleVenta.id)
+    )
+    secciones.append(('VentasDetalle', [
+        'id', 'venta_id', 'producto_id', 'producto_codigo', 'producto_nombre',
+        'cantidad', 'precio_unitario', 'subtotal'
+    ], (
+        (
+            d.id, d.venta_id, d.producto_id, codigo or 'N/A', nombre or 'N/A',
+            d.cantidad, d.precio_unitario, d.subtotal
+        )
+        for d, codigo, nombre in por_lotes(detalles)
+    )))
+
+    # 8. ABONOS
+    abonos = (
+        Abono.query.outerjoin(Venta, Venta.id == Abono.venta_id)
+        .outerjoin(Cliente, Cliente.id == Venta.cliente_id)
+        .outerjoin(Usuario, Usuario.id == Abono.cobrador_id)
+        .outerjoin(Caja, Caja.id == Abono.caja_id)
+        .add_columns(Cliente.nombre, Usuario.nombre, Caja.nombre)
+        .order_by(Abono.id)
+    )
+    secciones.append(('Abonos', [
+        'id', 'venta_id', 'cliente_nombre', 'cobrador_id', 'cobrador_nombre', 'monto',
+        'fecha', 'caja_id', 'caja_nombre', 'notas'
+    ], (
+        (
+            a.id, a.venta_id, cliente or 'N/A', a.cobrador_id, cobrador or 'N/A',
+            a.monto, _fecha(a.fecha), a.caja_id, caja or 'N/A', a.notas
+        )
+        for a, cliente, cobrador, caja in por_lotes(abonos)
+    )))
+
+    # 9. COMISIONES
+    comisiones = (
+        Comision.query.outerjoin(Usuario, Usuario.id == Comision.usuario_id)
+        .add_columns(Usuario.nombre)
+        .order_by(Comision.id)
+    )
+    secciones.append(('Comisiones', [
+        'id', 'usuario_id', 'usuario_nombre', 'monto_base', 'porcentaje',
+        'monto_comision', 'periodo', 'pagado', 'fecha_generacion', 'venta_id', 'abono_id'
+    ], (
+        (
+            c.id, c.usuario_id, usuario or 'N/A', c.monto_base, c.porcentaje,
+            c.monto_comision, c.periodo, c.pagado, _fecha(c.fecha_generacion),
+            c.venta_id, c.abono_id
+        )
+        for c, usuario in por_lotes(comisiones)
+    )))
+
+    # 10. MOVIMIENTOS DE CAJA
+    movimientos = (
+        MovimientoCaja.query.outerjoin(Caja, Caja.id == MovimientoCaja.caja_id)
+        .add_columns(Caja.nombre)
+        .order_by(MovimientoCaja.id)
+    )
+    secciones.append(('MovimientosCaja', [
+        'id', 'caja_id', 'caja_nombre', 'tipo', 'monto', 'descripcion', 'fecha',
+        'venta_id', 'abono_id', 'caja_destino_id'
+    ], (
+        (
+            m.id, m.caja_id, caja or 'N/A', m.tipo, m.monto, m.descripcion, _fecha(m.fecha),
+            getattr(m, 'venta_id', None), getattr(m, 'abono_id', None),
+            getattr(m, 'caja_destino_id', None)
+        )
+        for m, caja in por_lotes(movimientos)
+    )))
+
+    # 11. RESUMEN EJECUTIVO
+    def resumen():
+        yield (
+            _fecha(datetime.now()),
+            current_user.email,
+            Usuario.query.count(),
+            Cliente.query.count(),
+            Producto.query.count(),
+            Venta.query.count(),
+            Abono.query.count(),
+            Comision.query.count(),
+            Caja.query.count(),
+            MovimientoCaja.query.count(),
+            Venta.query.filter(Venta.saldo_pendiente > 0).count(),
+            Comision.query.filter(Comision.pagado == False).count(),
+        )
+
+    secciones.append(('RESUMEN_RESPALDO', [
+        'fecha_respaldo', 'generado_por', 'total_usuarios', 'total_clientes',
+        'total_productos', 'total_ventas', 'total_abonos', 'total_comisiones',
+        'total_cajas', 'total_movimientos_caja', 'ventas_pendientes',
+        'comisiones_pendientes'
+    ], resumen()))
+
+    return secciones
+
 
 @respaldos_bp.route('/exportar-completo')
 @login_required
 @admin_required
 def exportar_completo():
-    """Exporta toda la información del sistema a Excel"""
+    """
+    Exporta toda la información del sistema a Excel (una hoja por tabla) o, con
+    ?formato=csv / csv.gz, a un CSV con una sección por tabla que se envía a
+    medida que se genera.
+    """
     try:
-        # Crear el archivo Excel en memoria
-        output = BytesIO()
-        
-        with pd.ExcelWriter(output, engine='openpyxl') as writer:
-            
-            # 1. CONFIGURACIÓN
-            try:
-                config = Configuracion.query.first()
-                if config:
-                    config_data = [{
-                        'id': config.id,
-                        'nombre_empresa': config.nombre_empresa,
-                        'direccion': config.direccion,
-                        'telefono': config.telefono,
-                        'moneda': config.moneda,
-                        'iva': config.iva,
-                        'porcentaje_comision_vendedor': config.porcentaje_comision_vendedor,
-                        'porcentaje_comision_cobrador': config.porcentaje_comision_cobrador,
-                        'periodo_comision': config.periodo_comision,
-                        'min_password': config.min_password
-                    }]
-                    pd.DataFrame(config_data).to_excel(writer, sheet_name='Configuracion', index=False)
-            except Exception as e:
-                current_app.logger.error(f"Error exportando configuración: {e}")
-            
-            # 2. USUARIOS
-            try:
-                usuarios = Usuario.query.all()
-                usuarios_data = []
-                for usuario in usuarios:
-                    usuarios_data.append({
-                        'id': usuario.id,
-                        'nombre': usuario.nombre,
-                        'email': usuario.email,
-                        'rol': usuario.rol,
-                        'fecha_creacion': usuario.fecha_creacion.strftime('%Y-%m-%d %H:%M:%S') if usuario.fecha_creacion else None
-                    })
-                pd.DataFrame(usuarios_data).to_excel(writer, sheet_name='Usuarios', index=False)
-            except Exception as e:
-                current_app.logger.error(f"Error exportando usuarios: {e}")
-            
-            # 3. CLIENTES
-            try:
-                clientes = Cliente.query.all()
-                clientes_data = []
-                for cliente in clientes:
-                    clientes_data.append({
-                        'id': cliente.id,
-                        'nombre': cliente.nombre,
-                        'telefono': cliente.telefono,
-                        'direccion': cliente.direccion,
-                        'email': cliente.email,
-                        'fecha_creacion': cliente.fecha_creacion.strftime('%Y-%m-%d %H:%M:%S') if cliente.fecha_creacion else None
-                    })
-                pd.DataFrame(clientes_data).to_excel(writer, sheet_name='Clientes', index=False)
-            except Exception as e:
-                current_app.logger.error(f"Error exportando clientes: {e}")
-            
-            # 4. PRODUCTOS
-            try:
-                productos = Producto.query.all()
-                productos_data = []
-                for producto in productos:
-                    productos_data.append({
-                        'id': producto.id,
-                        'codigo': producto.codigo,
-                        'nombre': producto.nombre,
-                        'descripcion': producto.descripcion,
-                        'precio_compra': producto.precio_compra,
-                        'precio_venta': producto.precio_venta,
-                        'stock': producto.stock,
-                        'stock_minimo': getattr(producto, 'stock_minimo', 0),
-                        'tiene_precio_individual': getattr(producto, 'tiene_precio_individual', False),
-                        'precio_individual': getattr(producto, 'precio_individual', None),
-                        'precio_kit': getattr(producto, 'precio_kit', None),
-                        'cantidad_kit': getattr(producto, 'cantidad_kit', 1),
-                        'fecha_registro': producto.fecha_registro.strftime('%Y-%m-%d %H:%M:%S') if producto.fecha_registro else None
-                    })
-                pd.DataFrame(productos_data).to_excel(writer, sheet_name='Productos', index=False)
-            except Exception as e:
-                current_app.logger.error(f"Error exportando productos: {e}")
-            
-            # 5. CAJAS
-            try:
-                cajas = Caja.query.all()
-                cajas_data = []
-                for caja in cajas:
-                    cajas_data.append({
-                        'id': caja.id,
-                        'nombre': caja.nombre,
-                        'tipo': caja.tipo,
-                        'saldo_inicial': caja.saldo_inicial,
-                        'saldo_actual': caja.saldo_actual,
-                        'fecha_apertura': caja.fecha_apertura.strftime('%Y-%m-%d %H:%M:%S') if caja.fecha_apertura else None
-                    })
-                pd.DataFrame(cajas_data).to_excel(writer, sheet_name='Cajas', index=False)
-            except Exception as e:
-                current_app.logger.error(f"Error exportando cajas: {e}")
-            
-            # 6. VENTAS
-            try:
-                ventas = Venta.query.all()
-                ventas_data = []
-                for venta in ventas:
-                    ventas_data.append({
-                        'id': venta.id,
-                        'fecha': venta.fecha.strftime('%Y-%m-%d %H:%M:%S'),
-                        'cliente_id': venta.cliente_id,
-                        'cliente_nombre': venta.cliente.nombre if venta.cliente else 'N/A',
-                        'vendedor_id': venta.vendedor_id,
-                        'vendedor_nombre': venta.vendedor.nombre if venta.vendedor else 'N/A',
-                        'tipo': venta.tipo,
-                        'total': venta.total,
-                        'saldo_pendiente': venta.saldo_pendiente,
-                        'estado': venta.estado,
-                        'numero_cuotas': getattr(venta, 'numero_cuotas', None),
-                        'frecuencia_pago': getattr(venta, 'frecuencia_pago', None),
-                        'valor_cuota': getattr(venta, 'valor_cuota', None),
-                        'observaciones': getattr(venta, 'observaciones', None)
-                    })
-                pd.DataFrame(ventas_data).to_excel(writer, sheet_name='Ventas', index=False)
-            except Exception as e:
-                current_app.logger.error(f"Error exportando ventas: {e}")
-            
-            # 7. DETALLE VENTAS
-            try:
-                detalles = DetalleVenta.query.all()
-                detalles_data = []
-                for detalle in detalles:
-                    detalles_data.append({
-                        'id': detalle.id,
-                        'venta_id': detalle.venta_id,
-                        'producto_id': detalle.producto_id,
-                        'producto_codigo': detalle.producto.codigo if detalle.producto else 'N/A',
-                        'producto_nombre': detalle.producto.nombre if detalle.producto else 'N/A',
-                        'cantidad': detalle.cantidad,
-                        'precio_unitario': detalle.precio_unitario,
-                        'subtotal': detalle.subtotal
-                    })
-                pd.DataFrame(detalles_data).to_excel(writer, sheet_name='VentasDetalle', index=False)
-            except Exception as e:
-                current_app.logger.error(f"Error exportando detalles de ventas: {e}")
-            
-            # 8. ABONOS
-            try:
-                abonos = Abono.query.all()
-                abonos_data = []
-                for abono in abonos:
-                    abonos_data.append({
-                        'id': abono.id,
-                        'venta_id': abono.venta_id,
-                        'cliente_nombre': abono.cliente.nombre if abono.cliente else 'N/A',
-                        'cobrador_id': abono.cobrador_id,
-                        'cobrador_nombre': abono.cobrador.nombre if abono.cobrador else 'N/A',
-                        'monto': abono.monto,
-                        'fecha': abono.fecha.strftime('%Y-%m-%d %H:%M:%S'),
-                        'caja_id': getattr(abono, 'caja_id', None),
-                        'caja_nombre': abono.caja.nombre if hasattr(abono, 'caja') and abono.caja else 'N/A',
-                        'notas': getattr(abono, 'notas', None)
-                    })
-                pd.DataFrame(abonos_data).to_excel(writer, sheet_name='Abonos', index=False)
-            except Exception as e:
-                current_app.logger.error(f"Error exportando abonos: {e}")
-            
-            # 9. COMISIONES
-            try:
-                comisiones = Comision.query.all()
-                comisiones_data = []
-                for comision in comisiones:
-                    comisiones_data.append({
-                        'id': comision.id,
-                        'usuario_id': comision.usuario_id,
-                        'usuario_nombre': comision.usuario.nombre if comision.usuario else 'N/A',
-                        'monto_base': comision.monto_base,
-                        'porcentaje': comision.porcentaje,
-                        'monto_comision': comision.monto_comision,
-                        'periodo': comision.periodo,
-                        'pagado': comision.pagado,
-                        'fecha_generacion': comision.fecha_generacion.strftime('%Y-%m-%d %H:%M:%S') if comision.fecha_generacion else None,
-                        'venta_id': getattr(comision, 'venta_id', None),
-                        'abono_id': getattr(comision, 'abono_id', None)
-                    })
-                pd.DataFrame(comisiones_data).to_excel(writer, sheet_name='Comisiones', index=False)
-            except Exception as e:
-                current_app.logger.error(f"Error exportando comisiones: {e}")
-            
-            # 10. MOVIMIENTOS DE CAJA
-            try:
-                movimientos = MovimientoCaja.query.all()
-                movimientos_data = []
-                for movimiento in movimientos:
-                    movimientos_data.append({
-                        'id': movimiento.id,
-                        'caja_id': movimiento.caja_id,
-                        'caja_nombre': movimiento.caja.nombre if movimiento.caja else 'N/A',
-                        'tipo': movimiento.tipo,
-                        'monto': movimiento.monto,
-                        'descripcion': movimiento.descripcion,
-                        'fecha': movimiento.fecha.strftime('%Y-%m-%d %H:%M:%S'),
-                        'venta_id': getattr(movimiento, 'venta_id', None),
-                        'abono_id': getattr(movimiento, 'abono_id', None),
-                        'caja_destino_id': getattr(movimiento, 'caja_destino_id', None)
-                    })
-                pd.DataFrame(movimientos_data).to_excel(writer, sheet_name='MovimientosCaja', index=False)
-            except Exception as e:
-                current_app.logger.error(f"Error exportando movimientos de caja: {e}")
-            
-            # 11. RESUMEN EJECUTIVO
-            try:
-                fecha_actual = datetime.now()
-                resumen_data = [{
-                    'fecha_respaldo': fecha_actual.strftime('%Y-%m-%d %H:%M:%S'),
-                    'generado_por': current_user.email,
-                    'total_usuarios': Usuario.query.count(),
-                    'total_clientes': Cliente.query.count(),
-                    'total_productos': Producto.query.count(),
-                    'total_ventas': Venta.query.count(),
-                    'total_abonos': Abono.query.count(),
-                    'total_comisiones': Comision.query.count(),
-                    'total_cajas': Caja.query.count(),
-                    'total_movimientos_caja': MovimientoCaja.query.count(),
-                    'ventas_pendientes': Venta.query.filter(Venta.saldo_pendiente > 0).count(),
-                    'comisiones_pendientes': Comision.query.filter(Comision.pagado == False).count()
-                }]
-                pd.DataFrame(resumen_data).to_excel(writer, sheet_name='RESUMEN_RESPALDO', index=False)
-            except Exception as e:
-                current_app.logger.error(f"Error generando resumen: {e}")
-        
-        output.seek(0)
-        
-        # Crear respuesta de descarga
         fecha_actual = datetime.now().strftime('%Y%m%d_%H%M%S')
-        filename = f'respaldo_creditapp_{fecha_actual}.xlsx'
-        
-        response = make_response(output.getvalue())
-        response.headers['Content-Disposition'] = f'attachment; filename={filename}'
-        response.headers['Content-Type'] = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
-        
+        nombre_base = f'respaldo_creditapp_{fecha_actual}'
+        formato = formato_solicitado()
+        secciones = _secciones_respaldo()
+
+        if formato in ('csv', 'csv.gz'):
+            response = respuesta_csv(nombre_base, secciones, comprimir=formato == 'csv.gz')
+            filename = f'{nombre_base}.{formato}'
+        else:
+            filename = f'{nombre_base}.xlsx'
+            response = respuesta_libro(
+                filename,
+                [(hoja, columnas, filas, None) for hoja, columnas, filas in secciones],
+            )
+
         current_app.logger.info(f"Respaldo completo generado por usuario {current_user.email}: {filename}")
         flash(f'Respaldo generado exitosamente: {filename}', 'success')
         return response
-        
+
     except Exception as e:
         current_app.logger.error(f"Error al generar respaldo completo: {e}")
         current_app.logger.error(traceback.format_exc())
@@ -293,17 +247,8 @@ def exportar_completo():
 def api_estadisticas():
     """API para obtener estadísticas actualizadas del sistema"""
     try:
-        estadisticas = {
-            'usuarios': Usuario.query.count(),
-            'clientes': Cliente.query.count(),
-            'productos': Producto.query.count(),
-            'ventas': Venta.query.count(),
-            'abonos': Abono.query.count(),
-            'comisiones': Comision.query.count(),
-            'cajas': Caja.query.count(),
-            'movimientos_caja': MovimientoCaja.query.count(),
-            'ultima_actualizacion': datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-        }
+        estadisticas = estadisticas_sistema()
+        estadisticas['ultima_actualizacion'] = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
         return estadisticas
     except Exception as e:
         current_app.logger.error(f"Error obteniendo estadísticas via API: {e}")
@@ -12,6 +12,14 @@ from flask_login import login_required, current_user
 from app import db
 from app.models import Venta, Usuario, TransferenciaVenta, Abono, Comision
 from app.decorators import admin_required
+from app.gestores import con_gestor
+from app.paginacion import paginar_keyset, totales_listado
+from app.transferencias_cartera import (
+    ROLES_DESTINO,
+    previsualizar_transferencia,
+    transferir_cartera,
+    validar_destino,
+)
 from datetime import datetime
 import logging
 
@@ -25,31 +33,22 @@ transferencias_bp = Blueprint("transferencias", __name__, url_prefix="/transfere
 def index():
     """Lista todas las ventas transferibles y el historial de transferencias"""
     try:
-        # Obtener ventas transferibles (solo créditos activos)
-        ventas_transferibles = (
+        # Ventas transferibles (solo créditos activos) con su gestor resuelto en
+        # la misma consulta; las que no tienen gestor válido quedan fuera
+        query = con_gestor(
             Venta.query.filter(
                 Venta.tipo == "credito",
                 Venta.saldo_pendiente > 0,
                 Venta.estado == "pendiente",
             )
-            .order_by(Venta.fecha.desc())
-            .all()
         )
-
-        # Filtrar ventas que tengan gestor válido
-        ventas_validas = []
-        for venta in ventas_transferibles:
-            try:
-                gestor_info = venta.obtener_gestor_seguro()
-                if gestor_info["usuario"]:
-                    ventas_validas.append(venta)
-                else:
-                    logger.warning(
-                        f"Venta {venta.id} no tiene gestor válido: {gestor_info.get('error', 'Gestor no encontrado')}"
-                    )
-            except Exception as e:
-                logger.error(f"Error verificando gestor para venta {venta.id}: {e}")
-                continue
+        totales = totales_listado(query, cantidad=db.func.count(Venta.id))
+        pagina = paginar_keyset(
+            query.options(
+                db.joinedload(Venta.cliente), db.joinedload(Venta.vendedor_original)
+            ),
+            [Venta.fecha, Venta.id],
+        )
 
         # Obtener historial de transferencias
         transferencias = (
@@ -60,7 +59,9 @@ def index():
 
         return render_template(
             "transferencias/index.html",
-            ventas_transferibles=ventas_validas,
+            ventas_transferibles=pagina.items,
+            total_transferibles=totales["cantidad"],
+            pagina=pagina,
             transferencias=transferencias,
         )
     except Exception as e:
@@ -227,6 +228,93 @@ def ejecutar_transferencia():
         return redirect(url_for("transferencias.index"))
 
 
+def _leer_ids_ventas(texto):
+    """Ids de venta escritos separados por comas, espacios o saltos de línea"""
+    texto = (texto or "").replace(",", " ").replace("#", " ")
+    return sorted({int(parte) for parte in texto.split()})
+
+
+@transferencias_bp.route("/masiva", methods=["GET", "POST"])
+@login_required
+@admin_required
+def transferencia_masiva():
+    """Transfiere la cartera de un usuario (o una lista de ventas) a otro usuario"""
+    usuarios_origen = (
+        Usuario.query.filter(Usuario.rol.in_(["vendedor", "cobrador", "administrador"]))
+        .order_by(Usuario.activo.desc(), Usuario.nombre)
+        .all()
+    )
+    usuarios_destino = (
+        Usuario.query.filter(
+            Usuario.rol.in_(ROLES_DESTINO),
+            Usuario.activo == True,
+        )
+        .order_by(Usuario.nombre)
+        .all()
+    )
+
+    datos = {
+        "origen_id": request.form.get("origen_id", type=int),
+        "destino_id": request.form.get("destino_id", type=int),
+        "venta_ids": request.form.get("venta_ids", "").strip(),
+        "motivo": request.form.get("motivo", "").strip(),
+    }
+    resumen = None
+
+    if request.method == "POST":
+        try:
+            venta_ids = _leer_ids_ventas(datos["venta_ids"])
+        except ValueError:
+            flash("La lista de ventas solo puede contener números de venta", "danger")
+            venta_ids = None
+        else:
+            try:
+                destino = Usuario.query.get(datos["destino_id"]) if datos["destino_id"] else None
+                validar_destino(destino)
+
+                if request.form.get("accion") == "ejecutar":
+                    resultado = transferir_cartera(
+                        destino,
+                        current_user.id,
+                        motivo=datos["motivo"] or None,
+                        origen_id=datos["origen_id"],
+                        venta_ids=venta_ids,
+                    )
+                    db.session.commit()
+                    if resultado["cantidad"]:
+                        flash(
+                            f"{resultado['cantidad']} ventas transferidas a {destino.nombre} "
+                            f"(saldo ${resultado['saldo']:,})",
+                            "success",
+                        )
+                        current_app.logger.info(
+                            f"Transferencia masiva - {resultado['cantidad']} ventas -> "
+                            f"{destino.nombre} por {current_user.nombre}"
+                        )
+                    else:
+                        flash("No hay ventas para transferir con esos criterios", "warning")
+                    return redirect(url_for("transferencias.index"))
+
+                resumen = previsualizar_transferencia(
+                    datos["origen_id"], venta_ids, destino.id
+                )
+            except ValueError as e:
+                db.session.rollback()
+                flash(str(e), "danger")
+            except Exception as e:
+                db.session.rollback()
+                current_app.logger.error(f"Error en transferencia masiva: {e}")
+                flash(f"Error al transferir la cartera: {str(e)}", "danger")
+
+    return render_template(
+        "transferencias/masiva.html",
+        usuarios_origen=usuarios_origen,
+        usuarios_destino=usuarios_destino,
+        datos=datos,
+        resumen=resumen,
+    )
+
+
 @transferencias_bp.route("/historial/<int:venta_id>")
 @login_required
 @admin_required
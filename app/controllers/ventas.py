@@ -11,11 +11,29 @@ from flask import (
 )
 from flask_login import login_required, current_user
 from app import db
-from app.models import Venta, DetalleVenta, Producto, Cliente, Caja, MovimientoCaja
+from app.models import (
+    Venta,
+    DetalleVenta,
+    Producto,
+    Cliente,
+    Caja,
+    MovimientoCaja,
+    CuotaVenta,
+)
 from app.forms import VentaForm
 from app.decorators import vendedor_required, admin_required, cobrador_required
 from app.pdf.venta import generar_pdf_venta
 from app.utils import registrar_movimiento_caja, calcular_comision
+from app.resumen import resumir_venta, resumir_movimiento
+from app.cronograma import generar_cronograma
+from app.catalogo import catalogo_productos
+from app.inventario import agrupar_cantidades, bloquear_productos, descontar_stock
+from app.paginacion import paginar_keyset, totales_listado, contar_si, sumar_si
+from app.busqueda_clientes import (
+    filtro_clientes,
+    cliente_seleccionable,
+    opcion_cliente,
+)
 from datetime import datetime
 import traceback
 import json
@@ -43,7 +61,7 @@ def index():
         query = query.filter(Venta.vendedor_id == current_user.id)
 
     if busqueda:
-        query = query.join(Cliente).filter(Cliente.nombre.ilike(f"%{busqueda}%"))
+        query = query.join(Cliente).filter(filtro_clientes(busqueda))
 
     if desde_str:
         try:
@@ -67,28 +85,31 @@ def index():
     if estado_filtro:
         query = query.filter(Venta.estado == estado_filtro)
 
-    ventas = query.order_by(Venta.fecha.desc()).all()
-
-    # Calcular totales para el resumen
-    total_ventas_monto = sum(v.total for v in ventas)
-    ventas_a_credito_count = sum(1 for v in ventas if v.tipo == "credito")
-    saldo_pendiente_total = sum(
-        v.saldo_pendiente
-        for v in ventas
-        if v.tipo == "credito" and v.saldo_pendiente is not None
+    # Totales del resumen sobre todo el filtro (una consulta agregada)
+    totales = totales_listado(
+        query,
+        cantidad=db.func.count(Venta.id),
+        monto=db.func.sum(Venta.total),
+        creditos=contar_si(Venta.tipo == "credito"),
+        saldo=sumar_si(Venta.tipo == "credito", Venta.saldo_pendiente),
     )
 
+    # Solo se cargan las filas de la página actual
+    pagina = paginar_keyset(query, [Venta.fecha, Venta.id])
+
     return render_template(
         "ventas/index.html",
-        ventas=ventas,
+        ventas=pagina.items,
+        pagina=pagina,
         busqueda=busqueda,
         desde=desde_str,
         hasta=hasta_str,
         tipo=tipo_filtro,
         estado=estado_filtro,
-        total_ventas_monto=total_ventas_monto,
-        ventas_a_credito_count=ventas_a_credito_count,
-        saldo_pendiente_total=saldo_pendiente_total,
+        total_ventas_count=totales["cantidad"],
+        total_ventas_monto=totales["monto"],
+        ventas_a_credito_count=totales["creditos"],
+        saldo_pendiente_total=totales["saldo"],
     )
 
 
@@ -99,27 +120,25 @@ def crear():
     # Inicializar el formulario
     form = VentaForm()
 
-    # Obtener cliente_id de la URL si existe
-    cliente_id_param = request.args.get("cliente_id", type=int)
-
-    # Cargar opciones para los selectores
-    clientes = Cliente.query.order_by(Cliente.nombre).all()
-    form.cliente.choices = [(c.id, f"{c.nombre} - {c.cedula}") for c in clientes]
-
-    # Si hay un cliente_id en la URL, preseleccionarlo
-    if cliente_id_param and request.method == "GET":
-        cliente = Cliente.query.get(cliente_id_param)
-        if cliente:
-            form.cliente.data = cliente.id
+    # El selector de cliente solo lleva el cliente elegido (el enviado en el POST
+    # o el cliente_id de la URL); los demás se buscan en /clientes/buscar.
+    # Un id que no esté entre las opciones no pasa la validación del formulario.
+    if request.method == "POST":
+        cliente_id_param = request.form.get("cliente")
+    else:
+        cliente_id_param = request.args.get("cliente_id")
+    cliente = cliente_seleccionable(cliente_id_param, "venta", current_user)
+    form.cliente.choices = [opcion_cliente(cliente)] if cliente else []
+    if cliente and request.method == "GET":
+        form.cliente.data = cliente.id
 
     # Cargar opciones para los selectores de caja
     cajas = Caja.query.all()
     form.caja.choices = [(c.id, c.nombre) for c in cajas]
 
-    # Obtener productos disponibles para la vista
-    productos_disponibles = (
-        Producto.query.filter(Producto.stock > 0).order_by(Producto.nombre).all()
-    )
+    # Los productos se cargan en el navegador desde el catálogo cacheado
+    # (ventas.catalogo); la URL lleva la versión para reutilizar la copia local
+    version_catalogo, _ = catalogo_productos(current_app.config.get("CATALOGO_CACHE_TTL"))
 
     # Log para depuración
     if request.method == "POST":
@@ -141,13 +160,23 @@ def crear():
             if not productos_seleccionados:
                 flash("No se seleccionaron productos para la venta.", "danger")
                 return render_template(
-                    "ventas/crear.html", form=form, productos=productos_disponibles
+                    "ventas/crear.html", form=form, version_catalogo=version_catalogo
                 )
 
             current_app.logger.info(
                 f"Productos decodificados: {productos_seleccionados}"
             )
 
+            # Cantidad total pedida por producto (puede repetirse en varias líneas)
+            try:
+                cantidades = agrupar_cantidades(productos_seleccionados)
+            except (TypeError, ValueError) as e:
+                current_app.logger.warning(f"Carrito no válido: {e}")
+                flash("Las cantidades de los productos no son válidas.", "danger")
+                return render_template(
+                    "ventas/crear.html", form=form, version_catalogo=version_catalogo
+                )
+
             # Crear nueva venta
             nueva_venta = Venta(
                 cliente_id=form.cliente.data,
@@ -167,20 +196,16 @@ def crear():
             db.session.add(nueva_venta)
             db.session.flush()  # Para obtener el ID antes del commit
 
-            # Procesar los productos seleccionados
-            total_venta_calculado = 0
-
-            for item in productos_seleccionados:
-                producto_id = int(item.get("id", 0))
-                cantidad = int(item.get("cantidad", 0))
+            # Todos los productos del carrito en una consulta, bloqueados hasta el commit
+            productos_db = bloquear_productos(list(cantidades))
 
-                # Verificar stock disponible
-                producto_db = Producto.query.get(producto_id)
+            for producto_id, cantidad in cantidades.items():
+                producto_db = productos_db.get(producto_id)
                 if not producto_db:
                     flash(f"Producto no encontrado.", "danger")
                     db.session.rollback()
                     return render_template(
-                        "ventas/crear.html", form=form, productos=productos_disponibles
+                        "ventas/crear.html", form=form, version_catalogo=version_catalogo
                     )
 
                 if producto_db.stock < cantidad:
@@ -190,9 +215,17 @@ def crear():
                     )
                     db.session.rollback()
                     return render_template(
-                        "ventas/crear.html", form=form, productos=productos_disponibles
+                        "ventas/crear.html", form=form, version_catalogo=version_catalogo
                     )
 
+            # Procesar los productos seleccionados
+            total_venta_calculado = 0
+
+            for item in productos_seleccionados:
+                producto_id = int(item.get("id", 0))
+                cantidad = int(item.get("cantidad", 0))
+                producto_db = productos_db[producto_id]
+
                 # NUEVO: Calcular precio unitario dinámicamente basado en la cantidad
                 try:
                     precio_unitario_calculado = producto_db.calcular_precio_unitario(
@@ -215,7 +248,7 @@ def crear():
                         return render_template(
                             "ventas/crear.html",
                             form=form,
-                            productos=productos_disponibles,
+                            version_catalogo=version_catalogo,
                         )
 
                 except Exception as e:
@@ -228,7 +261,7 @@ def crear():
                     )
                     db.session.rollback()
                     return render_template(
-                        "ventas/crear.html", form=form, productos=productos_disponibles
+                        "ventas/crear.html", form=form, version_catalogo=version_catalogo
                     )
 
                 # Crear detalle de venta con precio calculado dinámicamente
@@ -242,20 +275,40 @@ def crear():
                 )
                 db.session.add(detalle)
 
-                # Actualizar stock
-                producto_db.stock -= cantidad
-
                 # Sumar al total
                 total_venta_calculado += subtotal
 
                 # Log para auditoría
                 current_app.logger.info(f"Detalle de venta agregado: {detalle}")
 
+            # Descontar stock de forma atómica (nunca queda negativo, aun con ventas
+            # simultáneas del mismo producto)
+            sin_stock = descontar_stock(cantidades)
+            if sin_stock:
+                nombres = ", ".join(
+                    productos_db[producto_id].nombre for producto_id in sin_stock
+                )
+                db.session.rollback()
+                flash(
+                    f"Stock insuficiente para {nombres}. Otra venta acaba de usar ese stock.",
+                    "danger",
+                )
+                return render_template(
+                    "ventas/crear.html", form=form, version_catalogo=version_catalogo
+                )
+
             # Actualizar total y saldo pendiente
             nueva_venta.total = total_venta_calculado
 
             if form.tipo.data == "credito":
                 nueva_venta.saldo_pendiente = total_venta_calculado
+
+                # Cronograma de cuotas según el plan elegido en el formulario
+                generar_cronograma(
+                    nueva_venta,
+                    numero_cuotas=request.form.get("numero_cuotas"),
+                    frecuencia=request.form.get("frecuencia_pago"),
+                )
             else:  # contado
                 nueva_venta.saldo_pendiente = 0
 
@@ -274,6 +327,9 @@ def crear():
                     )
                     # Continuar a pesar del error en la caja
 
+            # Acumular la venta en el resumen diario (misma transacción)
+            resumir_venta(nueva_venta)
+
             # Calcular comisión por la venta
             try:
                 calcular_comision(
@@ -294,7 +350,7 @@ def crear():
             current_app.logger.error(f"Error al decodificar JSON: {e}")
             flash("Error en el formato de productos seleccionados.", "danger")
             return render_template(
-                "ventas/crear.html", form=form, productos=productos_disponibles
+                "ventas/crear.html", form=form, version_catalogo=version_catalogo
             )
         except Exception as e:
             db.session.rollback()
@@ -307,10 +363,30 @@ def crear():
         flash("Por favor corrija los errores en el formulario.", "warning")
 
     return render_template(
-        "ventas/crear.html", form=form, productos=productos_disponibles
+        "ventas/crear.html", form=form, version_catalogo=version_catalogo
     )
 
 
+@ventas_bp.route("/catalogo")
+@login_required
+@vendedor_required
+def catalogo():
+    """
+    Catálogo de productos (JSON) del formulario de venta, con ETag.
+    Con ?v=<versión actual> la respuesta no cambia y el navegador la reutiliza
+    sin volver a pedirla; sin versión se revalida en cada uso (304 si no cambió).
+    """
+    version, contenido = catalogo_productos(current_app.config.get("CATALOGO_CACHE_TTL"))
+    response = current_app.response_class(contenido, mimetype="application/json")
+    response.set_etag(version)
+    response.cache_control.private = True
+    if request.args.get("v") == version:
+        response.cache_control.max_age = 86400
+    else:
+        response.cache_control.no_cache = True
+    return response.make_conditional(request)
+
+
 @ventas_bp.route("/<int:id>")
 @login_required
 def detalle(id):
@@ -354,11 +430,17 @@ def eliminar(id):
             if producto:
                 producto.stock += detalle.cantidad
 
+        # Revertir la venta y sus movimientos en el resumen diario
+        resumir_venta(venta, signo=-1)
+        for movimiento in MovimientoCaja.query.filter_by(venta_id=id).all():
+            resumir_movimiento(movimiento, signo=-1)
+
         # Eliminar movimientos de caja asociados
         MovimientoCaja.query.filter_by(venta_id=id).delete()
 
-        # Eliminar detalles y luego la venta
+        # Eliminar detalles y cuotas, y luego la venta
         DetalleVenta.query.filter_by(venta_id=id).delete()
+        CuotaVenta.query.filter_by(venta_id=id).delete()
 
         db.session.delete(venta)
         db.session.commit()
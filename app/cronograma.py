@@ -0,0 +1,164 @@
+from datetime import datetime, timedelta
+import logging
+
+import click
+from flask.cli import with_appcontext
+
+from app import db
+from app.models import CuotaVenta, Venta
+
+logger = logging.getLogger("app.cronograma")
+
+# Días entre cuotas según la frecuencia elegida en el formulario de venta
+FRECUENCIAS_PAGO = {"semanal": 7, "quincenal": 15, "mensual": 30}
+
+# Plan impreso en la factura PDF; se usa para créditos anteriores al cronograma
+FRECUENCIA_POR_DEFECTO = "quincenal"
+CUOTAS_POR_DEFECTO = 4
+MAXIMO_CUOTAS = 120
+
+
+def normalizar_plan(numero_cuotas=None, frecuencia=None):
+    """
+    Valida los datos del plan de pagos recibidos del formulario.
+    Retorna: (numero_cuotas, frecuencia)
+    """
+    try:
+        numero_cuotas = int(numero_cuotas)
+    except (TypeError, ValueError):
+        numero_cuotas = CUOTAS_POR_DEFECTO
+    numero_cuotas = min(max(numero_cuotas, 1), MAXIMO_CUOTAS)
+
+    if frecuencia not in FRECUENCIAS_PAGO:
+        frecuencia = FRECUENCIA_POR_DEFECTO
+    return numero_cuotas, frecuencia
+
+
+def calcular_cuotas(total, fecha_venta, numero_cuotas, frecuencia):
+    """
+    Divide el total en cuotas iguales (el residuo va en la última).
+    Retorna una lista de (numero, fecha_vencimiento, monto).
+    """
+    total = int(total or 0)
+    dias = FRECUENCIAS_PAGO[frecuencia]
+    fecha_base = (fecha_venta or datetime.utcnow()).date()
+    monto_base = total // numero_cuotas
+
+    cuotas = []
+    for numero in range(1, numero_cuotas + 1):
+        monto = monto_base
+        if numero == numero_cuotas:
+            monto = total - monto_base * (numero_cuotas - 1)
+        cuotas.append((numero, fecha_base + timedelta(days=dias * numero), monto))
+    return cuotas
+
+
+def distribuir_pagos(montos, total_pagado):
+    """Reparte lo pagado sobre las cuotas en orden. Retorna el pagado de cada cuota"""
+    restante = max(int(total_pagado or 0), 0)
+    pagados = []
+    for monto in montos:
+        pagado = min(restante, int(monto))
+        pagados.append(pagado)
+        restante -= pagado
+    return pagados
+
+
+def generar_cronograma(venta, numero_cuotas=None, frecuencia=None):
+    """
+    Crea las cuotas de una venta a crédito. No hace commit: se ejecuta
+    dentro de la transacción de quien la llama.
+    """
+    if venta.tipo != "credito" or venta.cuotas:
+        return venta.cuotas
+
+    numero_cuotas, frecuencia = normalizar_plan(numero_cuotas, frecuencia)
+    for numero, fecha_vencimiento, monto in calcular_cuotas(
+        venta.total, venta.fecha, numero_cuotas, frecuencia
+    ):
+        venta.cuotas.append(
+            CuotaVenta(
+                numero=numero,
+                fecha_vencimiento=fecha_vencimiento,
+                monto=monto,
+                monto_pagado=0,
+                pagada=monto <= 0,
+            )
+        )
+    aplicar_pagos(venta)
+    return venta.cuotas
+
+
+def aplicar_pagos(venta):
+    """
+    Actualiza el monto pagado de cada cuota a partir del saldo de la venta.
+    Llamar después de modificar venta.saldo_pendiente (crear, editar o eliminar abonos).
+    """
+    if not venta.cuotas:
+        return
+    total_pagado = int(venta.total or 0) - int(venta.saldo_pendiente or 0)
+    pagados = distribuir_pagos([c.monto for c in venta.cuotas], total_pagado)
+    for cuota, pagado in zip(venta.cuotas, pagados):
+        cuota.monto_pagado = pagado
+        cuota.pagada = pagado >= cuota.monto
+
+
+def frecuencia_de(venta):
+    """Deduce la frecuencia de pago a partir de las fechas del cronograma"""
+    if not venta.cuotas:
+        return FRECUENCIA_POR_DEFECTO
+    primera = venta.cuotas[0].fecha_vencimiento
+    dias = (primera - venta.fecha.date()).days if venta.fecha else 0
+    for nombre, dias_frecuencia in FRECUENCIAS_PAGO.items():
+        if dias == dias_frecuencia:
+            return nombre
+    return FRECUENCIA_POR_DEFECTO
+
+
+def generar_cronogramas_faltantes():
+    """
+    Genera el cronograma (plan por defecto) de los créditos que no lo tienen,
+    con los abonos ya registrados aplicados. No hace commit.
+    Retorna la cantidad de ventas procesadas.
+    """
+    sin_cronograma = (
+        db.session.query(Venta.id, Venta.total, Venta.saldo_pendiente, Venta.fecha)
+        .outerjoin(CuotaVenta, CuotaVenta.venta_id == Venta.id)
+        .filter(Venta.tipo == "credito", CuotaVenta.id.is_(None))
+        .all()
+    )
+
+    filas = []
+    for venta_id, total, saldo, fecha in sin_cronograma:
+        cuotas = calcular_cuotas(total, fecha, CUOTAS_POR_DEFECTO, FRECUENCIA_POR_DEFECTO)
+        pagados = distribuir_pagos(
+            [monto for _, _, monto in cuotas], int(total or 0) - int(saldo or 0)
+        )
+        for (numero, fecha_vencimiento, monto), pagado in zip(cuotas, pagados):
+            filas.append(
+                {
+                    "venta_id": venta_id,
+                    "numero": numero,
+                    "fecha_vencimiento": fecha_vencimiento,
+                    "monto": monto,
+                    "monto_pagado": pagado,
+                    "pagada": pagado >= monto,
+                }
+            )
+
+    db.session.bulk_insert_mappings(CuotaVenta, filas)
+    return len(sin_cronograma)
+
+
+@click.command("generar-cronogramas")
+@with_appcontext
+def generar_cronogramas_command():
+    """Genera el cronograma de cuotas de los créditos que aún no lo tienen."""
+    try:
+        ventas = generar_cronogramas_faltantes()
+        db.session.commit()
+        click.echo(f"Cronogramas generados: {ventas} ventas.")
+    except Exception as e:
+        db.session.rollback()
+        logger.error(f"Error generando cronogramas: {e}")
+        raise click.ClickException(f"No se pudieron generar los cronogramas: {e}")
@@ -0,0 +1,110 @@
+import logging
+import threading
+
+import click
+from flask.cli import with_appcontext
+from sqlalchemy import inspect
+
+from app import db
+
+logger = logging.getLogger("app.esquema")
+
+# Columnas agregadas después de la primera versión: las bases antiguas pueden no
+# tenerlas hasta aplicar las migraciones
+COLUMNAS_OPCIONALES = {
+    "movimiento_caja": ("venta_id", "abono_id", "caja_destino_id"),
+}
+
+
+class CapacidadesEsquema:
+    """
+    Columnas existentes en la base de datos, leídas una sola vez (al iniciar la
+    aplicación) para que las escrituras no consulten el catálogo cada vez.
+    Llamar a refrescar() después de aplicar migraciones.
+    """
+
+    def __init__(self):
+        self._columnas = None
+        self._lock = threading.Lock()
+
+    def refrescar(self):
+        """Vuelve a leer las columnas de las tablas de los modelos"""
+        columnas = {}
+        try:
+            inspector = inspect(db.engine)
+            existentes = set(inspector.get_table_names())
+            for tabla in db.metadata.tables:
+                if tabla in existentes:
+                    columnas[tabla] = frozenset(
+                        columna["name"] for columna in inspector.get_columns(tabla)
+                    )
+        except Exception as e:
+            # Si falla, asumimos que todas las columnas de los modelos existen
+            logger.warning(f"No se pudo leer el esquema, se asume el de los modelos: {e}")
+            columnas = {
+                nombre: frozenset(tabla.columns.keys())
+                for nombre, tabla in db.metadata.tables.items()
+            }
+        with self._lock:
+            self._columnas = columnas
+        return columnas
+
+    def columnas(self, tabla):
+        if self._columnas is None:
+            self.refrescar()
+        return self._columnas.get(tabla, frozenset())
+
+    def tiene_columna(self, tabla, columna):
+        return columna in self.columnas(tabla)
+
+    def faltantes(self):
+        """Columnas opcionales que aún no existen: {tabla: [columnas]}"""
+        resultado = {}
+        for tabla, opcionales in COLUMNAS_OPCIONALES.items():
+            ausentes = [c for c in opcionales if not self.tiene_columna(tabla, c)]
+            if ausentes:
+                resultado[tabla] = ausentes
+        return resultado
+
+
+esquema = CapacidadesEsquema()
+
+
+def crear_indices_faltantes():
+    """
+    Crea los índices de los modelos que aún no existen. db.create_all() solo los
+    crea junto con tablas nuevas, no en tablas que ya existían.
+    Retorna los nombres de los índices creados.
+    """
+    creados = []
+    inspector = inspect(db.engine)
+    existentes = set(inspector.get_table_names())
+    for tabla in db.metadata.sorted_tables:
+        if tabla.name not in existentes:
+            continue
+        nombres = {indice["name"] for indice in inspector.get_indexes(tabla.name)}
+        for indice in tabla.indexes:
+            if indice.name in nombres:
+                continue
+            try:
+                indice.create(db.engine, checkfirst=True)
+                creados.append(indice.name)
+            except Exception as e:
+                # Otro worker pudo crearlo al mismo tiempo
+                logger.warning(f"No se pudo crear el índice {indice.name}: {e}")
+    if creados:
+        logger.info(f"Índices creados: {', '.join(creados)}")
+    return creados
+
+
+@click.command("verificar-esquema")
+@with_appcontext
+def verificar_esquema_command():
+    """Lista las columnas opcionales que faltan (los workers leen el esquema al iniciar)."""
+    esquema.refrescar()
+    faltantes = esquema.faltantes()
+    if not faltantes:
+        click.echo("Todas las columnas opcionales existen.")
+        return
+    for tabla, columnas in faltantes.items():
+        click.echo(f"{tabla}: faltan {', '.join(columnas)}")
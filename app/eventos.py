@@ -0,0 +1,149 @@
+import logging
+import queue
+import threading
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from app.cache import CacheTTL
+
+from app.models import (
+    Usuario,
+    Cliente,
+    Producto,
+    Venta,
+    Abono,
+    CuotaVenta,
+    Comision,
+    Caja,
+    MovimientoCaja,
+)
+
+logger = logging.getLogger("app.eventos")
+
+# Temas de los contadores en tiempo real y modelos que los afectan
+TEMAS_POR_MODELO = (
+    ((Venta, Abono, CuotaVenta), "cobros"),
+    ((Caja, MovimientoCaja), "cajas"),
+    (
+        (Usuario, Cliente, Producto, Venta, Abono, Comision, Caja, MovimientoCaja),
+        "respaldos",
+    ),
+)
+
+CLAVE_CAMBIOS_TEMAS = "cambios_temas"
+
+# Contadores por tema calculados una vez para todas las conexiones abiertas del
+# proceso; se invalidan al publicar un cambio del tema
+cache_contadores = CacheTTL(ttl=30)
+
+
+class Suscripcion:
+    """Conexión abierta que espera cambios de ciertos temas"""
+
+    def __init__(self, temas):
+        self.temas = set(temas)
+        # Un solo aviso pendiente basta: quien escucha recalcula todo al despertar
+        self._avisos = queue.Queue(maxsize=1)
+
+    def avisar(self):
+        try:
+            self._avisos.put_nowait(True)
+        except queue.Full:
+            pass
+
+    def esperar(self, timeout):
+        """Retorna True si hubo un cambio antes del timeout"""
+        try:
+            return self._avisos.get(timeout=timeout)
+        except queue.Empty:
+            return False
+
+
+class CanalEventos:
+    """
+    Distribuye avisos de cambios a las suscripciones del proceso.
+    Usa queue/threading, que gevent parchea en los workers de gunicorn.
+    """
+
+    def __init__(self):
+        self._suscripciones = set()
+        self._lock = threading.Lock()
+
+    def suscribir(self, temas):
+        suscripcion = Suscripcion(temas)
+        with self._lock:
+            self._suscripciones.add(suscripcion)
+        return suscripcion
+
+    def cancelar(self, suscripcion):
+        with self._lock:
+            self._suscripciones.discard(suscripcion)
+
+    def publicar(self, temas):
+        if not temas:
+            return
+        with self._lock:
+            suscripciones = list(self._suscripciones)
+        for suscripcion in suscripciones:
+            if suscripcion.temas & temas:
+                suscripcion.avisar()
+
+    def __len__(self):
+        with self._lock:
+            return len(self._suscripciones)
+
+
+canal_eventos = CanalEventos()
+
+
+def _temas_por_cambio(obj):
+    return {tema for modelos, tema in TEMAS_POR_MODELO if isinstance(obj, modelos)}
+
+
+def marcar_temas(session, *temas):
+    """
+    Registra temas a publicar en el próximo commit.
+    Útil para escrituras masivas (UPDATE/DELETE directos) que no pasan por la sesión.
+    """
+    session.info.setdefault(CLAVE_CAMBIOS_TEMAS, set()).update(temas)
+
+
+def _registrar_cambios_flush(session, flush_context):
+    temas = set()
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        temas |= _temas_por_cambio(obj)
+    if temas:
+        marcar_temas(session, *temas)
+
+
+def contadores_cacheados(tema, calcular, ttl=None):
+    """
+    Contadores del tema desde el caché; las conexiones simultáneas comparten un
+    único cálculo.
+    """
+    return cache_contadores.obtener_o_calcular((tema,), calcular, ttl)
+
+
+def _publicar_tras_commit(session):
+    temas = session.info.pop(CLAVE_CAMBIOS_TEMAS, set())
+    if temas:
+        # Invalidar antes de avisar: quien despierta recalcula con datos nuevos
+        cache_contadores.invalidar(lambda clave: clave[0] in temas)
+    canal_eventos.publicar(temas)
+
+
+def _descartar_tras_rollback(session):
+    session.info.pop(CLAVE_CAMBIOS_TEMAS, None)
+
+
+def registrar_eventos_tiempo_real():
+    """
+    Conecta la publicación de cambios a los eventos de sesión de SQLAlchemy.
+    Registrar después de los cachés para que se invaliden antes de avisar.
+    """
+    if event.contains(Session, "after_flush", _registrar_cambios_flush):
+        return
+    event.listen(Session, "after_flush", _registrar_cambios_flush)
+    event.listen(Session, "after_commit", _publicar_tras_commit)
+    event.listen(Session, "after_rollback", _descartar_tras_rollback)
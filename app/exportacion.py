@@ -0,0 +1,155 @@
+import csv
+import io
+import tempfile
+import zlib
+
+from flask import Response, request, stream_with_context
+from openpyxl import Workbook
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.styles import Alignment, Border, Font, Side
+
+TIPO_XLSX = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+TIPO_CSV = "text/csv; charset=utf-8"
+TIPO_GZIP = "application/gzip"
+
+# Valores de ?formato= / campo "formato" de los formularios de exportación
+FORMATOS = ("excel", "csv", "csv.gz")
+
+# Filas leídas de la base por lote (cursor del lado del servidor)
+FILAS_POR_LOTE = 1000
+# Tamaño de cada fragmento de la respuesta
+TAMANO_BLOQUE = 64 * 1024
+
+_LINEA = Side(style="thin")
+
+
+def por_lotes(query, tamano=FILAS_POR_LOTE):
+    """
+    Recorre la consulta por lotes con yield_per (stream_results): la base entrega
+    las filas a medida que se escriben, sin cargar todo el resultado en memoria.
+    """
+    return query.yield_per(tamano)
+
+
+def _fila_encabezado(hoja, columnas):
+    # Mismo formato que usaba pandas.to_excel para los encabezados
+    celdas = []
+    for columna in columnas:
+        celda = WriteOnlyCell(hoja, value=columna)
+        celda.font = Font(bold=True)
+        celda.border = Border(left=_LINEA, right=_LINEA, top=_LINEA, bottom=_LINEA)
+        celda.alignment = Alignment(horizontal="center", vertical="top")
+        celdas.append(celda)
+    return celdas
+
+
+def _leer_por_bloques(archivo):
+    try:
+        archivo.seek(0)
+        while True:
+            bloque = archivo.read(TAMANO_BLOQUE)
+            if not bloque:
+                break
+            yield bloque
+    finally:
+        archivo.close()
+
+
+def formato_solicitado():
+    """Formato pedido en el formulario o la URL (excel si no se indica o no es válido)"""
+    formato = request.values.get("formato", "excel")
+    return formato if formato in FORMATOS else "excel"
+
+
+def respuesta_libro(nombre_archivo, hojas):
+    """
+    Escribe las hojas [(nombre, columnas, filas, anchos)] en un libro openpyxl en
+    modo solo escritura, que vuelca cada fila a disco en lugar de guardarla en
+    memoria, y envía el archivo en fragmentos de TAMANO_BLOQUE.
+    filas: cualquier iterable de tuplas. anchos: {"A": 20, ...} o None.
+    """
+    libro = Workbook(write_only=True)
+    for nombre_hoja, columnas, filas, anchos in hojas:
+        hoja = libro.create_sheet(nombre_hoja)
+        for letra, ancho in (anchos or {}).items():
+            hoja.column_dimensions[letra].width = ancho
+
+        hoja.append(_fila_encabezado(hoja, columnas))
+        for fila in filas:
+            hoja.append(fila)
+
+    archivo = tempfile.TemporaryFile()
+    libro.save(archivo)
+    tamano = archivo.tell()
+
+    response = Response(
+        _leer_por_bloques(archivo), mimetype=TIPO_XLSX, direct_passthrough=True
+    )
+    response.headers["Content-Disposition"] = f"attachment; filename={nombre_archivo}"
+    response.headers["Content-Length"] = str(tamano)
+    return response
+
+
+def respuesta_excel(nombre_archivo, nombre_hoja, columnas, filas, anchos=None):
+    """Libro de una sola hoja (ver respuesta_libro)"""
+    return respuesta_libro(nombre_archivo, [(nombre_hoja, columnas, filas, anchos)])
+
+
+def _generar_csv(secciones, comprimir):
+    buffer = io.StringIO()
+    escritor = csv.writer(buffer)
+    compresor = zlib.compressobj(wbits=16 + zlib.MAX_WBITS) if comprimir else None
+
+    def vaciar():
+        datos = buffer.getvalue().encode("utf-8")
+        buffer.seek(0)
+        buffer.truncate()
+        return compresor.compress(datos) if compresor else datos
+
+    for titulo, columnas, filas in secciones:
+        if titulo:
+            escritor.writerow([f"[{titulo}]"])
+        escritor.writerow(columnas)
+        for fila in filas:
+            escritor.writerow(fila)
+            if buffer.tell() >= TAMANO_BLOQUE:
+                bloque = vaciar()
+                if bloque:
+                    yield bloque
+        if titulo:
+            # Línea vacía entre secciones
+            escritor.writerow([])
+
+    bloque = vaciar()
+    if compresor:
+        bloque += compresor.flush()
+    if bloque:
+        yield bloque
+
+
+def respuesta_csv(nombre_base, secciones, comprimir=False):
+    """
+    CSV generado a medida que se envía: las filas se leen de la base (con
+    por_lotes) dentro del generador, así los primeros bytes salen de inmediato y
+    el archivo completo nunca está en memoria. Con comprimir, gzip (.csv.gz).
+    secciones: [(titulo, columnas, filas)]; con titulo, cada sección empieza con
+    una línea "[titulo]" (varias tablas en un mismo archivo).
+    """
+    extension, tipo = ("csv.gz", TIPO_GZIP) if comprimir else ("csv", TIPO_CSV)
+    response = Response(
+        stream_with_context(_generar_csv(secciones, comprimir)), content_type=tipo
+    )
+    response.headers["Content-Disposition"] = (
+        f"attachment; filename={nombre_base}.{extension}"
+    )
+    return response
+
+
+def respuesta_exportacion(nombre_base, nombre_hoja, columnas, filas, anchos=None, formato=None):
+    """Exporta un reporte en el formato solicitado (excel, csv o csv.gz)"""
+    formato = formato or formato_solicitado()
+    if formato in ("csv", "csv.gz"):
+        return respuesta_csv(
+            nombre_base, [(None, columnas, filas)], comprimir=formato == "csv.gz"
+        )
+    return respuesta_excel(f"{nombre_base}.xlsx", nombre_hoja, columnas, filas, anchos)
@@ -0,0 +1,138 @@
+import logging
+
+from flask import g, has_app_context
+from sqlalchemy import case, select
+from sqlalchemy.orm import aliased
+
+from app import db
+from app.models import Usuario, Venta
+
+logger = logging.getLogger("app.gestores")
+
+# Usuarios ya resueltos en la solicitud actual: {usuario_id: Usuario o None}
+CLAVE_USUARIOS = "_usuarios_gestores"
+CLAVE_FALLBACK = "_usuario_fallback"
+
+# Alias de usuarios para resolver el gestor en SQL
+UsuarioActual = aliased(Usuario, name="usuario_actual_gestor")
+VendedorGestor = aliased(Usuario, name="vendedor_gestor")
+Gestor = aliased(Usuario, name="gestor")
+
+
+def _usuarios():
+    """Mapa de usuarios de la solicitud (vacío y descartable fuera de una app)"""
+    if not has_app_context():
+        return {}
+    usuarios = g.get(CLAVE_USUARIOS)
+    if usuarios is None:
+        usuarios = {}
+        setattr(g, CLAVE_USUARIOS, usuarios)
+    return usuarios
+
+
+def precargar_usuarios(ventas):
+    """
+    Carga en una sola consulta todos los usuarios que las ventas pueden necesitar
+    para resolver su gestor (vendedor, usuario actual y vendedor original).
+    Retorna: {usuario_id: Usuario} de la solicitud.
+    """
+    usuarios = _usuarios()
+    ids = set()
+    for venta in ventas:
+        ids.update((venta.vendedor_id, venta.usuario_actual_id, venta.vendedor_original_id))
+    faltantes = {i for i in ids if i is not None and i not in usuarios}
+    if faltantes:
+        for usuario in Usuario.query.filter(Usuario.id.in_(faltantes)).all():
+            usuarios[usuario.id] = usuario
+        # Los ids que no existen también se recuerdan (como None)
+        for usuario_id in faltantes:
+            usuarios.setdefault(usuario_id, None)
+    return usuarios
+
+
+def obtener_usuario(usuario_id):
+    """Usuario por id, consultado como máximo una vez por solicitud"""
+    if usuario_id is None:
+        return None
+    usuarios = _usuarios()
+    if usuario_id not in usuarios:
+        usuarios[usuario_id] = db.session.get(Usuario, usuario_id)
+    return usuarios[usuario_id]
+
+
+def _orden_fallback():
+    # Primero los administradores, luego el id más bajo
+    return case((Usuario.rol == "administrador", 0), else_=1), Usuario.id
+
+
+def usuario_fallback():
+    """
+    Usuario de respaldo para ventas sin gestor válido: el primer administrador
+    activo o, si no hay, cualquier usuario activo. Se resuelve una vez por solicitud.
+    """
+    if has_app_context() and CLAVE_FALLBACK in g:
+        return g.get(CLAVE_FALLBACK)
+
+    fallback = (
+        Usuario.query.filter(Usuario.activo == True).order_by(*_orden_fallback()).first()
+    )
+    if has_app_context():
+        setattr(g, CLAVE_FALLBACK, fallback)
+    return fallback
+
+
+# GESTOR EN SQL (misma regla que Venta.usuario_gestor)
+def asignado_id_sql():
+    """
+    Usuario al que la venta está asignada, sin mirar si sigue activo: el usuario
+    actual si fue transferida, si no el vendedor (el criterio de
+    api_ventas_usuario). Sirve para tomar la cartera de alguien que se retiró.
+    """
+    return case(
+        (
+            db.and_(Venta.transferida == True, Venta.usuario_actual_id.isnot(None)),
+            Venta.usuario_actual_id,
+        ),
+        else_=Venta.vendedor_id,
+    )
+
+
+def gestor_id_sql():
+    """
+    Id del gestor como expresión SQL:
+    COALESCE(usuario actual si la venta está transferida y él activo,
+             vendedor si está activo,
+             primer administrador activo / primer usuario activo).
+    Requiere los joins de UsuarioActual y VendedorGestor (ver con_gestor).
+    """
+    fallback_id = (
+        select(Usuario.id)
+        .where(Usuario.activo == True)
+        .order_by(*_orden_fallback())
+        .limit(1)
+        .scalar_subquery()
+    )
+    return db.func.coalesce(
+        case(
+            (
+                db.and_(Venta.transferida == True, UsuarioActual.activo == True),
+                UsuarioActual.id,
+            )
+        ),
+        case((VendedorGestor.activo == True, VendedorGestor.id)),
+        fallback_id,
+    )
+
+
+def con_gestor(query):
+    """
+    Agrega a una consulta de Venta el gestor resuelto en la misma consulta.
+    Las filas pasan a ser (Venta, Gestor); las ventas sin gestor posible (no hay
+    usuarios activos) quedan fuera por el JOIN.
+    """
+    return (
+        query.outerjoin(UsuarioActual, UsuarioActual.id == Venta.usuario_actual_id)
+        .outerjoin(VendedorGestor, VendedorGestor.id == Venta.vendedor_id)
+        .join(Gestor, Gestor.id == gestor_id_sql())
+        .add_entity(Gestor)
+    )
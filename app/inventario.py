@@ -0,0 +1,70 @@
+import logging
+
+from app import db
+from app.catalogo import marcar_catalogo_modificado
+from app.metricas import marcar_cambios_dashboard
+from app.models import Producto
+
+logger = logging.getLogger("app.inventario")
+
+
+def agrupar_cantidades(items):
+    """
+    Suma las cantidades pedidas por producto (un producto puede venir en varias
+    líneas del carrito).
+    Retorna: {producto_id: cantidad}. Lanza ValueError si una línea no es válida.
+    """
+    cantidades = {}
+    for item in items:
+        producto_id = int(item.get("id", 0))
+        cantidad = int(item.get("cantidad", 0))
+        if producto_id <= 0 or cantidad <= 0:
+            raise ValueError(f"Línea de producto no válida: {item}")
+        cantidades[producto_id] = cantidades.get(producto_id, 0) + cantidad
+    return cantidades
+
+
+def bloquear_productos(producto_ids):
+    """
+    Carga los productos del carrito en una sola consulta con SELECT ... FOR UPDATE,
+    en orden de id para que dos ventas simultáneas tomen los bloqueos en el mismo
+    orden (sin interbloqueos). En SQLite FOR UPDATE se omite: allí protege
+    descontar_stock.
+    Retorna: {producto_id: Producto}
+    """
+    productos = (
+        Producto.query.filter(Producto.id.in_(producto_ids))
+        .order_by(Producto.id)
+        .with_for_update()
+        .all()
+    )
+    return {producto.id: producto for producto in productos}
+
+
+def descontar_stock(cantidades):
+    """
+    Descuenta el stock con UPDATE ... SET stock = stock - :n WHERE stock >= :n por
+    producto (en orden de id). Nunca deja stock negativo aunque otra venta haya
+    descontado entre la lectura y la escritura. No hace commit.
+    Retorna: lista de producto_id sin stock suficiente (vacía si se descontó todo;
+    quien llama debe hacer rollback si no lo está).
+    """
+    sin_stock = []
+    for producto_id in sorted(cantidades):
+        cantidad = cantidades[producto_id]
+        actualizados = Producto.query.filter(
+            Producto.id == producto_id, Producto.stock >= cantidad
+        ).update(
+            {Producto.stock: Producto.stock - cantidad},
+            synchronize_session="evaluate",
+        )
+        if actualizados != 1:
+            sin_stock.append(producto_id)
+
+    if cantidades and not sin_stock:
+        # El UPDATE directo no pasa por el flush: invalidar los cachés a mano
+        marcar_catalogo_modificado(db.session)
+        marcar_cambios_dashboard(
+            db.session, ("rol", "administrador"), ("rol", "vendedor")
+        )
+    return sin_stock
@@ -0,0 +1,219 @@
+import logging
+from datetime import datetime
+
+from sqlalchemy.orm.util import identity_key
+
+from app import db
+from app.eventos import marcar_temas
+from app.metricas import marcar_cambios_dashboard
+from app.models import Comision, ComisionLiquidada, LiquidacionComision, Usuario
+from app.saldos_comision import registrar_pagos
+
+logger = logging.getLogger("app.liquidaciones")
+
+# Liquidaciones recientes que se muestran para auditar o revertir
+LIQUIDACIONES_RECIENTES = 20
+
+
+def _condiciones(fecha_inicio=None, fecha_fin=None, usuario_id=None, comision_ids=None):
+    condiciones = []
+    if fecha_inicio is not None:
+        condiciones.append(Comision.fecha_generacion >= fecha_inicio)
+    if fecha_fin is not None:
+        condiciones.append(Comision.fecha_generacion <= fecha_fin)
+    if usuario_id:
+        condiciones.append(Comision.usuario_id == usuario_id)
+    if comision_ids is not None:
+        condiciones.append(Comision.id.in_(comision_ids))
+    return condiciones
+
+
+def consulta_pendientes(fecha_inicio=None, fecha_fin=None, usuario_id=None):
+    """Comisiones sin pagar del período, de un usuario o de todos (0/None)"""
+    return Comision.query.filter(
+        Comision.pagado == False, *_condiciones(fecha_inicio, fecha_fin, usuario_id)
+    )
+
+
+def resumen_pendientes(fecha_inicio=None, fecha_fin=None, usuario_id=None):
+    """
+    Lo que pagaría la liquidación, agrupado por usuario en una sola consulta.
+    Retorna: ({usuario_id: {"usuario", "cantidad", "total_comision"}}, total_general)
+    """
+    filas = (
+        consulta_pendientes(fecha_inicio, fecha_fin, usuario_id)
+        .join(Usuario, Usuario.id == Comision.usuario_id)
+        .with_entities(
+            Usuario,
+            db.func.count(Comision.id),
+            db.func.coalesce(db.func.sum(Comision.monto_comision), 0),
+        )
+        .group_by(Usuario.id)
+        .order_by(Usuario.nombre)
+        .all()
+    )
+    resumen = {
+        usuario.id: {
+            "usuario": usuario,
+            "cantidad": int(cantidad),
+            "total_comision": int(total),
+        }
+        for usuario, cantidad, total in filas
+    }
+    return resumen, sum(datos["total_comision"] for datos in resumen.values())
+
+
+def _cambiar_pagado(condiciones, pagado=True):
+    """
+    UPDATE comisiones SET pagado = :pagado WHERE ... AND pagado = :anterior
+    RETURNING id, usuario_id, monto_comision, fecha_generacion. Cada comisión la
+    devuelve una sola de dos liquidaciones simultáneas. En bases sin
+    UPDATE ... RETURNING, las filas se leen con SELECT ... FOR UPDATE y se
+    actualizan por id.
+    """
+    condiciones = [Comision.pagado == (not pagado), *condiciones]
+    columnas = (
+        Comision.id, Comision.usuario_id, Comision.monto_comision, Comision.fecha_generacion
+    )
+
+    if db.session.get_bind().dialect.update_returning:
+        return db.session.execute(
+            db.update(Comision)
+            .where(*condiciones)
+            .values(pagado=pagado)
+            .returning(*columnas),
+            execution_options={"synchronize_session": False},
+        ).all()
+
+    filas = db.session.execute(
+        db.select(*columnas).where(*condiciones).order_by(Comision.id).with_for_update()
+    ).all()
+    if filas:
+        db.session.execute(
+            db.update(Comision)
+            .where(Comision.id.in_([fila[0] for fila in filas]))
+            .values(pagado=pagado),
+            execution_options={"synchronize_session": False},
+        )
+    return filas
+
+
+def _sincronizar_sesion(filas, signo):
+    # Pagado y pendiente de los saldos por período, agrupados por usuario y período
+    registrar_pagos(
+        [(usuario_id, monto, fecha) for _, usuario_id, monto, fecha in filas], signo
+    )
+
+    # Las comisiones ya cargadas en la sesión deben releer el campo pagado
+    for objeto in list(db.session.identity_map.values()):
+        if isinstance(objeto, Comision):
+            db.session.expire(objeto, ["pagado"])
+
+    # Los UPDATE directos no pasan por el flush
+    marcar_cambios_dashboard(
+        db.session,
+        ("rol", "administrador"),
+        *[("usuario", usuario_id) for usuario_id in {fila[1] for fila in filas}],
+    )
+    marcar_temas(db.session, "respaldos")
+
+
+def liquidar_comisiones(realizada_por_id, fecha_inicio=None, fecha_fin=None,
+                        usuario_id=None, comision_ids=None):
+    """
+    Marca como pagadas las comisiones pendientes que cumplen los filtros (o las
+    de la lista comision_ids) con un solo UPDATE y registra la liquidación con
+    su detalle. No hace commit.
+    Retorna la LiquidacionComision, o None si no había comisiones pendientes.
+    """
+    if fecha_inicio is None and fecha_fin is None and not usuario_id and comision_ids is None:
+        raise ValueError("Indique el período, el usuario o las comisiones a liquidar")
+
+    filas = _cambiar_pagado(
+        _condiciones(fecha_inicio, fecha_fin, usuario_id, comision_ids)
+    )
+    if not filas:
+        return None
+
+    liquidacion = LiquidacionComision(
+        realizada_por_id=realizada_por_id,
+        fecha_inicio=fecha_inicio,
+        fecha_fin=fecha_fin,
+        usuario_id=usuario_id or None,
+        cantidad=len(filas),
+        total=sum(int(monto or 0) for _, _, monto, _ in filas),
+    )
+    db.session.add(liquidacion)
+    db.session.flush()
+
+    db.session.execute(
+        db.insert(ComisionLiquidada),
+        [
+            {
+                "liquidacion_id": liquidacion.id,
+                "comision_id": comision_id,
+                "usuario_id": comision_usuario_id,
+                "monto_comision": int(monto or 0),
+            }
+            for comision_id, comision_usuario_id, monto, _ in filas
+        ],
+    )
+
+    _sincronizar_sesion(filas, 1)
+    logger.info(
+        f"Liquidación {liquidacion.id}: {liquidacion.cantidad} comisiones por {liquidacion.total}"
+    )
+    return liquidacion
+
+
+def revertir_liquidacion(liquidacion_id, revertida_por_id):
+    """
+    Devuelve a pendientes las comisiones de la liquidación (leídas de su
+    detalle, sin recorrer las comisiones) y la marca como revertida. No hace commit.
+    Retorna la cantidad de comisiones revertidas.
+    """
+    # UPDATE condicionado: dos reversiones simultáneas no se aplican dos veces
+    marcadas = LiquidacionComision.query.filter(
+        LiquidacionComision.id == liquidacion_id,
+        LiquidacionComision.revertida == False,
+    ).update(
+        {
+            LiquidacionComision.revertida: True,
+            LiquidacionComision.fecha_reversion: datetime.utcnow(),
+            LiquidacionComision.revertida_por_id: revertida_por_id,
+        },
+        synchronize_session=False,
+    )
+    if marcadas != 1:
+        if db.session.get(LiquidacionComision, liquidacion_id) is None:
+            raise ValueError(f"Liquidación {liquidacion_id} no encontrada")
+        raise ValueError(f"La liquidación {liquidacion_id} ya fue revertida")
+
+    detalle = db.select(ComisionLiquidada.comision_id).where(
+        ComisionLiquidada.liquidacion_id == liquidacion_id
+    )
+    filas = _cambiar_pagado([Comision.id.in_(detalle)], pagado=False)
+
+    liquidacion = db.session.identity_map.get(
+        identity_key(LiquidacionComision, liquidacion_id)
+    )
+    if liquidacion is not None:
+        db.session.expire(liquidacion)
+
+    _sincronizar_sesion(filas, -1)
+
+    logger.info(f"Liquidación {liquidacion_id} revertida: {len(filas)} comisiones")
+    return len(filas)
+
+
+def liquidaciones_recientes(limite=LIQUIDACIONES_RECIENTES):
+    """Últimas liquidaciones con quien las hizo y el usuario filtrado"""
+    return (
+        LiquidacionComision.query.options(
+            db.joinedload(LiquidacionComision.realizada_por),
+            db.joinedload(LiquidacionComision.usuario),
+        )
+        .order_by(LiquidacionComision.fecha.desc(), LiquidacionComision.id.desc())
+        .limit(limite)
+        .all()
+    )
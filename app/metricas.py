@@ -0,0 +1,289 @@
+from datetime import datetime
+import logging
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from app import db
+from app.cache import CacheTTL
+from app.models import (
+    Usuario,
+    Cliente,
+    Producto,
+    Venta,
+    Abono,
+    Caja,
+    MovimientoCaja,
+    Comision,
+    Configuracion,
+)
+from app.resumen import totales_resumen
+from app.versiones import leer_versiones, marcar_versiones
+
+logger = logging.getLogger("app.metricas")
+
+
+def _contar_si(condicion):
+    """COUNT(CASE WHEN condicion THEN 1 END)"""
+    return db.func.count(db.case((condicion, 1)))
+
+
+def metricas_creditos(vendedor_id=None):
+    """
+    Créditos activos y saldo pendiente total en una sola consulta agregada.
+    Retorna: (creditos_activos, total_creditos)
+    """
+    query = db.session.query(
+        db.func.count(Venta.id), db.func.coalesce(db.func.sum(Venta.saldo_pendiente), 0)
+    ).filter(Venta.tipo == "credito", Venta.saldo_pendiente > 0)
+    if vendedor_id is not None:
+        query = query.filter(Venta.vendedor_id == vendedor_id)
+
+    creditos_activos, total_creditos = query.one()
+    return int(creditos_activos or 0), int(total_creditos or 0)
+
+
+def metricas_ventas_mes(primer_dia_mes, vendedor_id=None):
+    """
+    Cantidad y total de ventas del mes leídos del resumen diario.
+    Retorna: (ventas_mes, total_ventas_mes)
+    """
+    return totales_resumen(
+        ["venta_contado", "venta_credito"], desde=primer_dia_mes, usuario_id=vendedor_id
+    )
+
+
+def metricas_productos():
+    """
+    Total de productos, agotados y con stock bajo en una sola consulta.
+    Retorna: (total_productos, productos_agotados, productos_stock_bajo)
+    """
+    total, agotados, stock_bajo = db.session.query(
+        db.func.count(Producto.id),
+        _contar_si(Producto.stock <= 0),
+        _contar_si(
+            db.and_(Producto.stock <= Producto.stock_minimo, Producto.stock > 0)
+        ),
+    ).one()
+    return int(total or 0), int(agotados or 0), int(stock_bajo or 0)
+
+
+def metricas_abonos(primer_dia_mes, cobrador_id=None):
+    """
+    Cantidad y total de abonos del mes leídos del resumen diario.
+    Retorna: (abonos_mes, total_abonos_mes)
+    """
+    return totales_resumen(["abono"], desde=primer_dia_mes, usuario_id=cobrador_id)
+
+
+def total_clientes_para(usuario):
+    """Cuenta los clientes visibles para el usuario según su rol"""
+    if usuario.is_admin():
+        return db.session.query(db.func.count(Cliente.id)).scalar() or 0
+
+    query = db.session.query(db.func.count(db.distinct(Venta.cliente_id)))
+    if usuario.is_vendedor():
+        query = query.filter(Venta.vendedor_id == usuario.id)
+    else:
+        # Cobradores: clientes con créditos pendientes
+        query = query.filter(Venta.tipo == "credito", Venta.saldo_pendiente > 0)
+    return query.scalar() or 0
+
+
+def total_cajas():
+    """Suma de saldos de todas las cajas"""
+    return int(
+        db.session.query(db.func.coalesce(db.func.sum(Caja.saldo_actual), 0)).scalar()
+        or 0
+    )
+
+
+def estadisticas_sistema():
+    """Cantidad de registros por tabla (panel de respaldos) en una sola consulta"""
+    modelos = {
+        "usuarios": Usuario,
+        "clientes": Cliente,
+        "productos": Producto,
+        "ventas": Venta,
+        "abonos": Abono,
+        "comisiones": Comision,
+        "cajas": Caja,
+        "movimientos_caja": MovimientoCaja,
+    }
+    fila = db.session.query(
+        *[
+            db.session.query(db.func.count(modelo.id)).scalar_subquery()
+            for modelo in modelos.values()
+        ]
+    ).one()
+    return {clave: int(valor or 0) for clave, valor in zip(modelos, fila)}
+
+
+def obtener_metricas_dashboard(usuario, ahora=None):
+    """
+    Calcula los indicadores del dashboard para un usuario usando agregados SQL.
+    Retorna un diccionario con los valores numéricos (sin formatear).
+    """
+    ahora = ahora or datetime.now()
+    primer_dia_mes = datetime(ahora.year, ahora.month, 1)
+
+    es_admin = usuario.is_admin()
+    es_vendedor = usuario.is_vendedor()
+    es_cobrador = usuario.is_cobrador()
+
+    metricas = {
+        "total_clientes": 0,
+        "total_productos": 0,
+        "productos_agotados": 0,
+        "productos_stock_bajo": 0,
+        "ventas_mes": 0,
+        "total_ventas_mes": 0,
+        "creditos_activos": 0,
+        "total_creditos": 0,
+        "abonos_mes": 0,
+        "total_abonos_mes": 0,
+        "total_cajas": 0,
+    }
+
+    metricas["total_clientes"] = total_clientes_para(usuario)
+
+    if es_vendedor or es_admin:
+        (
+            metricas["total_productos"],
+            metricas["productos_agotados"],
+            metricas["productos_stock_bajo"],
+        ) = metricas_productos()
+
+    vendedor_id = usuario.id if es_vendedor else None
+
+    # Ventas del mes desde el resumen diario
+    if es_vendedor or es_admin:
+        try:
+            metricas["ventas_mes"], metricas["total_ventas_mes"] = metricas_ventas_mes(
+                primer_dia_mes, vendedor_id
+            )
+        except Exception as e:
+            logger.error(f"Error al consultar ventas: {e}")
+            db.session.rollback()
+
+    # Créditos activos (una consulta agregada por rol)
+    try:
+        metricas["creditos_activos"], metricas["total_creditos"] = metricas_creditos(
+            vendedor_id
+        )
+    except Exception as e:
+        logger.error(f"Error al consultar créditos: {e}")
+        db.session.rollback()
+
+    if es_cobrador or es_admin:
+        try:
+            metricas["abonos_mes"], metricas["total_abonos_mes"] = metricas_abonos(
+                primer_dia_mes, usuario.id if es_cobrador else None
+            )
+        except Exception as e:
+            logger.error(f"Error al consultar abonos: {e}")
+            db.session.rollback()
+
+    if es_admin:
+        try:
+            metricas["total_cajas"] = total_cajas()
+        except Exception as e:
+            logger.error(f"Error al consultar cajas: {e}")
+            db.session.rollback()
+
+    return metricas
+
+
+# CACHÉ DEL DASHBOARD
+# Claves: (rol, usuario_id, versiones). Se invalida tras cada commit que toca los
+# modelos de los que dependen los indicadores: en este proceso de inmediato, y en
+# los demás workers porque el commit incrementa los contadores compartidos de los
+# alcances afectados (versiones_datos) y la clave deja de coincidir.
+cache_dashboard = CacheTTL(ttl=60)
+
+CLAVE_CAMBIOS_DASHBOARD = "cambios_dashboard"
+
+
+def _clave_version(alcance):
+    """Clave en versiones_datos del contador de un alcance del dashboard"""
+    tipo, valor = alcance
+    return "dashboard:todos" if tipo == "todos" else f"dashboard:{tipo}:{valor}"
+
+
+def clave_dashboard(usuario):
+    """Clave de caché del dashboard del usuario, con las versiones de sus alcances"""
+    versiones = leer_versiones(
+        _clave_version(("todos", None)),
+        _clave_version(("rol", usuario.rol)),
+        _clave_version(("usuario", usuario.id)),
+    )
+    return (usuario.rol, usuario.id, versiones)
+
+
+def _alcances_por_cambio(obj):
+    """Retorna los alcances del dashboard afectados por un objeto modificado"""
+    if isinstance(obj, Venta):
+        return {
+            ("rol", "administrador"),
+            ("rol", "cobrador"),
+            ("usuario", obj.vendedor_id),
+        }
+    if isinstance(obj, Abono):
+        return {("rol", "administrador"), ("usuario", obj.cobrador_id)}
+    if isinstance(obj, Comision):
+        return {("rol", "administrador"), ("usuario", obj.usuario_id)}
+    if isinstance(obj, Producto):
+        return {("rol", "administrador"), ("rol", "vendedor")}
+    if isinstance(obj, (Caja, Cliente)):
+        return {("rol", "administrador")}
+    if isinstance(obj, Configuracion):
+        return {("todos", None)}
+    return set()
+
+
+def marcar_cambios_dashboard(session, *alcances):
+    """
+    Registra alcances a invalidar en el próximo commit.
+    Útil para escrituras masivas (UPDATE/DELETE directos) que no pasan por la sesión.
+    """
+    session.info.setdefault(CLAVE_CAMBIOS_DASHBOARD, set()).update(alcances)
+    marcar_versiones(session, *(_clave_version(alcance) for alcance in alcances))
+
+
+def invalidar_dashboard(alcances):
+    """Elimina del caché las entradas de los alcances indicados"""
+    if not alcances:
+        return
+    if ("todos", None) in alcances:
+        cache_dashboard.limpiar()
+        return
+    roles = {valor for tipo, valor in alcances if tipo == "rol"}
+    usuarios = {valor for tipo, valor in alcances if tipo == "usuario"}
+    cache_dashboard.invalidar(
+        lambda clave: clave[0] in roles or clave[1] in usuarios
+    )
+
+
+def _registrar_cambios_flush(session, flush_context):
+    alcances = set()
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        alcances |= _alcances_por_cambio(obj)
+    if alcances:
+        marcar_cambios_dashboard(session, *alcances)
+
+
+def _invalidar_tras_commit(session):
+    invalidar_dashboard(session.info.pop(CLAVE_CAMBIOS_DASHBOARD, set()))
+
+
+def _descartar_tras_rollback(session):
+    session.info.pop(CLAVE_CAMBIOS_DASHBOARD, None)
+
+
+def registrar_eventos_dashboard():
+    """Conecta la invalidación del caché a los eventos de sesión de SQLAlchemy"""
+    if event.contains(Session, "after_flush", _registrar_cambios_flush):
+        return
+    event.listen(Session, "after_flush", _registrar_cambios_flush)
+    event.listen(Session, "after_commit", _invalidar_tras_commit)
+    event.listen(Session, "after_rollback", _descartar_tras_rollback)
@@ -84,6 +84,10 @@ class Cliente(db.Model):
 
 class Venta(db.Model):
     __tablename__ = "ventas"
+    __table_args__ = (
+        # Cursor del listado paginado por (fecha, id): cada página es un recorrido del índice
+        db.Index("ix_ventas_fecha_id", "fecha", "id"),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     cliente_id = db.Column(db.Integer, db.ForeignKey("clientes.id"), nullable=False)
@@ -130,12 +134,16 @@ class Venta(db.Model):
         """
         Retorna el usuario que actualmente gestiona esta venta
         VERSIÓN COMPLETAMENTE CORREGIDA con mejor manejo de errores
+        Los usuarios se resuelven con el mapa de la solicitud (app.gestores): use
+        precargar_usuarios(ventas) antes de recorrer muchas ventas.
         """
+        from app.gestores import obtener_usuario, usuario_fallback
+
         try:
             # Caso 1: Venta transferida con usuario actual válido
             if self.transferida and self.usuario_actual_id:
                 try:
-                    usuario_actual = Usuario.query.get(self.usuario_actual_id)
+                    usuario_actual = obtener_usuario(self.usuario_actual_id)
                     if usuario_actual and usuario_actual.activo:
                         logger.debug(
                             f"Venta {self.id}: Gestor = usuario actual transferido {usuario_actual.nombre}"
@@ -154,7 +162,7 @@ class Venta(db.Model):
 
             # Caso 2: Usar vendedor original (ya sea transferida o no)
             try:
-                vendedor = Usuario.query.get(self.vendedor_id)
+                vendedor = obtener_usuario(self.vendedor_id)
                 if vendedor and vendedor.activo:
                     logger.debug(
                         f"Venta {self.id}: Gestor = vendedor original {vendedor.nombre}"
@@ -169,31 +177,22 @@ class Venta(db.Model):
                     f"Error obteniendo vendedor original para venta {self.id}: {e}"
                 )
 
-            # Caso 3: Fallback - buscar cualquier administrador activo
+            # Caso 3: Fallback - un administrador activo o, como último recurso,
+            # cualquier usuario activo (resuelto una vez por solicitud)
             try:
-                admin_fallback = Usuario.query.filter_by(
-                    rol="administrador", activo=True
-                ).first()
-                if admin_fallback:
+                fallback = usuario_fallback()
+                if fallback and fallback.rol == "administrador":
                     logger.warning(
-                        f"Venta {self.id}: Usando admin fallback {admin_fallback.nombre}"
+                        f"Venta {self.id}: Usando admin fallback {fallback.nombre}"
                     )
-                    return admin_fallback
-            except Exception as e:
-                logger.error(f"Error buscando admin fallback para venta {self.id}: {e}")
-
-            # Caso 4: Último recurso - cualquier usuario activo
-            try:
-                usuario_fallback = Usuario.query.filter_by(activo=True).first()
-                if usuario_fallback:
+                    return fallback
+                if fallback:
                     logger.error(
-                        f"Venta {self.id}: Usando usuario fallback {usuario_fallback.nombre}"
+                        f"Venta {self.id}: Usando usuario fallback {fallback.nombre}"
                     )
-                    return usuario_fallback
+                    return fallback
             except Exception as e:
-                logger.error(
-                    f"Error buscando usuario fallback para venta {self.id}: {e}"
-                )
+                logger.error(f"Error buscando usuario fallback para venta {self.id}: {e}")
 
             # Si llegamos aquí, hay un problema grave
             logger.critical(
@@ -247,6 +246,8 @@ class Venta(db.Model):
         Obtiene el gestor de forma segura, con información adicional de estado
         VERSIÓN COMPLETAMENTE CORREGIDA
         """
+        from app.gestores import obtener_usuario
+
         try:
             # Obtener el gestor actual usando el método usuario_gestor
             gestor = self.usuario_gestor()
@@ -265,14 +266,14 @@ class Venta(db.Model):
             vendedor_original = None
             if self.transferida and self.vendedor_original_id:
                 try:
-                    vendedor_original = Usuario.query.get(self.vendedor_original_id)
+                    vendedor_original = obtener_usuario(self.vendedor_original_id)
                 except Exception as e:
                     logger.warning(
                         f"Error obteniendo vendedor original para venta {self.id}: {e}"
                     )
                     # Si no se puede obtener por vendedor_original_id, usar vendedor_id
                     try:
-                        vendedor_original = Usuario.query.get(self.vendedor_id)
+                        vendedor_original = obtener_usuario(self.vendedor_id)
                     except Exception as e2:
                         logger.error(
                             f"Error obteniendo vendedor por vendedor_id para venta {self.id}: {e2}"
@@ -296,7 +297,7 @@ class Venta(db.Model):
             # Fallback: intentar obtener al menos el vendedor original
             fallback_usuario = None
             try:
-                fallback_usuario = Usuario.query.get(self.vendedor_id)
+                fallback_usuario = obtener_usuario(self.vendedor_id)
             except:
                 pass
 
@@ -366,6 +367,10 @@ class Credito(db.Model):
 
 class Abono(db.Model):
     __tablename__ = "abonos"
+    __table_args__ = (
+        # Cursor del listado paginado por (fecha, id): cada página es un recorrido del índice
+        db.Index("ix_abonos_fecha_id", "fecha", "id"),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     venta_id = db.Column(db.Integer, db.ForeignKey("ventas.id"), nullable=True)
@@ -419,6 +424,10 @@ class Caja(db.Model):
 
 class MovimientoCaja(db.Model):
     __tablename__ = "movimiento_caja"
+    __table_args__ = (
+        # Cursor del movimientos paginados por (fecha, id): cada página es un recorrido del índice
+        db.Index("ix_movimiento_caja_fecha_id", "fecha", "id"),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     caja_id = db.Column(db.Integer, db.ForeignKey("cajas.id"), nullable=False)
@@ -493,6 +502,10 @@ class DetalleVenta(db.Model):
 
 class Comision(db.Model):
     __tablename__ = "comisiones"
+    __table_args__ = (
+        # Cursor del reporte paginado por (fecha_generacion, id): cada página es un recorrido del índice
+        db.Index("ix_comisiones_fecha_generacion_id", "fecha_generacion", "id"),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     usuario_id = db.Column(db.Integer, db.ForeignKey("usuarios.id"), nullable=False)
@@ -687,3 +700,150 @@ class TransferenciaVenta(db.Model):
 
     def __repr__(self):
         return f"<TransferenciaVenta Venta:{self.venta_id} De:{self.usuario_origen_id} A:{self.usuario_destino_id}>"
+
+
+# RESUMEN DIARIO (tabla agregada para reportes y dashboard)
+class ResumenDiario(db.Model):
+    __tablename__ = "resumen_diario"
+    __table_args__ = (
+        db.UniqueConstraint(
+            "fecha", "usuario_id", "caja_id", "tipo", name="uq_resumen_diario_clave"
+        ),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    fecha = db.Column(db.Date, nullable=False, index=True)
+    # 0 cuando el movimiento no está asociado a un usuario o a una caja
+    usuario_id = db.Column(db.Integer, nullable=False, default=0)
+    caja_id = db.Column(db.Integer, nullable=False, default=0)
+    tipo = db.Column(
+        db.String(30), nullable=False
+    )  # 'venta_contado', 'venta_credito', 'abono', 'mov_entrada', 'mov_salida', 'mov_transferencia'
+    cantidad = db.Column(db.Integer, nullable=False, default=0)
+    monto = db.Column(db.BigInteger, nullable=False, default=0)
+
+    def __repr__(self):
+        return f"<ResumenDiario {self.fecha} {self.tipo} Usuario:{self.usuario_id} Caja:{self.caja_id} Monto:{self.monto}>"
+
+
+# CRONOGRAMA DE CUOTAS (generado una vez al crear la venta a crédito)
+class CuotaVenta(db.Model):
+    __tablename__ = "cuotas_venta"
+    __table_args__ = (
+        db.UniqueConstraint("venta_id", "numero", name="uq_cuotas_venta_numero"),
+        # Cuotas pendientes por rango de vencimiento (gestión de cobros)
+        db.Index("ix_cuotas_venta_pendientes", "pagada", "fecha_vencimiento"),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    venta_id = db.Column(
+        db.Integer, db.ForeignKey("ventas.id"), nullable=False, index=True
+    )
+    numero = db.Column(db.Integer, nullable=False)
+    fecha_vencimiento = db.Column(db.Date, nullable=False)
+    monto = db.Column(db.Integer, nullable=False)
+    monto_pagado = db.Column(db.Integer, nullable=False, default=0)
+    pagada = db.Column(db.Boolean, nullable=False, default=False)
+
+    venta = db.relationship(
+        "Venta",
+        backref=db.backref(
+            "cuotas",
+            lazy=True,
+            order_by="CuotaVenta.numero",
+            cascade="all, delete-orphan",
+        ),
+    )
+
+    @property
+    def saldo(self):
+        return max(int(self.monto) - int(self.monto_pagado or 0), 0)
+
+    def __repr__(self):
+        return f"<CuotaVenta Venta:{self.venta_id} #{self.numero} {self.fecha_vencimiento} Monto:{self.monto} Pagado:{self.monto_pagado}>"
+
+
+# VERSIONES DE DATOS CACHEADOS EN MEMORIA (compartidas por todos los workers)
+class VersionDatos(db.Model):
+    __tablename__ = "versiones_datos"
+
+    clave = db.Column(db.String(50), primary_key=True)  # 'configuracion'
+    version = db.Column(db.Integer, nullable=False, default=0)
+
+    def __repr__(self):
+        return f"<VersionDatos {self.clave} v{self.version}>"
+
+
+# LIQUIDACIONES DE COMISIONES (cada pago registrado y las comisiones que incluyó)
+class LiquidacionComision(db.Model):
+    __tablename__ = "liquidaciones_comision"
+
+    id = db.Column(db.Integer, primary_key=True)
+    fecha = db.Column(db.DateTime, default=datetime.utcnow, index=True)
+    realizada_por_id = db.Column(
+        db.Integer, db.ForeignKey("usuarios.id"), nullable=False
+    )
+    # Filtros usados (vacíos cuando se liquidaron comisiones seleccionadas)
+    fecha_inicio = db.Column(db.DateTime, nullable=True)
+    fecha_fin = db.Column(db.DateTime, nullable=True)
+    usuario_id = db.Column(db.Integer, db.ForeignKey("usuarios.id"), nullable=True)
+    cantidad = db.Column(db.Integer, nullable=False, default=0)
+    total = db.Column(db.BigInteger, nullable=False, default=0)
+    revertida = db.Column(db.Boolean, nullable=False, default=False)
+    fecha_reversion = db.Column(db.DateTime, nullable=True)
+    revertida_por_id = db.Column(db.Integer, db.ForeignKey("usuarios.id"), nullable=True)
+
+    realizada_por = db.relationship("Usuario", foreign_keys=[realizada_por_id])
+    usuario = db.relationship("Usuario", foreign_keys=[usuario_id])
+    revertida_por = db.relationship("Usuario", foreign_keys=[revertida_por_id])
+
+    def __repr__(self):
+        return f"<LiquidacionComision {self.id} Comisiones:{self.cantidad} Total:{self.total}>"
+
+
+class ComisionLiquidada(db.Model):
+    __tablename__ = "comisiones_liquidadas"
+
+    liquidacion_id = db.Column(
+        db.Integer, db.ForeignKey("liquidaciones_comision.id"), primary_key=True
+    )
+    # Sin clave foránea: eliminar un abono borra sus comisiones, y el detalle de
+    # la liquidación (con la copia de lo pagado) debe conservarse
+    comision_id = db.Column(db.Integer, primary_key=True, index=True)
+    usuario_id = db.Column(db.Integer, nullable=False)
+    monto_comision = db.Column(db.Integer, nullable=False)
+
+    liquidacion = db.relationship(
+        "LiquidacionComision",
+        backref=db.backref("comisiones", lazy="dynamic", cascade="all, delete-orphan"),
+    )
+
+    def __repr__(self):
+        return f"<ComisionLiquidada Liquidación:{self.liquidacion_id} Comisión:{self.comision_id}>"
+
+
+# SALDOS DE COMISIONES POR PERÍODO (mantenidos al generar, liquidar o eliminar comisiones)
+class SaldoComisionPeriodo(db.Model):
+    __tablename__ = "saldos_comision_periodo"
+    __table_args__ = (
+        db.UniqueConstraint("usuario_id", "periodo", name="uq_saldo_comision_periodo"),
+        db.Index("ix_saldos_comision_periodo_periodo", "periodo"),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    usuario_id = db.Column(db.Integer, db.ForeignKey("usuarios.id"), nullable=False)
+    # '2024-05' (mensual) o '2024-05-1' / '2024-05-2' (quincenas): cada comisión
+    # se acumula en ambos, así el período configurado siempre es una sola fila
+    periodo = db.Column(db.String(20), nullable=False)
+    cantidad = db.Column(db.Integer, nullable=False, default=0)
+    acumulado = db.Column(db.BigInteger, nullable=False, default=0)
+    pagado = db.Column(db.BigInteger, nullable=False, default=0)
+
+    usuario = db.relationship("Usuario")
+
+    @property
+    def pendiente(self):
+        return int(self.acumulado or 0) - int(self.pagado or 0)
+
+    def __repr__(self):
+        return f"<SaldoComisionPeriodo {self.periodo} Usuario:{self.usuario_id} Acumulado:{self.acumulado} Pagado:{self.pagado}>"
@@ -0,0 +1,210 @@
+from datetime import datetime
+import base64
+import json
+
+from flask import request, url_for, current_app
+from sqlalchemy.engine import Row
+
+from app import db
+
+TAMANO_MAXIMO = 200
+
+
+def _codificar_cursor(valores):
+    """Convierte los valores de la clave de orden en un token para la URL"""
+    datos = [
+        {"dt": valor.isoformat()} if isinstance(valor, datetime) else valor
+        for valor in valores
+    ]
+    texto = json.dumps(datos, separators=(",", ":"))
+    return base64.urlsafe_b64encode(texto.encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def _decodificar_cursor(cursor):
+    """Retorna la lista de valores del cursor o None si no hay o es inválido"""
+    if not cursor:
+        return None
+    try:
+        relleno = "=" * (-len(cursor) % 4)
+        datos = json.loads(base64.urlsafe_b64decode(cursor + relleno).decode("utf-8"))
+        return [
+            datetime.fromisoformat(valor["dt"]) if isinstance(valor, dict) else valor
+            for valor in datos
+        ]
+    except (ValueError, TypeError, KeyError):
+        return None
+
+
+def tamano_pagina():
+    """Tamaño de página: ?por_pagina= o PAGINA_TAMANO, con un máximo"""
+    por_pagina = request.args.get("por_pagina", type=int) or current_app.config.get(
+        "PAGINA_TAMANO", 50
+    )
+    return min(max(por_pagina, 1), TAMANO_MAXIMO)
+
+
+class PaginaKeyset:
+    """Una página de resultados con los cursores para avanzar y retroceder"""
+
+    def __init__(self, items, cursor_siguiente=None, cursor_anterior=None, tamano=50):
+        self.items = items
+        self.cursor_siguiente = cursor_siguiente
+        self.cursor_anterior = cursor_anterior
+        self.tamano = tamano
+
+    @property
+    def hay_siguiente(self):
+        return self.cursor_siguiente is not None
+
+    @property
+    def hay_anterior(self):
+        return self.cursor_anterior is not None
+
+    @staticmethod
+    def _argumentos():
+        # Conserva los filtros actuales (busqueda, desde, hasta, tipo, estado...)
+        argumentos = {
+            clave: valor
+            for clave, valor in request.args.items()
+            if clave not in ("cursor", "dir")
+        }
+        argumentos.update(request.view_args or {})
+        return argumentos
+
+    def url_siguiente(self):
+        if not self.hay_siguiente:
+            return None
+        return url_for(
+            request.endpoint, cursor=self.cursor_siguiente, dir="sig", **self._argumentos()
+        )
+
+    def url_anterior(self):
+        if not self.hay_anterior:
+            return None
+        return url_for(
+            request.endpoint, cursor=self.cursor_anterior, dir="ant", **self._argumentos()
+        )
+
+    def url_inicio(self):
+        return url_for(request.endpoint, **self._argumentos())
+
+
+def sumar_si(condicion, valor):
+    """SUM(CASE WHEN condicion THEN valor ELSE 0 END)"""
+    return db.func.sum(db.case((condicion, valor), else_=0))
+
+
+def contar_si(condicion):
+    """COUNT(CASE WHEN condicion THEN 1 END)"""
+    return db.func.count(db.case((condicion, 1)))
+
+
+def totales_listado(query, **expresiones):
+    """
+    Totales del pie/resumen de un listado en una sola consulta agregada sobre el
+    mismo filtro que la página (joins y condiciones incluidos), sin cargar filas.
+    Ejemplo: totales_listado(query, cantidad=db.func.count(Abono.id),
+    monto=db.func.sum(Abono.monto)) -> {"cantidad": 12, "monto": 340000}
+    """
+    fila = (
+        query.order_by(None)
+        .with_entities(*[db.func.coalesce(e, 0) for e in expresiones.values()])
+        .one()
+    )
+    return {clave: int(valor or 0) for clave, valor in zip(expresiones, fila)}
+
+
+def _anulable(columna):
+    return bool(getattr(columna.expression, "nullable", False))
+
+
+def _segmentos(columnas, ascendente):
+    """
+    Partes del recorrido, en orden: [(con_nulos, columnas_de_orden)]. Si la primera
+    columna admite nulos, las filas sin valor van al final del orden descendente
+    (al principio del ascendente) y se ordenan por las demás columnas. Cada parte
+    se ordena por las columnas tal cual, así la sirve un índice (fecha, id).
+    """
+    if len(columnas) < 2 or not _anulable(columnas[0]):
+        return [(False, columnas)]
+    segmentos = [(False, columnas), (True, columnas[1:])]
+    return segmentos[::-1] if ascendente else segmentos
+
+
+def paginar_keyset(query, columnas, tamano=None, descendente=True):
+    """
+    Pagina una consulta por clave (keyset) en orden descendente (o ascendente)
+    de las columnas indicadas, p. ej. (Venta.fecha, Venta.id), o de expresiones
+    con nombre seleccionadas en la consulta. La última columna debe ser única; si
+    la primera admite nulos, esas filas van al final.
+    Lee ?cursor= y ?dir=ant de la petición. Cada página cuesta lo mismo sin
+    importar qué tan atrás esté en el historial (no usa OFFSET).
+    """
+    tamano = tamano or tamano_pagina()
+    cursor = _decodificar_cursor(request.args.get("cursor"))
+    if cursor is not None and (
+        len(cursor) != len(columnas)
+        or None in cursor[1:]
+        or (cursor[0] is None and len(_segmentos(columnas, False)) < 2)
+    ):
+        cursor = None
+    anterior = cursor is not None and request.args.get("dir") == "ant"
+    # Al retroceder se recorre en sentido inverso y luego se invierte la página
+    ascendente = anterior if descendente else not anterior
+
+    segmentos = _segmentos(columnas, ascendente)
+    dividido = len(segmentos) > 1
+    if cursor is not None:
+        # El recorrido empieza en la parte del cursor
+        con_nulos = cursor[0] is None
+        while segmentos[0][0] != con_nulos:
+            segmentos.pop(0)
+
+    filas = []
+    query = query.order_by(None)
+    for indice, (con_nulos, orden) in enumerate(segmentos):
+        parte = query
+        if dividido:
+            parte = parte.filter(columnas[0].is_(None) if con_nulos else columnas[0].isnot(None))
+        if cursor is not None and indice == 0:
+            valores = cursor[len(columnas) - len(orden):]
+            clave = db.tuple_(*orden)
+            limite = db.tuple_(
+                *[db.literal(valor, columna.type) for columna, valor in zip(orden, valores)]
+            )
+            parte = parte.filter(clave > limite if ascendente else clave < limite)
+        filas += (
+            parte.order_by(*[c.asc() if ascendente else c.desc() for c in orden])
+            .limit(tamano + 1 - len(filas))
+            .all()
+        )
+        if len(filas) > tamano:
+            break
+
+    hay_mas = len(filas) > tamano
+    filas = filas[:tamano]
+    if anterior:
+        filas.reverse()
+
+    def clave_de(fila):
+        # Con varias entidades (p. ej. (Venta, Gestor)) la clave es de la primera;
+        # las expresiones con nombre (p. ej. relevancia) se leen de la fila
+        if not isinstance(fila, Row):
+            return _codificar_cursor([getattr(fila, columna.key) for columna in columnas])
+        return _codificar_cursor(
+            [
+                fila._mapping[columna.key]
+                if columna.key in fila._mapping
+                else getattr(fila[0], columna.key)
+                for columna in columnas
+            ]
+        )
+
+    cursor_siguiente = cursor_anterior = None
+    if filas:
+        if anterior or hay_mas:
+            cursor_siguiente = clave_de(filas[-1])
+        if (anterior and hay_mas) or (not anterior and cursor is not None):
+            cursor_anterior = clave_de(filas[0])
+
+    return PaginaKeyset(filas, cursor_siguiente, cursor_anterior, tamano)
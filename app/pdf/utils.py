@@ -1,7 +1,7 @@
 from fpdf import FPDF
 import os
 from datetime import datetime
-from app.models import Configuracion
+from app.ajustes import obtener_ajustes
 
 
 class CreditAppPDF(FPDF):
@@ -29,10 +29,8 @@ class CreditAppPDF(FPDF):
             uni=True,
         )
 
-        try:
-            self.config = Configuracion.query.first()
-        except:
-            self.config = None
+        # Ajustes de la empresa (copia cacheada, sin consulta por PDF)
+        self.config = obtener_ajustes()
 
     def header(self):
         text_y = 10
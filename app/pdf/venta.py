@@ -1,5 +1,11 @@
 from app.pdf.utils import CreditAppPDF
-from datetime import datetime, timedelta
+from app.cronograma import (
+    CUOTAS_POR_DEFECTO,
+    FRECUENCIA_POR_DEFECTO,
+    calcular_cuotas,
+    distribuir_pagos,
+    frecuencia_de,
+)
 
 
 def generar_pdf_venta(venta):
@@ -50,17 +56,32 @@ def generar_pdf_venta(venta):
 
         pdf.ln(3)
         pdf.seccion("PLAN DE PAGOS")
-        frecuencia = "Quincenal"
-        num_cuotas = 4
-        valor_cuota = venta.saldo_pendiente / num_cuotas
-        fecha_primer_pago = venta.fecha + timedelta(days=15)
+        if venta.cuotas:
+            cuotas = [
+                (c.numero, c.fecha_vencimiento, c.monto, c.pagada) for c in venta.cuotas
+            ]
+        else:
+            # Venta sin cronograma persistido: plan por defecto sin guardar
+            plan = calcular_cuotas(
+                venta.total, venta.fecha, CUOTAS_POR_DEFECTO, FRECUENCIA_POR_DEFECTO
+            )
+            pagados = distribuir_pagos(
+                [monto for _, _, monto in plan],
+                int(venta.total or 0) - int(venta.saldo_pendiente or 0),
+            )
+            cuotas = [
+                (numero, fecha, monto, pagado >= monto)
+                for (numero, fecha, monto), pagado in zip(plan, pagados)
+            ]
+        frecuencia = frecuencia_de(venta).capitalize()
+        num_cuotas = len(cuotas)
+        valor_cuota = cuotas[0][2]
+        fecha_primer_pago = cuotas[0][1]
 
         pdf.campo("Frecuencia de pago", frecuencia)
         pdf.campo("Valor de cada cuota", pdf.formato_moneda(valor_cuota))
         pdf.campo("Número de cuotas", str(num_cuotas))
-        pdf.campo(
-            "Fecha primer pago", fecha_primer_pago.strftime("%d/%m/%Y") + " (aprox)"
-        )
+        pdf.campo("Fecha primer pago", fecha_primer_pago.strftime("%d/%m/%Y"))
 
         pdf.ln(3)
         pdf.set_font("Roboto", "B", 11)
@@ -70,22 +91,14 @@ def generar_pdf_venta(venta):
         headers_cuotas = ["Cuota", "Fecha", "Valor", "Estado"]
         col_widths_cuotas = pdf.tabla_inicio(headers_cuotas, [25, 55, 50, 60])
 
-        fecha_cuota = fecha_primer_pago
-        total_abonado = sum(a.monto for a in venta.abonos) if venta.abonos else 0
-
-        for i in range(num_cuotas):
-            cuota_num = i + 1
-            estado = (
-                "PAGADO" if total_abonado >= valor_cuota * cuota_num else "PENDIENTE"
-            )
+        for i, (cuota_num, fecha_cuota, monto_cuota, pagada) in enumerate(cuotas):
             datos_cuota = [
                 str(cuota_num),
                 fecha_cuota.strftime("%d/%m/%Y"),
-                pdf.formato_moneda(valor_cuota),
-                estado,
+                pdf.formato_moneda(monto_cuota),
+                "PAGADO" if pagada else "PENDIENTE",
             ]
             pdf.tabla_fila(datos_cuota, col_widths_cuotas, i % 2 == 0, [0, 2])
-            fecha_cuota += timedelta(days=15)
 
         if venta.abonos and len(venta.abonos) > 0:
             pdf.ln(3)
@@ -0,0 +1,193 @@
+from datetime import datetime, date
+import logging
+
+import click
+from flask.cli import with_appcontext
+from sqlalchemy.exc import IntegrityError
+
+from app import db
+from app.models import ResumenDiario, Venta, Abono, MovimientoCaja
+
+logger = logging.getLogger("app.resumen")
+
+
+def _a_fecha(valor):
+    """Normaliza datetime/date/str (SQLite devuelve texto en func.date) a date"""
+    if valor is None:
+        return datetime.utcnow().date()
+    if isinstance(valor, datetime):
+        return valor.date()
+    if isinstance(valor, date):
+        return valor
+    return date.fromisoformat(str(valor)[:10])
+
+
+def actualizar_resumen(fecha, tipo, monto, usuario_id=None, caja_id=None, cantidad=1):
+    """
+    Suma (o resta, con valores negativos) un movimiento en la fila del resumen diario.
+    No hace commit: se ejecuta dentro de la transacción de quien la llama.
+    """
+    clave = {
+        "fecha": _a_fecha(fecha),
+        "usuario_id": usuario_id or 0,
+        "caja_id": caja_id or 0,
+        "tipo": tipo,
+    }
+    monto = int(monto or 0)
+
+    # Actualización atómica en la base de datos si la fila ya existe
+    filas = ResumenDiario.query.filter_by(**clave).update(
+        {
+            ResumenDiario.cantidad: ResumenDiario.cantidad + cantidad,
+            ResumenDiario.monto: ResumenDiario.monto + monto,
+        },
+        synchronize_session=False,
+    )
+    if filas:
+        return
+
+    # Si no existe, crearla en un savepoint por si otra transacción la insertó primero
+    try:
+        with db.session.begin_nested():
+            db.session.add(ResumenDiario(cantidad=cantidad, monto=monto, **clave))
+    except IntegrityError:
+        ResumenDiario.query.filter_by(**clave).update(
+            {
+                ResumenDiario.cantidad: ResumenDiario.cantidad + cantidad,
+                ResumenDiario.monto: ResumenDiario.monto + monto,
+            },
+            synchronize_session=False,
+        )
+
+
+def resumir_venta(venta, signo=1):
+    """Registra (signo=1) o revierte (signo=-1) una venta en el resumen diario"""
+    actualizar_resumen(
+        venta.fecha,
+        f"venta_{venta.tipo}",
+        signo * int(venta.total or 0),
+        usuario_id=venta.vendedor_id,
+        cantidad=signo,
+    )
+
+
+def resumir_abono(abono, signo=1, monto=None, caja_id=None):
+    """Registra o revierte un abono; monto/caja_id permiten revertir valores anteriores"""
+    actualizar_resumen(
+        abono.fecha,
+        "abono",
+        signo * int(abono.monto if monto is None else monto),
+        usuario_id=abono.cobrador_id,
+        caja_id=abono.caja_id if caja_id is None else caja_id,
+        cantidad=signo,
+    )
+
+
+def resumir_movimiento(movimiento, signo=1):
+    """Registra o revierte un movimiento de caja en el resumen diario"""
+    actualizar_resumen(
+        movimiento.fecha,
+        f"mov_{movimiento.tipo}",
+        signo * int(movimiento.monto or 0),
+        caja_id=movimiento.caja_id,
+        cantidad=signo,
+    )
+
+
+def totales_resumen(tipos, desde=None, hasta=None, usuario_id=None, caja_id=None):
+    """
+    Retorna (cantidad, monto) acumulados en el resumen para los tipos indicados.
+    desde/hasta son inclusivos y se comparan por día.
+    """
+    query = db.session.query(
+        db.func.coalesce(db.func.sum(ResumenDiario.cantidad), 0),
+        db.func.coalesce(db.func.sum(ResumenDiario.monto), 0),
+    ).filter(ResumenDiario.tipo.in_(tipos))
+
+    if desde is not None:
+        query = query.filter(ResumenDiario.fecha >= _a_fecha(desde))
+    if hasta is not None:
+        query = query.filter(ResumenDiario.fecha <= _a_fecha(hasta))
+    if usuario_id is not None:
+        query = query.filter(ResumenDiario.usuario_id == usuario_id)
+    if caja_id is not None:
+        query = query.filter(ResumenDiario.caja_id == caja_id)
+
+    cantidad, monto = query.one()
+    return int(cantidad or 0), int(monto or 0)
+
+
+def reconstruir_resumen():
+    """
+    Reconstruye el resumen diario completo a partir de ventas, abonos y movimientos.
+    Retorna el número de filas generadas. No hace commit.
+    """
+    acumulado = {}
+
+    def acumular(fecha, usuario_id, caja_id, tipo, cantidad, monto):
+        clave = (_a_fecha(fecha), usuario_id or 0, caja_id or 0, tipo)
+        actual = acumulado.get(clave, (0, 0))
+        acumulado[clave] = (actual[0] + int(cantidad or 0), actual[1] + int(monto or 0))
+
+    ventas = db.session.query(
+        db.func.date(Venta.fecha),
+        Venta.vendedor_id,
+        Venta.tipo,
+        db.func.count(Venta.id),
+        db.func.sum(Venta.total),
+    ).group_by(db.func.date(Venta.fecha), Venta.vendedor_id, Venta.tipo)
+    for fecha, vendedor_id, tipo, cantidad, monto in ventas:
+        acumular(fecha, vendedor_id, 0, f"venta_{tipo}", cantidad, monto)
+
+    abonos = db.session.query(
+        db.func.date(Abono.fecha),
+        Abono.cobrador_id,
+        Abono.caja_id,
+        db.func.count(Abono.id),
+        db.func.sum(Abono.monto),
+    ).group_by(db.func.date(Abono.fecha), Abono.cobrador_id, Abono.caja_id)
+    for fecha, cobrador_id, caja_id, cantidad, monto in abonos:
+        acumular(fecha, cobrador_id, caja_id, "abono", cantidad, monto)
+
+    movimientos = db.session.query(
+        db.func.date(MovimientoCaja.fecha),
+        MovimientoCaja.caja_id,
+        MovimientoCaja.tipo,
+        db.func.count(MovimientoCaja.id),
+        db.func.sum(MovimientoCaja.monto),
+    ).group_by(
+        db.func.date(MovimientoCaja.fecha), MovimientoCaja.caja_id, MovimientoCaja.tipo
+    )
+    for fecha, caja_id, tipo, cantidad, monto in movimientos:
+        acumular(fecha, 0, caja_id, f"mov_{tipo}", cantidad, monto)
+
+    ResumenDiario.query.delete(synchronize_session=False)
+    db.session.bulk_insert_mappings(
+        ResumenDiario,
+        [
+            {
+                "fecha": fecha,
+                "usuario_id": usuario_id,
+                "caja_id": caja_id,
+                "tipo": tipo,
+                "cantidad": cantidad,
+                "monto": monto,
+            }
+            for (fecha, usuario_id, caja_id, tipo), (cantidad, monto) in acumulado.items()
+        ],
+    )
+    return len(acumulado)
+
+
+@click.command("reconstruir-resumen")
+@with_appcontext
+def reconstruir_resumen_command():
+    """Reconstruye desde cero la tabla resumen_diario."""
+    try:
+        filas = reconstruir_resumen()
+        db.session.commit()
+        click.echo(f"Resumen diario reconstruido: {filas} filas.")
+    except Exception as e:
+        db.session.rollback()
+        logger.error(f"Error reconstruyendo resumen diario: {e}")
+        raise click.ClickException(f"No se pudo reconstruir el resumen: {e}")
@@ -0,0 +1,129 @@
+from datetime import datetime
+
+from sqlalchemy.orm.util import identity_key
+
+from app import db
+from app.esquema import esquema, COLUMNAS_OPCIONALES
+from app.metricas import marcar_cambios_dashboard
+from app.models import Caja, MovimientoCaja
+from app.resumen import resumir_movimiento
+
+class SaldoInsuficiente(ValueError):
+    """La caja no tiene saldo para la salida o transferencia solicitada"""
+
+
+def efecto_en_saldo(tipo, monto, caja_destino_id=None):
+    """
+    Cambio que un movimiento produce en el saldo de su caja. Una transferencia
+    sin caja destino no mueve el saldo (igual que antes de los UPDATE atómicos).
+    """
+    monto = int(monto or 0)
+    if tipo == "entrada":
+        return monto
+    if tipo == "salida" or (tipo == "transferencia" and caja_destino_id):
+        return -monto
+    return 0
+
+
+def aplicar_delta_caja(caja_id, delta, exigir_saldo=False):
+    """
+    Suma delta al saldo en la base de datos con
+    UPDATE cajas SET saldo_actual = saldo_actual + :delta, sin leer el saldo en
+    Python: dos cobros simultáneos a la misma caja nunca se pisan.
+    Con exigir_saldo el UPDATE solo se aplica si el saldo alcanza (WHERE
+    saldo_actual + :delta >= 0) y si no lanza SaldoInsuficiente. No hace commit.
+    """
+    delta = int(delta or 0)
+    query = Caja.query.filter(Caja.id == caja_id)
+    if exigir_saldo and delta < 0:
+        query = query.filter(Caja.saldo_actual >= -delta)
+
+    actualizadas = query.update(
+        {Caja.saldo_actual: Caja.saldo_actual + delta}, synchronize_session=False
+    )
+    if actualizadas != 1:
+        if exigir_saldo and db.session.get(Caja, caja_id) is not None:
+            raise SaldoInsuficiente(f"Saldo insuficiente en la caja {caja_id}")
+        raise ValueError(f"Caja con ID {caja_id} no encontrada")
+
+    # La caja cargada en la sesión debe releer el saldo la próxima vez
+    caja = db.session.identity_map.get(identity_key(Caja, caja_id))
+    if caja is not None:
+        db.session.expire(caja, ["saldo_actual"])
+
+    # El UPDATE directo no pasa por el flush: invalidar el total de cajas del dashboard
+    marcar_cambios_dashboard(db.session, ("rol", "administrador"))
+
+
+def _agregar_movimiento(caja_id, tipo, monto, descripcion, campos):
+    # Omitir columnas opcionales que la base de datos aún no tiene
+    opcionales = COLUMNAS_OPCIONALES["movimiento_caja"]
+    campos = {
+        campo: valor
+        for campo, valor in campos.items()
+        if campo not in opcionales or esquema.tiene_columna("movimiento_caja", campo)
+    }
+    campos.setdefault("fecha", datetime.utcnow())
+    movimiento = MovimientoCaja(
+        caja_id=caja_id, tipo=tipo, monto=monto, descripcion=descripcion, **campos
+    )
+    db.session.add(movimiento)
+    resumir_movimiento(movimiento)
+    return movimiento
+
+
+def registrar_movimiento(caja_id, tipo, monto, descripcion=None, exigir_saldo=False, **campos):
+    """
+    Agrega el movimiento (y su resumen diario) y aplica su efecto al saldo de la
+    caja en la misma transacción. campos: venta_id, abono_id, caja_destino_id, fecha
+    (las columnas opcionales que no existan en la base se omiten).
+    Retorna el MovimientoCaja. No hace commit.
+    """
+    aplicar_delta_caja(
+        caja_id,
+        efecto_en_saldo(tipo, monto, campos.get("caja_destino_id")),
+        exigir_saldo=exigir_saldo,
+    )
+    return _agregar_movimiento(caja_id, tipo, monto, descripcion, campos)
+
+
+def transferir(caja_id, caja_destino_id, monto, descripcion=None, exigir_saldo=False):
+    """
+    Transferencia entre cajas: movimiento 'transferencia' en el origen y 'entrada'
+    en el destino, con ambos saldos actualizados en la base de datos.
+    Retorna: (movimiento_origen, movimiento_destino). No hace commit.
+    """
+    if caja_id == caja_destino_id:
+        raise ValueError("La caja destino debe ser distinta de la caja origen")
+    caja = db.session.get(Caja, caja_id)
+    if caja is None:
+        raise ValueError(f"Caja con ID {caja_id} no encontrada")
+
+    # Actualizar en orden de id: dos transferencias cruzadas no se interbloquean
+    deltas = {caja_id: -int(monto), caja_destino_id: int(monto)}
+    for id_caja in sorted(deltas):
+        aplicar_delta_caja(
+            id_caja, deltas[id_caja], exigir_saldo=exigir_saldo and id_caja == caja_id
+        )
+
+    origen = _agregar_movimiento(
+        caja_id, "transferencia", monto, descripcion, {"caja_destino_id": caja_destino_id}
+    )
+    destino = _agregar_movimiento(
+        caja_destino_id, "entrada", monto, f"Transferencia desde {caja.nombre}",
+        {"caja_destino_id": caja_id},
+    )
+    return origen, destino
+
+
+def revertir_movimiento(movimiento):
+    """
+    Deshace el efecto del movimiento en el saldo y en el resumen diario y lo
+    elimina. No hace commit.
+    """
+    aplicar_delta_caja(
+        movimiento.caja_id,
+        -efecto_en_saldo(movimiento.tipo, movimiento.monto, movimiento.caja_destino_id),
+    )
+    resumir_movimiento(movimiento, signo=-1)
+    db.session.delete(movimiento)
@@ -0,0 +1,215 @@
+from datetime import datetime, date, timedelta
+import logging
+
+import click
+from flask.cli import with_appcontext
+from sqlalchemy.exc import IntegrityError
+
+from app import db
+from app.ajustes import obtener_ajustes
+from app.models import Comision, SaldoComisionPeriodo
+
+logger = logging.getLogger("app.saldos_comision")
+
+
+def _a_fecha(valor):
+    """Normaliza datetime/date/str (SQLite devuelve texto en func.date) a date"""
+    if valor is None:
+        return None
+    if isinstance(valor, datetime):
+        return valor.date()
+    if isinstance(valor, date):
+        return valor
+    return date.fromisoformat(str(valor)[:10])
+
+
+def claves_periodo(fecha):
+    """Claves mensual y quincenal del día: ('2024-05', '2024-05-1')"""
+    mes = f"{fecha.year}-{fecha.month:02d}"
+    return mes, f"{mes}-{1 if fecha.day <= 15 else 2}"
+
+
+def clave_periodo(fecha, tipo):
+    """Clave del período ('mensual' o 'quincenal') que contiene la fecha"""
+    mensual, quincenal = claves_periodo(fecha)
+    return mensual if tipo == "mensual" else quincenal
+
+
+def rango_periodo(tipo, hoy=None):
+    """(fecha_inicio, fecha_fin) del período que contiene hoy; fecha_fin es su último día"""
+    hoy = hoy or datetime.now()
+    if hoy.month == 12:
+        ultimo_dia_mes = datetime(hoy.year + 1, 1, 1) - timedelta(days=1)
+    else:
+        ultimo_dia_mes = datetime(hoy.year, hoy.month + 1, 1) - timedelta(days=1)
+
+    if tipo == "mensual":
+        return datetime(hoy.year, hoy.month, 1), ultimo_dia_mes
+    if hoy.day <= 15:
+        return datetime(hoy.year, hoy.month, 1), datetime(hoy.year, hoy.month, 15)
+    return datetime(hoy.year, hoy.month, 16), ultimo_dia_mes
+
+
+def _sumar(usuario_id, periodo, cantidad=0, acumulado=0, pagado=0):
+    """Suma los valores en la fila (usuario, periodo), creándola si no existe. No hace commit."""
+    clave = {"usuario_id": usuario_id, "periodo": periodo}
+    cambios = {
+        SaldoComisionPeriodo.cantidad: SaldoComisionPeriodo.cantidad + cantidad,
+        SaldoComisionPeriodo.acumulado: SaldoComisionPeriodo.acumulado + acumulado,
+        SaldoComisionPeriodo.pagado: SaldoComisionPeriodo.pagado + pagado,
+    }
+
+    # Actualización atómica en la base de datos si la fila ya existe
+    if SaldoComisionPeriodo.query.filter_by(**clave).update(
+        cambios, synchronize_session=False
+    ):
+        return
+
+    # Si no existe, crearla en un savepoint por si otra transacción la insertó primero
+    try:
+        with db.session.begin_nested():
+            db.session.add(
+                SaldoComisionPeriodo(
+                    cantidad=cantidad, acumulado=acumulado, pagado=pagado, **clave
+                )
+            )
+    except IntegrityError:
+        SaldoComisionPeriodo.query.filter_by(**clave).update(
+            cambios, synchronize_session=False
+        )
+
+
+def registrar_comision(comision, signo=1):
+    """
+    Suma (signo=1) o descuenta (signo=-1, al eliminarla) una comisión en los
+    saldos de sus períodos mensual y quincenal. No hace commit.
+    """
+    fecha = _a_fecha(comision.fecha_generacion)
+    if fecha is None or not comision.usuario_id:
+        return
+    monto = signo * int(comision.monto_comision or 0)
+    for periodo in claves_periodo(fecha):
+        _sumar(
+            comision.usuario_id,
+            periodo,
+            cantidad=signo,
+            acumulado=monto,
+            pagado=monto if comision.pagado else 0,
+        )
+
+
+def registrar_pagos(filas, signo=1):
+    """
+    Aplica a los saldos comisiones pagadas (signo=1) o devueltas a pendientes
+    (signo=-1). filas: (usuario_id, monto_comision, fecha_generacion), p. ej. las
+    devueltas por el UPDATE ... RETURNING de la liquidación. Una actualización
+    por usuario y período, no por comisión. No hace commit.
+    """
+    pagos = {}
+    for usuario_id, monto, fecha in filas:
+        fecha = _a_fecha(fecha)
+        if fecha is None:
+            continue
+        for periodo in claves_periodo(fecha):
+            clave = (usuario_id, periodo)
+            pagos[clave] = pagos.get(clave, 0) + signo * int(monto or 0)
+
+    for (usuario_id, periodo), monto in sorted(pagos.items()):
+        _sumar(usuario_id, periodo, pagado=monto)
+
+
+def saldo_periodo(usuario_id=None, tipo=None, hoy=None):
+    """
+    Saldo de comisiones del período actual (o del que contiene hoy).
+    Con usuario_id lee una sola fila; sin él suma las filas del período (una por usuario).
+    Retorna: {"periodo", "acumulado", "pagado", "pendiente", "cantidad"}
+    """
+    tipo = tipo or obtener_ajustes().periodo_comision
+    periodo = clave_periodo(hoy or datetime.now(), tipo)
+
+    if usuario_id:
+        saldo = SaldoComisionPeriodo.query.filter_by(
+            usuario_id=usuario_id, periodo=periodo
+        ).first()
+        cantidad, acumulado, pagado = (
+            (saldo.cantidad, saldo.acumulado, saldo.pagado) if saldo else (0, 0, 0)
+        )
+    else:
+        cantidad, acumulado, pagado = (
+            db.session.query(
+                db.func.coalesce(db.func.sum(SaldoComisionPeriodo.cantidad), 0),
+                db.func.coalesce(db.func.sum(SaldoComisionPeriodo.acumulado), 0),
+                db.func.coalesce(db.func.sum(SaldoComisionPeriodo.pagado), 0),
+            )
+            .filter(SaldoComisionPeriodo.periodo == periodo)
+            .one()
+        )
+
+    acumulado, pagado = int(acumulado or 0), int(pagado or 0)
+    return {
+        "periodo": periodo,
+        "cantidad": int(cantidad or 0),
+        "acumulado": acumulado,
+        "pagado": pagado,
+        "pendiente": acumulado - pagado,
+    }
+
+
+def reconstruir_saldos_comision():
+    """
+    Reconstruye los saldos de todos los períodos a partir de las comisiones.
+    Retorna el número de filas generadas. No hace commit.
+    """
+    acumulado = {}
+    filas = (
+        db.session.query(
+            db.func.date(Comision.fecha_generacion),
+            Comision.usuario_id,
+            Comision.pagado,
+            db.func.count(Comision.id),
+            db.func.sum(Comision.monto_comision),
+        )
+        .filter(Comision.fecha_generacion.isnot(None))
+        .group_by(
+            db.func.date(Comision.fecha_generacion), Comision.usuario_id, Comision.pagado
+        )
+    )
+    for fecha, usuario_id, pagado, cantidad, monto in filas:
+        monto = int(monto or 0)
+        for periodo in claves_periodo(_a_fecha(fecha)):
+            actual = acumulado.get((usuario_id, periodo), (0, 0, 0))
+            acumulado[(usuario_id, periodo)] = (
+                actual[0] + int(cantidad or 0),
+                actual[1] + monto,
+                actual[2] + (monto if pagado else 0),
+            )
+
+    SaldoComisionPeriodo.query.delete(synchronize_session=False)
+    db.session.bulk_insert_mappings(
+        SaldoComisionPeriodo,
+        [
+            {
+                "usuario_id": usuario_id,
+                "periodo": periodo,
+                "cantidad": cantidad,
+                "acumulado": total,
+                "pagado": pagado,
+            }
+            for (usuario_id, periodo), (cantidad, total, pagado) in acumulado.items()
+        ],
+    )
+    return len(acumulado)
+
+
+@click.command("reconstruir-saldos-comision")
+@with_appcontext
+def reconstruir_saldos_comision_command():
+    """Reconstruye desde cero la tabla saldos_comision_periodo."""
+    try:
+        filas = reconstruir_saldos_comision()
+        db.session.commit()
+        click.echo(f"Saldos de comisiones reconstruidos: {filas} filas.")
+    except Exception as e:
+        db.session.rollback()
+        logger.error(f"Error reconstruyendo saldos de comisiones: {e}")
+        raise click.ClickException(f"No se pudieron reconstruir los saldos: {e}")
@@ -0,0 +1,143 @@
+import logging
+from datetime import datetime
+
+from sqlalchemy.orm.util import identity_key
+
+from app import db
+from app.eventos import marcar_temas
+from app.gestores import asignado_id_sql
+from app.models import Venta, Usuario, TransferenciaVenta
+from app.paginacion import contar_si
+
+logger = logging.getLogger("app.transferencias_cartera")
+
+ROLES_DESTINO = ("vendedor", "cobrador")
+
+
+def consulta_cartera(origen_id=None, venta_ids=None, destino_id=None):
+    """
+    Créditos pendientes a transferir: los asignados a origen_id y/o los de la
+    lista venta_ids. Excluye los que ya están asignados al destino.
+    """
+    if origen_id is None and not venta_ids:
+        raise ValueError("Indique el usuario origen o las ventas a transferir")
+
+    asignado_id = asignado_id_sql()
+    query = Venta.query.filter(
+        Venta.tipo == "credito",
+        Venta.saldo_pendiente > 0,
+        Venta.estado == "pendiente",
+    )
+    if origen_id is not None:
+        query = query.filter(asignado_id == origen_id)
+    if venta_ids:
+        query = query.filter(Venta.id.in_(venta_ids))
+    if destino_id is not None:
+        query = query.filter(asignado_id != destino_id)
+    return query
+
+
+def previsualizar_transferencia(origen_id=None, venta_ids=None, destino_id=None):
+    """
+    Lo que movería la transferencia, sin modificar nada (dos consultas agregadas).
+    Retorna: {"cantidad", "saldo", "ya_transferidas", "por_usuario": [(nombre, cantidad, saldo)]}
+    """
+    query = consulta_cartera(origen_id, venta_ids, destino_id)
+    cantidad, saldo, ya_transferidas = query.with_entities(
+        db.func.count(Venta.id),
+        db.func.coalesce(db.func.sum(Venta.saldo_pendiente), 0),
+        contar_si(Venta.transferida == True),
+    ).one()
+
+    asignado_id = asignado_id_sql()
+    por_usuario = (
+        query.join(Usuario, Usuario.id == asignado_id)
+        .with_entities(
+            Usuario.nombre,
+            db.func.count(Venta.id),
+            db.func.sum(Venta.saldo_pendiente),
+        )
+        .group_by(Usuario.id, Usuario.nombre)
+        .order_by(Usuario.nombre)
+        .all()
+    )
+    return {
+        "cantidad": int(cantidad or 0),
+        "saldo": int(saldo or 0),
+        "ya_transferidas": int(ya_transferidas or 0),
+        "por_usuario": [(nombre, int(n), int(s or 0)) for nombre, n, s in por_usuario],
+    }
+
+
+def validar_destino(destino):
+    """Lanza ValueError si el usuario no puede recibir cartera"""
+    if destino is None:
+        raise ValueError("Usuario destino no encontrado")
+    if destino.rol not in ROLES_DESTINO or not destino.activo:
+        raise ValueError("El usuario destino debe ser un vendedor o cobrador activo")
+
+
+def transferir_cartera(destino, realizada_por_id, motivo=None, origen_id=None, venta_ids=None):
+    """
+    Transfiere la cartera al destino con escrituras por conjunto: un SELECT de
+    las ventas (bloqueadas con FOR UPDATE donde la base lo soporta), un UPDATE
+    de ventas y un INSERT múltiple de TransferenciaVenta. No hace commit.
+    Retorna: {"cantidad", "saldo"} de lo transferido.
+    """
+    validar_destino(destino)
+    asignado_id = asignado_id_sql()
+    filas = (
+        consulta_cartera(origen_id, venta_ids, destino.id)
+        .with_entities(Venta.id, asignado_id, Venta.saldo_pendiente)
+        .order_by(Venta.id)
+        .with_for_update(of=Venta)
+        .all()
+    )
+    if not filas:
+        return {"cantidad": 0, "saldo": 0}
+
+    ids = [venta_id for venta_id, _, _ in filas]
+    ahora = datetime.utcnow()
+
+    # Igual que la transferencia individual: el vendedor original se registra
+    # solo la primera vez que la venta se transfiere
+    Venta.query.filter(Venta.id.in_(ids)).update(
+        {
+            Venta.vendedor_original_id: db.case(
+                (Venta.transferida == True, Venta.vendedor_original_id),
+                else_=Venta.vendedor_id,
+            ),
+            Venta.transferida: True,
+            Venta.usuario_actual_id: destino.id,
+            Venta.fecha_transferencia: ahora,
+        },
+        synchronize_session=False,
+    )
+
+    db.session.execute(
+        db.insert(TransferenciaVenta),
+        [
+            {
+                "venta_id": venta_id,
+                "usuario_origen_id": origen,
+                "usuario_destino_id": destino.id,
+                "realizada_por_id": realizada_por_id,
+                "motivo": motivo,
+                "fecha": ahora,
+            }
+            for venta_id, origen, _ in filas
+        ],
+    )
+
+    # Las ventas ya cargadas en la sesión deben releer los campos actualizados
+    for venta_id in ids:
+        venta = db.session.identity_map.get(identity_key(Venta, venta_id))
+        if venta is not None:
+            db.session.expire(venta)
+
+    # Los UPDATE/INSERT directos no pasan por el flush
+    marcar_temas(db.session, "cobros", "respaldos")
+
+    saldo = sum(int(saldo or 0) for _, _, saldo in filas)
+    logger.info(f"Transferencia masiva de {len(ids)} ventas a {destino.nombre}")
+    return {"cantidad": len(ids), "saldo": saldo}
@@ -1,24 +1,32 @@
 import os
+import click
 from datetime import datetime, timedelta
 from io import BytesIO
 from PIL import Image
 from flask import current_app, url_for
+from flask.cli import with_appcontext
 from app import db
-from app.models import Configuracion, Comision, Venta, Abono, MovimientoCaja
+from app.models import Comision, Venta, Abono, MovimientoCaja
+from app.ajustes import obtener_ajustes
+from app.saldos_comision import rango_periodo, registrar_comision
 import logging
 import base64
 
 def format_currency(amount):
-    """Formatea un monto como moneda (sin decimales)"""
+    """
+    Formatea un monto como moneda (sin decimales). Registrado también como filtro
+    de Jinja: {{ monto|moneda }}
+    """
+    # Ruta rápida para enteros (casi todos los montos): sin Decimal ni consultas
+    if type(amount) is int:
+        return f"{obtener_ajustes().moneda} {amount:,}"
+    return _format_currency_general(amount, obtener_ajustes().moneda)
+
+
+def _format_currency_general(amount, moneda):
+    """Formato de format_currency para cualquier tipo (None, Decimal, float, texto)"""
     from decimal import Decimal, InvalidOperation
-    
-    # Obtener símbolo de moneda de la configuración
-    try:
-        config = Configuracion.query.first()
-        moneda = config.moneda if config else "$"
-    except Exception:
-        moneda = "$"
-        
+
     # Si amount es None o vacío, devolver cero formateado
     if amount is None:
         return f"{moneda} 0"
@@ -53,38 +61,38 @@ def calcular_comision(monto_pagado, usuario_id, venta_id=None, abono_id=None):
     """Calcula la comisión sobre un monto para un usuario según su rol"""
     from app.models import Usuario
     
-    config = Configuracion.query.first()
+    config = obtener_ajustes()
     usuario = Usuario.query.get(usuario_id)
     
-    if not config or not usuario:
+    if config.id is None or not usuario:
         current_app.logger.warning("No se pudo calcular la comisión: Configuración o usuario no encontrado.")
         return 0
 
-    porcentaje_comision = 0
     # Determinar porcentaje según el rol del usuario
-    if usuario.rol == 'vendedor':
-        porcentaje_comision = (config.porcentaje_comision_vendedor or 0)
-    elif usuario.rol == 'cobrador':
-        porcentaje_comision = (config.porcentaje_comision_cobrador or 0)
+    porcentaje_comision = config.porcentaje_comision(usuario.rol)
     
     if porcentaje_comision <= 0:
         return 0 # No se calculan comisiones si el porcentaje es cero o nulo
 
-    monto_comision = monto_pagado * (porcentaje_comision / 100)
+    # Montos enteros, como los guarda la columna (redondeo a la unidad más cercana)
+    monto_comision = (int(monto_pagado) * porcentaje_comision + 50) // 100
     periodo = config.periodo_comision
 
     # Registrar la comisión
     comision = Comision(
         usuario_id=usuario_id,
-        monto_base=monto_pagado,
+        monto_base=int(monto_pagado),
         porcentaje=porcentaje_comision,
         monto_comision=monto_comision,
         periodo=periodo,
+        fecha_generacion=datetime.utcnow(),
         venta_id=venta_id,
         abono_id=abono_id
     )
 
     db.session.add(comision)
+    # Acumular en el saldo del período (misma transacción)
+    registrar_comision(comision)
     # ELIMINADO: db.session.commit()
     # La función que llama a esta utilidad se encargará de hacer commit.
 
@@ -93,66 +101,24 @@ def calcular_comision(monto_pagado, usuario_id, venta_id=None, abono_id=None):
 
 
 def get_comisiones_periodo(usuario_id=None, fecha_inicio=None, fecha_fin=None):
-    """Obtiene las comisiones para un período determinado"""
-    try:
-        if not fecha_inicio:
-            try:
-                config = Configuracion.query.first()
-                periodo = config.periodo_comision if config else 'mensual'
-            except Exception:
-                periodo = 'mensual'
-
-            today = datetime.now()
-            if periodo == 'mensual':
-                fecha_inicio = datetime(today.year, today.month, 1)
-                if today.month == 12:
-                    fecha_fin = datetime(today.year + 1, 1, 1) - timedelta(days=1)
-                else:
-                    fecha_fin = datetime(today.year, today.month + 1, 1) - timedelta(days=1)
-            else:  # quincenal
-                if today.day <= 15:
-                    fecha_inicio = datetime(today.year, today.month, 1)
-                    fecha_fin = datetime(today.year, today.month, 15)
-                else:
-                    fecha_inicio = datetime(today.year, today.month, 16)
-                    if today.month == 12:
-                        fecha_fin = datetime(today.year + 1, 1, 1) - timedelta(days=1)
-                    else:
-                        fecha_fin = datetime(today.year, today.month + 1, 1) - timedelta(days=1)
-
-        # Crear nueva sesión para evitar problemas de transacciones abortadas
-        query = Comision.query.filter(
-            Comision.fecha_generacion >= fecha_inicio,
-            Comision.fecha_generacion <= fecha_fin
-        )
-
-        if usuario_id:
-            query = query.filter_by(usuario_id=usuario_id)
-
-        # Ejecutar la consulta con manejo de errores mejorado
-        try:
-            result = query.all()
-            return result
-        except Exception as db_error:
-            # Si hay error de transacción, hacer rollback y reintentar
-            db.session.rollback()
-            print(f"Error en consulta de comisiones, reintentando: {db_error}")
-            
-            # Reintentar con nueva consulta
-            query = Comision.query.filter(
-                Comision.fecha_generacion >= fecha_inicio,
-                Comision.fecha_generacion <= fecha_fin
-            )
-            if usuario_id:
-                query = query.filter_by(usuario_id=usuario_id)
-            
-            return query.all()
-            
-    except Exception as e:
-        print(f"Error en get_comisiones_periodo: {e}")
-        # Hacer rollback en caso de error
-        db.session.rollback()
-        return []
+    """
+    Obtiene las comisiones para un período determinado (por defecto el período
+    actual). Para los totales del período usar saldo_periodo, que no carga comisiones.
+    """
+    if not fecha_inicio:
+        fecha_inicio, fecha_fin = rango_periodo(obtener_ajustes().periodo_comision)
+        # Incluir todo el último día del período
+        fecha_fin = fecha_fin + timedelta(days=1) - timedelta(microseconds=1)
+
+    query = Comision.query.filter(
+        Comision.fecha_generacion >= fecha_inicio,
+        Comision.fecha_generacion <= fecha_fin
+    )
+
+    if usuario_id:
+        query = query.filter_by(usuario_id=usuario_id)
+
+    return query.all()
 
 
 def registrar_movimiento_caja(
@@ -165,77 +131,37 @@ def registrar_movimiento_caja(
     caja_destino_id=None
 ):
     """Registra un movimiento en caja y actualiza saldos"""
-    from app.models import Caja, MovimientoCaja
-    from app import db
-    from datetime import datetime
+    from app.esquema import esquema
+    from app.saldos_caja import registrar_movimiento, transferir, aplicar_delta_caja
     import logging
-    from sqlalchemy import inspect
 
     logging.info(
         f"Registrando movimiento en caja {caja_id}: {tipo} por ${monto} - {concepto}"
     )
 
     try:
-        caja = Caja.query.get(caja_id)
-        if not caja:
-            raise ValueError(f"Caja con ID {caja_id} no encontrada")
-
-        # Verificar si las columnas necesarias existen en la tabla
-        try:
-            inspector = inspect(db.engine)
-            columns = inspector.get_columns('movimiento_caja')
-            column_names = [col['name'] for col in columns]
-        except Exception:
-            # Si falla, asumimos que todas las columnas existen
-            column_names = [
-                'caja_id', 'tipo', 'monto', 'fecha', 'descripcion',
-                'venta_id', 'abono_id', 'caja_destino_id'
-            ]
-
-        # Crear el movimiento con los parámetros básicos
-        movimiento = MovimientoCaja(
-            caja_id=caja_id,
-            tipo=tipo,
-            monto=monto,
-            fecha=datetime.utcnow(),
-            descripcion=concepto
-        )
-
-        # Agregar campos adicionales solo si existen
-        if 'venta_id' in column_names and venta_id is not None:
-            movimiento.venta_id = venta_id
-        if 'abono_id' in column_names and abono_id is not None:
-            movimiento.abono_id = abono_id
-        if 'caja_destino_id' in column_names and caja_destino_id is not None:
-            movimiento.caja_destino_id = caja_destino_id
-
-        # Actualizar saldo de la caja
-        if tipo == 'entrada':
-            caja.saldo_actual += monto
-        elif tipo == 'salida':
-            caja.saldo_actual -= monto
-        elif tipo == 'transferencia' and caja_destino_id:
-            caja.saldo_actual -= monto
-            caja_destino = Caja.query.get(caja_destino_id)
-            if not caja_destino:
-                raise ValueError(
-                    f"Caja destino con ID {caja_destino_id} no encontrada"
+        # Los campos opcionales que no existan en el esquema (leído al iniciar la
+        # aplicación) se omiten al crear el movimiento
+        campos = {}
+        if venta_id is not None:
+            campos['venta_id'] = venta_id
+        if abono_id is not None:
+            campos['abono_id'] = abono_id
+
+        # El saldo se actualiza en la base de datos (saldo_actual + delta)
+        if tipo == 'transferencia' and caja_destino_id:
+            if esquema.tiene_columna('movimiento_caja', 'caja_destino_id'):
+                movimiento, _ = transferir(caja_id, caja_destino_id, monto, concepto)
+            else:
+                # Sin la columna el movimiento no guarda el destino (se omite al crearlo)
+                movimiento = registrar_movimiento(
+                    caja_id, tipo, monto, concepto, caja_destino_id=caja_destino_id, **campos
                 )
-            caja_destino.saldo_actual += monto
-
-            # Crear movimiento en la caja destino si la columna existe
-            if 'caja_destino_id' in column_names:
-                movimiento_destino = MovimientoCaja(
-                    caja_id=caja_destino_id,
-                    tipo='entrada',
-                    monto=monto,
-                    fecha=datetime.utcnow(),
-                    descripcion=f"Transferencia desde {caja.nombre}"
-                )
-                movimiento_destino.caja_destino_id = caja_id
-                db.session.add(movimiento_destino)
-
-        db.session.add(movimiento)
+                aplicar_delta_caja(caja_destino_id, monto)
+        else:
+            if caja_destino_id is not None:
+                campos['caja_destino_id'] = caja_destino_id
+            movimiento = registrar_movimiento(caja_id, tipo, monto, concepto, **campos)
         # ELIMINADO: db.session.commit()
 
         logging.info(f"Movimiento registrado exitosamente: ID {movimiento.id}")
@@ -381,4 +307,42 @@ def shorten_url(long_url):
         return long_url  # Devolver URL original si no está disponible requests
     except Exception as e:
         current_app.logger.error(f"Error en servicio de acortamiento de URL: {e}")
-        return long_url  # Devolver URL original en caso de cualquier error
\ No newline at end of file
+        return long_url  # Devolver URL original en caso de cualquier error
+
+@click.command("benchmark-moneda")
+@click.option("--llamadas", default=100000, help="Llamadas por variante")
+@with_appcontext
+def benchmark_moneda_command(llamadas):
+    """
+    Costo por llamada de format_currency: la versión anterior (consulta de la
+    configuración + Decimal) frente a la actual (moneda en caché, enteros directos).
+    """
+    import time
+    from app.models import Configuracion
+
+    llamadas = max(llamadas, 1)
+    montos = [0, 7, -1500, 25000, 1234567, 980000000]
+
+    def anterior(amount):
+        config = Configuracion.query.first()
+        return _format_currency_general(amount, config.moneda if config else "$")
+
+    # Mismo texto en ambas versiones, incluidos los tipos que no son enteros
+    muestras = montos + [None, 1500.0, 1500.5, "$ 1,500", "abc"]
+    iguales = all(anterior(m) == format_currency(m) for m in muestras)
+
+    def medir(funcion, repeticiones):
+        inicio = time.perf_counter()
+        for i in range(repeticiones):
+            funcion(montos[i % len(montos)])
+        return (time.perf_counter() - inicio) * 1_000_000 / repeticiones
+
+    # La versión anterior consulta la base en cada llamada: menos repeticiones
+    tiempo_anterior = medir(anterior, max(llamadas // 100, 1))
+    tiempo_actual = medir(format_currency, llamadas)
+    click.echo(
+        f"anterior: {tiempo_anterior:9.2f} µs/llamada | "
+        f"actual: {tiempo_actual:6.2f} µs/llamada | "
+        f"{tiempo_anterior / tiempo_actual:7.0f}x | "
+        f"resultados iguales: {'sí' if iguales else 'NO'}"
+    )
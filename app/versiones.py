@@ -0,0 +1,81 @@
+from sqlalchemy import event
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from app import db
+from app.models import VersionDatos
+
+CLAVE_VERSIONES_PENDIENTES = "versiones_pendientes"
+
+
+def leer_versiones(*claves):
+    """
+    Versión actual de cada contador compartido (0 si aún no existe), en el orden
+    pedido y en una sola consulta por clave primaria. Los cachés por proceso la
+    incluyen en su clave: si otro worker incrementó el contador, la entrada
+    guardada deja de coincidir y se recalcula.
+    """
+    filas = dict(
+        db.session.query(VersionDatos.clave, VersionDatos.version).filter(
+            VersionDatos.clave.in_(claves)
+        )
+    )
+    return tuple(filas.get(clave) or 0 for clave in claves)
+
+
+def leer_version(clave):
+    (version,) = leer_versiones(clave)
+    return version
+
+
+def incrementar_version(connection, clave):
+    """Incrementa el contador en la transacción de connection (lo crea en 1 si no existe)"""
+    actualizadas = connection.execute(
+        db.update(VersionDatos)
+        .where(VersionDatos.clave == clave)
+        .values(version=VersionDatos.version + 1)
+    ).rowcount
+    if actualizadas:
+        return
+    try:
+        with connection.begin_nested():
+            connection.execute(db.insert(VersionDatos).values(clave=clave, version=1))
+    except IntegrityError:
+        # Otro worker lo creó entre el UPDATE y el INSERT
+        connection.execute(
+            db.update(VersionDatos)
+            .where(VersionDatos.clave == clave)
+            .values(version=VersionDatos.version + 1)
+        )
+
+
+def marcar_versiones(session, *claves):
+    """Registra contadores a incrementar en el commit de la sesión"""
+    session.info.setdefault(CLAVE_VERSIONES_PENDIENTES, set()).update(claves)
+
+
+def _incrementar_antes_del_commit(session):
+    # Vaciar antes los cambios pendientes: sus eventos de flush marcan contadores
+    if session.new or session.dirty or session.deleted:
+        session.flush()
+    claves = session.info.pop(CLAVE_VERSIONES_PENDIENTES, None)
+    if not claves:
+        return
+    # En la misma transacción que los datos (los demás workers ven ambos a la vez)
+    # pero al final, en orden fijo: la fila del contador queda bloqueada solo
+    # mientras se confirma, no durante toda la transacción
+    connection = session.connection()
+    for clave in sorted(claves):
+        incrementar_version(connection, clave)
+
+
+def _descartar_tras_rollback(session):
+    session.info.pop(CLAVE_VERSIONES_PENDIENTES, None)
+
+
+def registrar_eventos_versiones():
+    """Conecta los contadores de versión compartidos a los eventos de sesión"""
+    if event.contains(Session, "before_commit", _incrementar_antes_del_commit):
+        return
+    event.listen(Session, "before_commit", _incrementar_antes_del_commit)
+    event.listen(Session, "after_rollback", _descartar_tras_rollback)
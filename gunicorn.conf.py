@@ -0,0 +1,14 @@
+# Configuración de gunicorn (railway.json: gunicorn -k gevent -c gunicorn.conf.py run:app)
+
+
+def post_fork(server, worker):
+    """
+    Con workers gevent, psycopg2 debe ceder el control mientras espera a la base
+    de datos: sin esto cada consulta bloquea todas las conexiones SSE del worker.
+    """
+    if worker.__class__.__module__ != "gunicorn.workers.ggevent":
+        return
+    from psycogreen.gevent import patch_psycopg
+
+    patch_psycopg()
+    server.log.info(f"psycopg2 cooperativo con gevent (worker {worker.pid})")
@@ -0,0 +1,65 @@
+import os
+import shutil
+import tempfile
+
+import pytest
+
+# La configuración lee DATABASE_URL al importarse: fijarla antes de importar la app.
+# Un archivo (no :memory:) para que los hilos de las pruebas compartan la base.
+DIRECTORIO_PRUEBAS = tempfile.mkdtemp(prefix="creditapp-pruebas-")
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(DIRECTORIO_PRUEBAS, 'pruebas.db')}"
+
+from app import create_app, db  # noqa: E402
+
+
+def _limpiar_caches():
+    from app.metricas import cache_dashboard
+    from app.clasificacion_cobros import cache_estadisticas
+    from app.eventos import cache_contadores
+    from app.catalogo import cache_catalogo
+
+    for cache in (cache_dashboard, cache_estadisticas, cache_contadores, cache_catalogo):
+        cache.limpiar()
+
+
+@pytest.fixture(scope="session")
+def app():
+    app = create_app()
+    app.config.update(TESTING=True, WTF_CSRF_ENABLED=False)
+    yield app
+    with app.app_context():
+        db.engine.dispose()
+    shutil.rmtree(DIRECTORIO_PRUEBAS, ignore_errors=True)
+
+
+@pytest.fixture
+def base_datos(app):
+    """Tablas vacías para cada prueba y cachés de proceso limpios"""
+    from app.busqueda_clientes import inicializar_busqueda_clientes
+    from app.esquema import esquema
+
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        esquema.refrescar()
+        # El índice FTS5 no está en los metadatos: vaciarlo con la tabla de clientes
+        inicializar_busqueda_clientes()
+        _limpiar_caches()
+        yield db
+        db.session.remove()
+
+
+@pytest.fixture
+def crear_usuario(base_datos):
+    from app.models import Usuario
+
+    def crear(nombre, rol):
+        usuario = Usuario(
+            nombre=nombre, email=f"{nombre.lower()}@pruebas.com", rol=rol, activo=True
+        )
+        usuario.set_password("clave123")
+        db.session.add(usuario)
+        db.session.flush()
+        return usuario
+
+    return crear
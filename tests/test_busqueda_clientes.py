@@ -0,0 +1,42 @@
+"""
+El listado de clientes con búsqueda se ordena por relevancia (luego por id) y el
+cursor recorre todas las coincidencias una sola vez.
+"""
+import re
+
+from app import db
+from app.models import Cliente
+
+
+def _ids_listado(cliente, url):
+    """ids de clientes de todas las páginas del listado, en orden"""
+    ids = []
+    while url:
+        html = cliente.get(url).get_data(as_text=True)
+        ids += [int(i) for i in re.findall(r'data-cliente-id="(\d+)"', html)]
+        siguiente = re.search(r'href="([^"]*dir=sig[^"]*)"', html)
+        url = siguiente.group(1).replace("&amp;", "&") if siguiente else None
+    return ids
+
+
+def test_listado_ordenado_por_relevancia(app, base_datos, crear_usuario):
+    crear_usuario("Admin", "administrador")
+    # Los primeros registrados son coincidencias más débiles (texto más largo)
+    clientes = [
+        Cliente(nombre=f"Pedro Antonio Martinez Rodriguez Garcia {i}", cedula=str(100 + i))
+        for i in range(5)
+    ] + [Cliente(nombre="Garcia", cedula="900"), Cliente(nombre="Luis Perez", cedula="901")]
+    db.session.add_all(clientes)
+    db.session.commit()
+    garcia = Cliente.query.filter_by(cedula="900").one().id
+
+    cliente = app.test_client()
+    cliente.post("/auth/login", data={"email": "admin@pruebas.com", "password": "clave123"})
+    ids = _ids_listado(cliente, "/clientes/?busqueda=garcia&por_pagina=2")
+
+    assert ids[0] == garcia
+    assert sorted(ids) == sorted(c.id for c in clientes if "Garcia" in c.nombre)
+    assert len(ids) == len(set(ids))
+
+    # Sin búsqueda el listado sigue en orden de registro
+    assert _ids_listado(cliente, "/clientes/?por_pagina=3") == sorted(c.id for c in clientes)
@@ -0,0 +1,96 @@
+"""
+Los cachés por proceso se invalidan también cuando el cambio lo confirma otro
+worker: cada commit incrementa contadores compartidos (versiones_datos) que
+forman parte de la clave de caché.
+"""
+from datetime import datetime
+import re
+
+from app import db
+from app.catalogo import catalogo_productos
+from app.clasificacion_cobros import estadisticas_cobros_cacheadas
+from app.models import Cliente, Producto, Venta
+from app.versiones import incrementar_version, leer_version
+
+
+def _otro_worker(sentencia, *claves):
+    """Escritura confirmada por otro proceso: sus eventos de sesión no corren aquí"""
+    with db.engine.begin() as connection:
+        connection.exec_driver_sql(sentencia)
+        for clave in claves:
+            incrementar_version(connection, clave)
+
+
+def _valores(html):
+    return re.findall(r'class="card-value">([^<]*)<', html)
+
+
+def test_commit_incrementa_las_versiones_del_dashboard(base_datos, crear_usuario):
+    crear_usuario("Admin", "administrador")
+    db.session.commit()
+    antes = leer_version("dashboard:rol:administrador")
+
+    db.session.add(Cliente(nombre="Cliente", cedula="1"))
+    db.session.commit()
+    assert leer_version("dashboard:rol:administrador") == antes + 1
+
+    db.session.add(Cliente(nombre="Otro", cedula="2"))
+    db.session.rollback()
+    assert leer_version("dashboard:rol:administrador") == antes + 1
+
+
+def test_dashboard_ve_cambios_de_otro_worker(app, base_datos, crear_usuario):
+    crear_usuario("Admin", "administrador")
+    db.session.commit()
+    cliente = app.test_client()
+    cliente.post("/auth/login", data={"email": "admin@pruebas.com", "password": "clave123"})
+
+    assert _valores(cliente.get("/").get_data(as_text=True))[0] == "0"
+
+    # Sin incrementar la versión, este proceso sigue sirviendo su caché
+    _otro_worker("INSERT INTO clientes (nombre, cedula) VALUES ('A', '10')")
+    assert _valores(cliente.get("/").get_data(as_text=True))[0] == "0"
+
+    _otro_worker(
+        "INSERT INTO clientes (nombre, cedula) VALUES ('B', '11')",
+        "dashboard:rol:administrador",
+    )
+    assert _valores(cliente.get("/").get_data(as_text=True))[0] == "2"
+
+
+def test_estadisticas_de_cobros_ven_cambios_de_otro_worker(base_datos, crear_usuario):
+    vendedor = crear_usuario("Vendedor", "vendedor")
+    cliente = Cliente(nombre="Cliente", cedula="1")
+    db.session.add(cliente)
+    db.session.flush()
+    db.session.add(
+        Venta(
+            cliente_id=cliente.id, vendedor_id=vendedor.id, total=90_000, tipo="credito",
+            saldo_pendiente=90_000, estado="pendiente", fecha=datetime.now(),
+        )
+    )
+    db.session.commit()
+
+    estadisticas, etag = estadisticas_cobros_cacheadas()
+    assert estadisticas["proximos"] == 1
+
+    _otro_worker("UPDATE ventas SET saldo_pendiente = 0, estado = 'pagado'")
+    assert estadisticas_cobros_cacheadas() == (estadisticas, etag)
+
+    _otro_worker("UPDATE ventas SET fecha = fecha", "cobros")
+    nuevas, nuevo_etag = estadisticas_cobros_cacheadas()
+    assert nuevas["proximos"] == 0
+    assert nuevo_etag != etag
+
+
+def test_catalogo_ve_el_stock_de_otro_worker(base_datos):
+    db.session.add(Producto(codigo="P1", nombre="Producto", precio_venta=10_000, stock=5))
+    db.session.commit()
+
+    version, contenido = catalogo_productos()
+    assert b'"stock":5' in contenido
+
+    _otro_worker("UPDATE productos SET stock = 3", "catalogo")
+    nueva_version, contenido = catalogo_productos()
+    assert b'"stock":3' in contenido
+    assert nueva_version != version
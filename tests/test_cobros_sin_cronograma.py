@@ -0,0 +1,103 @@
+"""
+Los créditos pendientes sin cuota pendiente en cuotas_venta (sin cronograma, o
+con todas las cuotas pagadas y saldo pendiente) siguen apareciendo en cobros y
+en sus estadísticas, con la misma cuota que calcula el ciclo por venta.
+"""
+from datetime import date, datetime, timedelta
+
+import pytest
+
+from app import db
+from app.clasificacion_cobros import clasificar_cobros_lote, estadisticas_cobros
+from app.cobros import clasificar_ventas_iterativo
+from app.cronograma import generar_cronograma
+from app.models import Abono, Caja, Cliente, Venta
+
+HOY = date.today()
+
+
+def _resumen(grupos):
+    """{venta_id: (estado, numero, total_cuotas, monto, vencimiento)} de las listas de cobro"""
+    return {
+        cobro["venta"].id: (
+            estado,
+            cobro["numero_cuota"],
+            cobro["total_cuotas"],
+            int(cobro["monto_cuota"]),
+            cobro["fecha_vencimiento"],
+        )
+        for estado, cobros in zip(("hoy", "vencido", "proximo"), grupos)
+        for cobro in cobros
+    }
+
+
+@pytest.fixture
+def ventas(base_datos, crear_usuario):
+    vendedor = crear_usuario("Vendedor", "vendedor")
+    caja = Caja(nombre="Efectivo", tipo="efectivo", saldo_inicial=0, saldo_actual=0)
+    cliente = Cliente(nombre="Cliente", cedula="1", telefono="3000000000")
+    db.session.add_all([caja, cliente])
+    db.session.flush()
+
+    def credito(total, dias_atras, abonado=0, cronograma=False):
+        fecha = None if dias_atras is None else datetime.combine(
+            HOY - timedelta(days=dias_atras), datetime.min.time()
+        )
+        venta = Venta(
+            cliente_id=cliente.id, vendedor_id=vendedor.id, total=total, tipo="credito",
+            saldo_pendiente=total - abonado, estado="pendiente",
+        )
+        db.session.add(venta)
+        db.session.flush()
+        venta.fecha = fecha
+        if abonado:
+            db.session.add(
+                Abono(venta_id=venta.id, monto=abonado, cobrador_id=vendedor.id, caja_id=caja.id)
+            )
+        if cronograma:
+            generar_cronograma(venta, 4, "quincenal")
+        return venta
+
+    creados = {
+        "con_cronograma": credito(400_000, 20, abonado=100_000, cronograma=True),
+        "sin_cronograma_hoy": credito(90_000, 30),
+        "sin_cronograma_con_abono": credito(100_000, 70, abonado=60_000),
+        "sin_cronograma_sin_fecha": credito(50_000, None),
+        "cuotas_pagadas_con_saldo": credito(200_000, 10, cronograma=True),
+    }
+    # Cronograma inconsistente: todas las cuotas pagadas pero la venta con saldo
+    for cuota in creados["cuotas_pagadas_con_saldo"].cuotas:
+        cuota.monto_pagado, cuota.pagada = cuota.monto, True
+    db.session.commit()
+    return {clave: venta.id for clave, venta in creados.items()}
+
+
+def test_creditos_sin_cuota_pendiente_aparecen(ventas):
+    lote = _resumen(clasificar_cobros_lote(None, HOY))
+    assert set(lote) == set(ventas.values())
+
+    # 90.000 sin abonos: una cuota del saldo, 30 días después de la venta
+    assert lote[ventas["sin_cronograma_hoy"]] == ("hoy", 1, 1, 90_000, HOY)
+    # Con abonos: 2 cuotas de 50.000; la primera ya cubierta
+    assert lote[ventas["sin_cronograma_con_abono"]] == (
+        "vencido", 2, 2, 50_000, HOY - timedelta(days=10)
+    )
+    assert lote[ventas["sin_cronograma_sin_fecha"]][0] == "hoy"
+
+
+def test_lote_igual_al_ciclo_por_venta(ventas):
+    iterativo = clasificar_ventas_iterativo(
+        Venta.query.filter(Venta.tipo == "credito").all(), HOY
+    )
+    assert _resumen(clasificar_cobros_lote(None, HOY)) == _resumen(iterativo)
+
+
+def test_estadisticas_incluyen_creditos_sin_cronograma(ventas):
+    para_hoy, vencidos, proximos = clasificar_cobros_lote(None, HOY)
+    esperado = {}
+    for prefijo, cobros in (("para_hoy", para_hoy), ("vencidos", vencidos), ("proximos", proximos)):
+        esperado[prefijo] = len(cobros)
+        esperado[f"monto_{prefijo}"] = sum(int(c["monto_cuota"]) for c in cobros)
+
+    assert estadisticas_cobros(None, HOY) == esperado
+    assert sum(esperado[p] for p in ("para_hoy", "vencidos", "proximos")) == len(ventas)
@@ -0,0 +1,101 @@
+"""
+Ventas simultáneas sobre el mismo stock: descontar_stock nunca deja stock
+negativo y lo vendido más lo que queda suma el stock inicial.
+"""
+import threading
+
+import pytest
+
+from app import db
+from app.inventario import bloquear_productos, descontar_stock
+from app.models import Producto
+
+HILOS = 24
+
+
+def _vender_en_paralelo(app, carritos):
+    """Ejecuta cada carrito en su propio hilo y sesión. Retorna los carritos vendidos"""
+    barrera = threading.Barrier(len(carritos))
+    vendidos = []
+    errores = []
+    lock = threading.Lock()
+
+    def vender(carrito):
+        with app.app_context():
+            try:
+                barrera.wait()
+                bloquear_productos(list(carrito))
+                if descontar_stock(carrito):
+                    db.session.rollback()
+                else:
+                    db.session.commit()
+                    with lock:
+                        vendidos.append(carrito)
+            except Exception as e:  # pragma: no cover - se reporta en el assert
+                db.session.rollback()
+                with lock:
+                    errores.append(e)
+            finally:
+                db.session.remove()
+
+    hilos = [threading.Thread(target=vender, args=(carrito,)) for carrito in carritos]
+    for hilo in hilos:
+        hilo.start()
+    for hilo in hilos:
+        hilo.join()
+
+    assert errores == []
+    return vendidos
+
+
+def _crear_productos(*stocks):
+    productos = [
+        Producto(codigo=f"P{i}", nombre=f"Producto {i}", precio_venta=10_000, stock=stock)
+        for i, stock in enumerate(stocks)
+    ]
+    db.session.add_all(productos)
+    db.session.commit()
+    return [producto.id for producto in productos]
+
+
+def _stocks(producto_ids):
+    db.session.expire_all()
+    return [db.session.get(Producto, producto_id).stock for producto_id in producto_ids]
+
+
+def test_mismo_producto_no_queda_negativo(app, base_datos):
+    (producto_id,) = _crear_productos(30)
+
+    # 24 ventas de 2 unidades sobre 30: solo 15 pueden completarse
+    vendidos = _vender_en_paralelo(app, [{producto_id: 2} for _ in range(HILOS)])
+
+    assert len(vendidos) == 15
+    assert _stocks([producto_id]) == [0]
+
+
+@pytest.mark.parametrize("stock_inicial", [(10, 50), (37, 41)])
+def test_carritos_cruzados_conservan_el_total(app, base_datos, stock_inicial):
+    producto_ids = _crear_productos(*stock_inicial)
+    a, b = producto_ids
+
+    # Carritos con los productos en órdenes distintos y cantidades variadas
+    carritos = [
+        {a: 1 + i % 3, b: 2} if i % 2 else {b: 1 + i % 4, a: 1} for i in range(HILOS)
+    ]
+    vendidos = _vender_en_paralelo(app, carritos)
+
+    finales = _stocks(producto_ids)
+    assert all(stock >= 0 for stock in finales)
+    for producto_id, inicial, final in zip(producto_ids, stock_inicial, finales):
+        assert final == inicial - sum(carrito[producto_id] for carrito in vendidos)
+    # Un carrito rechazado no descuenta ninguno de sus productos
+    assert len(vendidos) < HILOS
+
+
+def test_sin_stock_no_descuenta_nada(base_datos):
+    a, b = _crear_productos(5, 1)
+
+    assert descontar_stock({a: 2, b: 3}) == [b]
+    db.session.rollback()
+
+    assert _stocks([a, b]) == [5, 1]
@@ -0,0 +1,30 @@
+"""
+Marcar una comisión como pagada: la segunda vez no hay nada que liquidar y la
+respuesta lo informa en lugar de reportar éxito.
+"""
+from app import db
+from app.models import Comision, LiquidacionComision
+
+
+def test_marcar_pagado_dos_veces(app, base_datos, crear_usuario):
+    crear_usuario("Admin", "administrador")
+    vendedor = crear_usuario("Vendedor", "vendedor")
+    comision = Comision(
+        usuario_id=vendedor.id, monto_base=100_000, porcentaje=5,
+        monto_comision=5_000, periodo="2026-10",
+    )
+    db.session.add(comision)
+    db.session.commit()
+
+    cliente = app.test_client()
+    cliente.post("/auth/login", data={"email": "admin@pruebas.com", "password": "clave123"})
+    url = f"/reportes/comisiones/{comision.id}/marcar-pagado"
+
+    assert cliente.post(url).get_json() == {"success": True}
+    respuesta = cliente.post(url).get_json()
+    assert respuesta["success"] is False
+    assert "ya estaba pagada" in respuesta["error"]
+
+    assert LiquidacionComision.query.count() == 1
+    db.session.expire_all()
+    assert db.session.get(Comision, comision.id).pagado
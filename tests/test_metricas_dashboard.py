@@ -0,0 +1,180 @@
+"""
+Los indicadores del dashboard calculados con agregados SQL (y el resumen diario)
+deben coincidir con la agregación en Python que hacía antes el controlador.
+"""
+import random
+from datetime import datetime, timedelta
+
+import pytest
+
+from app import db
+from app.metricas import (
+    metricas_creditos,
+    metricas_productos,
+    obtener_metricas_dashboard,
+    total_cajas,
+)
+from app.models import Abono, Caja, Cliente, Producto, Venta
+from app.resumen import resumir_abono, resumir_venta
+
+AHORA = datetime(2024, 5, 20, 15, 30)
+
+
+def _metricas_python(usuario, ahora=AHORA):
+    """Agregación original del controlador del dashboard (objetos cargados en Python)"""
+    primer_dia_mes = datetime(ahora.year, ahora.month, 1)
+    es_admin, es_vendedor, es_cobrador = (
+        usuario.is_admin(), usuario.is_vendedor(), usuario.is_cobrador()
+    )
+    ventas = Venta.query.all()
+    if es_vendedor:
+        ventas = [v for v in ventas if v.vendedor_id == usuario.id]
+
+    if es_admin:
+        total_clientes = Cliente.query.count()
+    elif es_vendedor:
+        total_clientes = len({v.cliente_id for v in ventas})
+    else:
+        total_clientes = len(
+            {v.cliente_id for v in ventas if v.tipo == "credito" and (v.saldo_pendiente or 0) > 0}
+        )
+
+    metricas = dict.fromkeys(
+        [
+            "total_productos", "productos_agotados", "productos_stock_bajo",
+            "ventas_mes", "total_ventas_mes", "abonos_mes", "total_abonos_mes",
+            "total_cajas",
+        ],
+        0,
+    )
+    metricas["total_clientes"] = total_clientes
+
+    if es_vendedor or es_admin:
+        productos = Producto.query.all()
+        metricas["total_productos"] = len(productos)
+        metricas["productos_agotados"] = len([p for p in productos if p.stock <= 0])
+        metricas["productos_stock_bajo"] = len(
+            [p for p in productos if 0 < p.stock <= p.stock_minimo]
+        )
+        ventas_mes = [v for v in ventas if v.fecha and v.fecha >= primer_dia_mes]
+        metricas["ventas_mes"] = len(ventas_mes)
+        metricas["total_ventas_mes"] = sum(v.total for v in ventas_mes)
+
+    creditos = [v for v in ventas if v.tipo == "credito" and (v.saldo_pendiente or 0) > 0]
+    metricas["creditos_activos"] = len(creditos)
+    metricas["total_creditos"] = sum(v.saldo_pendiente for v in creditos)
+
+    if es_cobrador or es_admin:
+        abonos = [a for a in Abono.query.all() if a.fecha >= primer_dia_mes]
+        if es_cobrador:
+            abonos = [a for a in abonos if a.cobrador_id == usuario.id]
+        metricas["abonos_mes"] = len(abonos)
+        metricas["total_abonos_mes"] = sum(a.monto for a in abonos)
+
+    if es_admin:
+        metricas["total_cajas"] = sum(c.saldo_actual for c in Caja.query.all())
+
+    return metricas
+
+
+@pytest.fixture
+def datos(base_datos, crear_usuario):
+    """Cartera aleatoria repartida entre abril y mayo, con bordes de mes"""
+    aleatorio = random.Random(7)
+    usuarios = {
+        "admin": crear_usuario("Admin", "administrador"),
+        "vendedor_1": crear_usuario("Vendedor1", "vendedor"),
+        "vendedor_2": crear_usuario("Vendedor2", "vendedor"),
+        "cobrador": crear_usuario("Cobrador", "cobrador"),
+    }
+    vendedores = [usuarios["vendedor_1"], usuarios["vendedor_2"]]
+
+    cajas = [
+        Caja(nombre="Efectivo", tipo="efectivo", saldo_inicial=0, saldo_actual=125_000),
+        Caja(nombre="Nequi", tipo="nequi", saldo_inicial=0, saldo_actual=-3_000),
+    ]
+    clientes = [
+        Cliente(nombre=f"Cliente {i}", cedula=str(5000 + i), telefono="3000000000")
+        for i in range(25)
+    ]
+    productos = [
+        Producto(
+            codigo=f"P{i}", nombre=f"Producto {i}", precio_venta=10_000,
+            stock=stock, stock_minimo=minimo,
+        )
+        for i, (stock, minimo) in enumerate(
+            [(0, 5), (-2, 0), (5, 5), (3, 5), (6, 5), (100, 10), (1, 0), (0, 0)]
+        )
+    ]
+    db.session.add_all(cajas + clientes + productos)
+    db.session.flush()
+
+    bordes = [datetime(2024, 5, 1), datetime(2024, 4, 30, 23, 59, 59), AHORA]
+    for i in range(120):
+        tipo = aleatorio.choice(["contado", "credito", "credito"])
+        total = aleatorio.randint(1, 30) * 10_000
+        fecha = bordes[i] if i < len(bordes) else AHORA - timedelta(
+            days=aleatorio.randint(0, 45), hours=aleatorio.randint(0, 23)
+        )
+        venta = Venta(
+            cliente_id=aleatorio.choice(clientes[:20]).id,
+            vendedor_id=aleatorio.choice(vendedores).id,
+            total=total,
+            tipo=tipo,
+            saldo_pendiente=total if tipo == "credito" else 0,
+            estado="pendiente" if tipo == "credito" else "pagado",
+            fecha=fecha,
+        )
+        db.session.add(venta)
+        db.session.flush()
+        resumir_venta(venta)
+
+        if tipo == "credito" and aleatorio.random() < 0.6:
+            for dia in range(aleatorio.randint(1, 3)):
+                monto = min(venta.saldo_pendiente, aleatorio.randint(1, 8) * 10_000)
+                abono = Abono(
+                    venta_id=venta.id,
+                    monto=monto,
+                    cobrador_id=aleatorio.choice([usuarios["cobrador"].id, usuarios["admin"].id]),
+                    caja_id=aleatorio.choice(cajas).id,
+                    fecha=fecha + timedelta(days=dia + 1),
+                )
+                db.session.add(abono)
+                db.session.flush()
+                resumir_abono(abono)
+                venta.saldo_pendiente -= monto
+                if venta.saldo_pendiente <= 0:
+                    venta.estado = "pagado"
+                    break
+
+    db.session.commit()
+    return usuarios
+
+
+@pytest.mark.parametrize("clave", ["admin", "vendedor_1", "vendedor_2", "cobrador"])
+def test_metricas_sql_igual_a_agregacion_python(datos, clave):
+    usuario = datos[clave]
+    assert obtener_metricas_dashboard(usuario, ahora=AHORA) == _metricas_python(usuario)
+
+
+def test_agregados_por_separado(datos):
+    creditos = [
+        v for v in Venta.query.all() if v.tipo == "credito" and (v.saldo_pendiente or 0) > 0
+    ]
+    assert metricas_creditos() == (len(creditos), sum(v.saldo_pendiente for v in creditos))
+
+    vendedor = datos["vendedor_1"]
+    propios = [v for v in creditos if v.vendedor_id == vendedor.id]
+    assert metricas_creditos(vendedor.id) == (
+        len(propios), sum(v.saldo_pendiente for v in propios)
+    )
+
+    # Sin stock: 0, -2, 0. Stock bajo (0 < stock <= mínimo): (5, 5), (3, 5)
+    assert metricas_productos() == (8, 3, 2)
+    assert total_cajas() == 122_000
+
+
+def test_base_vacia(base_datos, crear_usuario):
+    admin = crear_usuario("Admin", "administrador")
+    db.session.commit()
+    assert obtener_metricas_dashboard(admin, ahora=AHORA) == _metricas_python(admin)
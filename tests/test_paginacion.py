@@ -0,0 +1,104 @@
+"""
+Paginación por cursor: recorre todas las filas (también las de fecha nula) en
+orden, hacia adelante y hacia atrás, y cada página la sirve el índice (fecha, id).
+"""
+from datetime import datetime, timedelta
+
+import pytest
+
+from app import db
+from app.models import Cliente, Venta
+from app.paginacion import paginar_keyset
+
+
+def _pagina(app, query, columnas, cursor=None, direccion="sig", **kwargs):
+    argumentos = {"por_pagina": 4}
+    if cursor:
+        argumentos.update(cursor=cursor, dir=direccion)
+    with app.test_request_context("/", query_string=argumentos):
+        return paginar_keyset(query, columnas, **kwargs)
+
+
+def _recorrer(app, query, columnas, **kwargs):
+    """Retorna (ids hacia adelante por página, ids hacia atrás por página)"""
+    adelante = []
+    pagina = _pagina(app, query, columnas, **kwargs)
+    adelante.append([fila.id for fila in pagina.items])
+    while pagina.hay_siguiente:
+        pagina = _pagina(app, query, columnas, pagina.cursor_siguiente, **kwargs)
+        adelante.append([fila.id for fila in pagina.items])
+
+    atras = [adelante[-1]]
+    while pagina.hay_anterior:
+        pagina = _pagina(app, query, columnas, pagina.cursor_anterior, "ant", **kwargs)
+        atras.append([fila.id for fila in pagina.items])
+    return adelante, atras[::-1]
+
+
+@pytest.fixture
+def ventas(base_datos, crear_usuario):
+    vendedor = crear_usuario("Vendedor", "vendedor")
+    cliente = Cliente(nombre="Cliente", cedula="1")
+    db.session.add(cliente)
+    db.session.flush()
+
+    inicio = datetime(2024, 5, 1)
+    # Fechas repetidas (desempate por id) y 5 ventas sin fecha
+    fechas = [inicio + timedelta(days=i // 3) for i in range(13)] + [None] * 5
+    for fecha in fechas:
+        venta = Venta(
+            cliente_id=cliente.id, vendedor_id=vendedor.id, total=1000,
+            tipo="contado", saldo_pendiente=0, estado="pagado",
+        )
+        db.session.add(venta)
+        db.session.flush()
+        # El default de la columna llenaría la fecha nula
+        venta.fecha = fecha
+    db.session.commit()
+    return Venta.query.all()
+
+
+def test_recorre_todo_con_fechas_nulas_al_final(app, ventas):
+    adelante, atras = _recorrer(app, Venta.query, [Venta.fecha, Venta.id])
+
+    con_fecha = sorted(
+        (v for v in ventas if v.fecha is not None), key=lambda v: (v.fecha, v.id), reverse=True
+    )
+    sin_fecha = sorted((v.id for v in ventas if v.fecha is None), reverse=True)
+    assert [i for pagina in adelante for i in pagina] == [v.id for v in con_fecha] + sin_fecha
+    assert all(len(pagina) == 4 for pagina in adelante[:-1])
+    assert atras == adelante
+
+
+def test_orden_ascendente(app, ventas):
+    adelante, atras = _recorrer(app, Cliente.query, [Cliente.id], descendente=False)
+    assert adelante == [[Cliente.query.one().id]]
+
+    adelante, atras = _recorrer(app, Venta.query, [Venta.id], descendente=False)
+    assert [i for pagina in adelante for i in pagina] == sorted(v.id for v in ventas)
+    assert atras == adelante
+
+
+def test_pagina_usa_el_indice_fecha_id(app, ventas):
+    consultas = []
+
+    def registrar(conn, cursor, sentencia, parametros, contexto, varias):
+        if sentencia.lstrip().upper().startswith("SELECT"):
+            consultas.append((sentencia, parametros))
+
+    pagina = _pagina(app, Venta.query, [Venta.fecha, Venta.id])
+    db.event.listen(db.engine, "before_cursor_execute", registrar)
+    try:
+        _pagina(app, Venta.query, [Venta.fecha, Venta.id], pagina.cursor_siguiente)
+    finally:
+        db.event.remove(db.engine, "before_cursor_execute", registrar)
+
+    sentencia, parametros = consultas[0]
+    plan = " ".join(
+        str(fila[-1])
+        for fila in db.session.connection().exec_driver_sql(
+            f"EXPLAIN QUERY PLAN {sentencia}", parametros
+        )
+    )
+    assert "ix_ventas_fecha_id" in plan
+    assert "TEMP B-TREE" not in plan
@@ -0,0 +1,137 @@
+"""
+Movimientos y transferencias simultáneas entre cajas: el saldo_actual final de
+cada caja es su saldo inicial más el efecto de sus movimientos registrados.
+"""
+import random
+import threading
+
+from app import db
+from app.models import Caja, MovimientoCaja
+from app.saldos_caja import (
+    SaldoInsuficiente,
+    aplicar_delta_caja,
+    efecto_en_saldo,
+    registrar_movimiento,
+    transferir,
+)
+
+HILOS = 8
+OPERACIONES_POR_HILO = 25
+SALDO_INICIAL = 50_000
+
+
+def _crear_cajas(cantidad):
+    cajas = [
+        Caja(
+            nombre=f"Caja {i}", tipo="efectivo",
+            saldo_inicial=SALDO_INICIAL, saldo_actual=SALDO_INICIAL,
+        )
+        for i in range(cantidad)
+    ]
+    db.session.add_all(cajas)
+    db.session.commit()
+    return [caja.id for caja in cajas]
+
+
+def _en_paralelo(app, trabajo):
+    """Ejecuta trabajo(numero_hilo) en HILOS hilos con su propia sesión"""
+    barrera = threading.Barrier(HILOS)
+    errores = []
+
+    def ejecutar(numero):
+        with app.app_context():
+            try:
+                barrera.wait()
+                trabajo(numero)
+            except Exception as e:  # pragma: no cover - se reporta en el assert
+                errores.append(e)
+            finally:
+                db.session.remove()
+
+    hilos = [threading.Thread(target=ejecutar, args=(i,)) for i in range(HILOS)]
+    for hilo in hilos:
+        hilo.start()
+    for hilo in hilos:
+        hilo.join()
+    assert errores == []
+
+
+def _saldo_segun_movimientos(caja_id):
+    movimientos = MovimientoCaja.query.filter_by(caja_id=caja_id).all()
+    return SALDO_INICIAL + sum(
+        efecto_en_saldo(m.tipo, m.monto, m.caja_destino_id) for m in movimientos
+    )
+
+
+def test_movimientos_y_transferencias_simultaneos(app, base_datos):
+    caja_ids = _crear_cajas(3)
+    rechazados = []
+
+    def trabajo(numero):
+        aleatorio = random.Random(numero)
+        for _ in range(OPERACIONES_POR_HILO):
+            origen, destino = aleatorio.sample(caja_ids, 2)
+            monto = aleatorio.randint(1, 40) * 1_000
+            operacion = aleatorio.choice(["entrada", "salida", "transferencia"])
+            try:
+                if operacion == "transferencia":
+                    transferir(origen, destino, monto, "Prueba", exigir_saldo=True)
+                else:
+                    registrar_movimiento(
+                        origen, operacion, monto, "Prueba",
+                        exigir_saldo=operacion == "salida",
+                    )
+                db.session.commit()
+            except SaldoInsuficiente:
+                db.session.rollback()
+                rechazados.append(operacion)
+
+    _en_paralelo(app, trabajo)
+
+    db.session.expire_all()
+    movimientos = MovimientoCaja.query.count()
+    assert movimientos > 0
+    for caja_id in caja_ids:
+        saldo = db.session.get(Caja, caja_id).saldo_actual
+        assert saldo >= 0
+        assert saldo == _saldo_segun_movimientos(caja_id)
+
+    # Las transferencias no crean ni destruyen dinero
+    entradas = db.session.query(db.func.coalesce(db.func.sum(MovimientoCaja.monto), 0)).filter(
+        MovimientoCaja.tipo == "entrada", MovimientoCaja.caja_destino_id.is_(None)
+    ).scalar()
+    salidas = db.session.query(db.func.coalesce(db.func.sum(MovimientoCaja.monto), 0)).filter(
+        MovimientoCaja.tipo == "salida"
+    ).scalar()
+    total = db.session.query(db.func.sum(Caja.saldo_actual)).scalar()
+    assert total == 3 * SALDO_INICIAL + entradas - salidas
+
+
+def test_deltas_simultaneos_sobre_una_caja(app, base_datos):
+    (caja_id,) = _crear_cajas(1)
+    deltas = [
+        [random.Random(numero * 100 + i).randint(-5, 10) * 100 for i in range(OPERACIONES_POR_HILO)]
+        for numero in range(HILOS)
+    ]
+
+    def trabajo(numero):
+        for delta in deltas[numero]:
+            aplicar_delta_caja(caja_id, delta)
+            db.session.commit()
+
+    _en_paralelo(app, trabajo)
+
+    db.session.expire_all()
+    assert db.session.get(Caja, caja_id).saldo_actual == SALDO_INICIAL + sum(map(sum, deltas))
+
+
+def test_transferencia_sin_destino_no_mueve_el_saldo(base_datos):
+    (caja_id,) = _crear_cajas(1)
+
+    assert efecto_en_saldo("transferencia", 1_000) == 0
+    assert efecto_en_saldo("transferencia", 1_000, caja_destino_id=2) == -1_000
+    registrar_movimiento(caja_id, "transferencia", 1_000, "Sin destino")
+    db.session.commit()
+
+    db.session.expire_all()
+    assert db.session.get(Caja, caja_id).saldo_actual == SALDO_INICIAL